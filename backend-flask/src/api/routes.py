@@ -11,12 +11,15 @@ import os
 # Aggiungi path per importare moduli
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from api.services import wallet_service
+from api.services import wallet_service, MAX_ADDRESS_TRANSACTIONS
 from api.middleware import (
     validate_txid, validate_address, validate_block_hash,
     log_api_request, log_api_response, validate_api_key
 )
 from models.responses import create_success_response, create_error_response
+from fetch_txs import module
+from fingerprinting import get_profile
+from http_pool import http
 from utils.logger import setup_logger
 
 logger = setup_logger()
@@ -128,7 +131,7 @@ def analyze_address():
         
         # Limite transazioni (opzionale)
         limit = data.get('limit', 20)
-        if not isinstance(limit, int) or limit < 1 or limit > 100:
+        if not isinstance(limit, int) or limit < 1 or limit > MAX_ADDRESS_TRANSACTIONS:
             limit = 20
         
         # Analizza indirizzo
@@ -139,7 +142,7 @@ def analyze_address():
         response_data = {
             'address': analysis.address,
             'total_transactions': analysis.total_transactions,
-            'analyzed_transactions': limit,
+            'analyzed_transactions': analysis.analyzed_transactions,
             'wallet_distribution': analysis.wallet_distribution,
             'wallet_percentages': analysis.wallet_percentages,
             'timeline': analysis.timeline,
@@ -299,7 +302,10 @@ def api_status():
                 '/api/analyze/block',
                 '/api/docs',
                 '/api/status'
-            ]
+            ],
+            'http_pools': http.stats(),
+            'backends': module.status(),
+            'heuristics': get_profile().summary() if get_profile() else None
         },
         message="API in esecuzione"
     ))
@@ -18,7 +18,7 @@ from api.docs_config import (
     fingerprint_model, analyze_request_model, analyze_response_model,
     response_headers
 )
-from api.services import wallet_service
+from api.services import wallet_service, MAX_ADDRESS_TRANSACTIONS
 from api.middleware import (
     validate_txid, validate_address, validate_block_hash,
     log_api_request, log_api_response
@@ -185,7 +185,7 @@ class AddressAnalysis(Resource):
                 ), 400
             
             # Parametri opzionali
-            limit = min(max(data.get('limit', 20), 1), 100)
+            limit = min(max(data.get('limit', 20), 1), MAX_ADDRESS_TRANSACTIONS)
             depth = min(max(data.get('depth', 3), 1), 5)
             
             # Analizza indirizzo
@@ -201,7 +201,7 @@ class AddressAnalysis(Resource):
                 'address_info': {
                     'address': analysis.address,
                     'total_transactions': analysis.total_transactions,
-                    'analyzed_transactions': limit,
+                    'analyzed_transactions': analysis.analyzed_transactions,
                     'address_type': 'P2WPKH' if address.startswith('bc1q') else 'P2SH' if address.startswith('3') else 'P2PKH'
                 },
                 'fingerprint': {
@@ -4,7 +4,6 @@ Contiene la logica di business per l'API
 """
 
 import time
-import requests
 from datetime import datetime
 from typing import List, Dict, Any, Optional, Tuple
 import sys
@@ -13,8 +12,10 @@ import os
 # Aggiungi path per importare moduli
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from fingerprinting import detect_wallet, analyze_txs, analyze_block, get_spending_types, get_sending_types
-from fetch_txs import module
+from fingerprinting import Wallets, analyze_block, extract_features, profile_step, wallets_from_mask
+from fetch_txs import module, fill_heights, fill_heights_concurrently, get_txs_concurrently
+from fingerprint_store import fingerprint, open_store
+from mempool_space import MempoolSpace
 from models.responses import (
     WalletDetection, TransactionInfo, TransactionAnalysis, 
     AddressAnalysis, BlockAnalysis
@@ -23,31 +24,97 @@ from utils.logger import setup_logger
 
 logger = setup_logger()
 
+try:
+    fingerprint_store = open_store()
+except Exception as e:
+    logger.warning(f"Fingerprint store disabled: {str(e)}")
+    fingerprint_store = None
+
+# Normalizza le tx esplora già scaricate (indirizzi)
+esplora = MempoolSpace()
+
+# Scarica tx e dati collegati con l'adapter asyncio
+ASYNC_UPSTREAM = os.environ.get('ASYNC_UPSTREAM', 'true').lower() in ('1', 'true', 'yes')
+
+# Numero massimo di transazioni analizzate per indirizzo
+MAX_ADDRESS_TRANSACTIONS = int(os.environ.get('MAX_ADDRESS_TRANSACTIONS', 10000))
+
+# Voci della timeline restituite per indirizzo (le più recenti)
+MAX_ADDRESS_TIMELINE = int(os.environ.get('MAX_ADDRESS_TIMELINE', 100))
+
+# Età massima (secondi) del riepilogo del tip salvato dal tip follower
+TIP_SUMMARY_MAX_AGE = float(os.environ.get('TIP_SUMMARY_MAX_AGE', 1800))
+
 class WalletAnalysisService:
     """Servizio per analisi wallet"""
     
+    @staticmethod
+    def fingerprint_txs(txids: List[str], address: Optional[str] = None) -> Dict[str, Any]:
+        """Fingerprint per txid, dallo store locale se presenti, altrimenti calcolati e salvati"""
+        results = fingerprint_store.get_many(txids) if fingerprint_store else {}
+        
+        missing = [txid for txid in txids if txid not in results]
+        if ASYNC_UPSTREAM:
+            # tx, prevout e altezze scaricati in parallelo
+            txs = profile_step("fetch_txs_with_heights", get_txs_concurrently, missing, True) if missing else []
+        else:
+            txs = module.get_txs(missing)
+            # altezze mancanti (anche delle tx stesse) risolte tutte insieme
+            profile_step("fill_heights", fill_heights, txs, True)
+        
+        return WalletAnalysisService.record_fingerprints(txs, results, txids, address)
+    
+    @staticmethod
+    def fingerprint_downloaded_txs(txs: List[Any], address: Optional[str] = None) -> Dict[str, Any]:
+        """Fingerprint di tx già scaricate con i loro prevout, senza richiederle upstream"""
+        txids = [tx.txid for tx in txs]
+        results = fingerprint_store.get_many(txids) if fingerprint_store else {}
+        
+        missing = [tx for tx in txs if tx.txid not in results]
+        # le altezze delle tx arrivano con lo status, restano quelle dei prevout
+        fill = fill_heights_concurrently if ASYNC_UPSTREAM else fill_heights
+        profile_step("fill_heights", fill, missing, True)
+        
+        return WalletAnalysisService.record_fingerprints(missing, results, txids, address)
+    
+    @staticmethod
+    def record_fingerprints(txs: List[Any], results: Dict[str, Any], txids: List[str],
+                            address: Optional[str] = None) -> Dict[str, Any]:
+        """Calcola i fingerprint di txs, li aggiunge a results e li salva nello store"""
+        computed = [fingerprint(extract_features(tx), tx.height) for tx in txs]
+        for record in computed:
+            results[record.txid] = record
+        
+        if fingerprint_store:
+            # solo le tx confermate hanno un verdetto definitivo
+            fingerprint_store.put([record for record in computed if record.confirmed])
+            if address:
+                fingerprint_store.link_address(address, txids)
+        
+        return results
+    
     @staticmethod
     def analyze_transaction(txid: str) -> TransactionAnalysis:
         """Analizza una singola transazione"""
         start_time = time.time()
         
         try:
-            # Recupera dati transazione
-            tx = module.get_tx(txid)
+            record = WalletAnalysisService.fingerprint_txs([txid])[txid]
             
             # Informazioni base
             transaction_info = TransactionInfo(
                 txid=txid,
-                version=tx['version'],
-                locktime=tx['locktime'],
-                inputs_count=len(tx['vin']),
-                outputs_count=len(tx['vout']),
-                input_types=get_spending_types(tx),
-                output_types=get_sending_types(tx)
+                version=record.version,
+                locktime=record.locktime,
+                inputs_count=len(record.input_types),
+                outputs_count=len(record.output_types),
+                input_types=[script_type.label for script_type in record.input_types],
+                output_types=[script_type.label for script_type in record.output_types],
+                block_height=record.height if record.confirmed else None
             )
             
             # Rilevamento wallet
-            wallet, reasoning = detect_wallet(tx)
+            wallet, reasoning = wallets_from_mask(record.wallet_mask), list(record.reasoning)
             wallet_name = list(wallet)[0].value if wallet else 'Unknown'
             confidence = 95.0 if wallet and len(wallet) == 1 else 50.0
             
@@ -76,71 +143,28 @@ class WalletAnalysisService:
         start_time = time.time()
         
         try:
-            # Recupera transazioni dell'indirizzo
-            url = f'https://mempool.space/api/address/{address}/txs'
-            response = requests.get(url, timeout=30)
-            
-            if response.status_code != 200:
-                raise Exception(f"API error: {response.status_code}")
-            
-            txs = response.json()
-            total_txs = len(txs)
-            
-            # Limita il numero di transazioni da analizzare
-            txs_to_analyze = txs[:min(limit, total_txs)]
-            txids = [tx['txid'] for tx in txs_to_analyze]
-            
-            # Analisi batch
-            results = analyze_txs(txids)
-            
-            # Calcola distribuzione
-            wallet_distribution = {wallet: data['total'] for wallet, data in results.items()}
-            total_analyzed = sum(wallet_distribution.values())
-            
-            wallet_percentages = {
-                wallet: (count / total_analyzed * 100) if total_analyzed > 0 else 0
-                for wallet, count in wallet_distribution.items()
-            }
+            limit = min(limit, MAX_ADDRESS_TRANSACTIONS)
             
-            # Wallet principale
-            main_wallet = max(wallet_distribution.items(), key=lambda x: x[1])[0]
+            # Totale reale dalle statistiche dell'indirizzo, non dalla prima pagina
+            stats = esplora.getaddress(address)
+            total_txs = stats['chain_stats']['tx_count'] + stats['mempool_stats']['tx_count']
             
-            # Timeline
-            timeline = []
-            for tx in txs_to_analyze:
-                txid = tx['txid']
-                timestamp = tx['status']['block_time']
-                date = datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M')
+            # Una pagina alla volta: in memoria restano solo i contatori e la timeline
+            aggregator = AddressAggregator()
+            for page in esplora.iter_address_txs(address):
+                page = page[:limit - aggregator.analyzed]
                 
-                try:
-                    tx_data = module.get_tx(txid)
-                    wallet, _ = detect_wallet(tx_data)
-                    detected = list(wallet)[0].value if wallet else 'Unknown'
-                    timeline.append({
-                        'date': date,
-                        'wallet': detected,
-                        'txid': txid[:16]
-                    })
-                except:
-                    timeline.append({
-                        'date': date,
-                        'wallet': 'Error',
-                        'txid': txid[:16]
-                    })
-            
-            # Pattern type
-            unique_wallets = set([item['wallet'] for item in timeline])
-            pattern_type = 'Multi-wallet' if len(unique_wallets) > 1 else 'Single-wallet'
-            
-            return AddressAnalysis(
-                address=address,
-                total_transactions=total_txs,
-                wallet_distribution=wallet_distribution,
-                wallet_percentages=wallet_percentages,
-                timeline=timeline,
-                main_wallet=main_wallet,
-                pattern_type=pattern_type
-            )
+                # Le tx scaricate contengono già i prevout: classificate una sola volta
+                records = WalletAnalysisService.fingerprint_downloaded_txs(
+                    [esplora.normalize_tx(tx) for tx in page], address
+                )
+                for tx in page:
+                    aggregator.add(tx, records[tx['txid']])
+                
+                if aggregator.analyzed >= limit:
+                    break
+            
+            return aggregator.analysis(address, total_txs)
             
         except Exception as e:
             logger.error(f"Error analyzing address {address}: {str(e)}")
@@ -152,6 +176,12 @@ class WalletAnalysisService:
         start_time = time.time()
         
         try:
+            # Ultimo blocco già analizzato dal tip follower
+            if not block_hash and fingerprint_store:
+                tip = fingerprint_store.tip_block_summary()
+                if tip and time.time() - tip.analyzed_at <= TIP_SUMMARY_MAX_AGE:
+                    return WalletAnalysisService.block_summary_analysis(tip, start_time)
+            
             # Analizza il blocco
             results = analyze_block(block_hash, num_txs)
             
@@ -179,5 +209,76 @@ class WalletAnalysisService:
             logger.error(f"Error analyzing block {block_hash}: {str(e)}")
             raise
 
+    @staticmethod
+    def block_summary_analysis(summary, start_time: float) -> BlockAnalysis:
+        """Analisi di un blocco a partire dal riepilogo salvato"""
+        total = summary.total_transactions
+        
+        return BlockAnalysis(
+            block_hash=summary.hash,
+            total_transactions=total,
+            analyzed_transactions=total,
+            wallet_distribution=dict(summary.wallets),
+            wallet_percentages={
+                wallet: (count / total * 100) if total > 0 else 0
+                for wallet, count in summary.wallets.items()
+            },
+            analysis_time=time.time() - start_time
+        )
+
+class AddressAggregator:
+    """Distribuzione e timeline di un indirizzo, aggiornate tx per tx"""
+    
+    def __init__(self, timeline_max: int = MAX_ADDRESS_TIMELINE):
+        self.wallet_distribution = {wallet_type.value: 0 for wallet_type in Wallets}
+        self.timeline = []
+        self.timeline_max = timeline_max
+        self.detected_wallets = set()
+        self.analyzed = 0
+    
+    def add(self, tx: Dict[str, Any], record) -> None:
+        """Aggiunge una tx esplora con il suo fingerprint"""
+        self.wallet_distribution[record.wallet] += 1
+        self.analyzed += 1
+        
+        wallet = wallets_from_mask(record.wallet_mask)
+        detected = list(wallet)[0].value if wallet else 'Unknown'
+        self.detected_wallets.add(detected)
+        
+        # Le tx arrivano dalla più recente: la timeline tiene le prime
+        if len(self.timeline) < self.timeline_max:
+            timestamp = tx['status'].get('block_time')
+            date = datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M') if timestamp else 'Unconfirmed'
+            self.timeline.append({
+                'date': date,
+                'wallet': detected,
+                'txid': tx['txid'][:16]
+            })
+    
+    def analysis(self, address: str, total_txs: int) -> AddressAnalysis:
+        """Analisi finale dell'indirizzo"""
+        total_analyzed = self.analyzed
+        wallet_percentages = {
+            wallet: (count / total_analyzed * 100) if total_analyzed > 0 else 0
+            for wallet, count in self.wallet_distribution.items()
+        }
+        
+        # Wallet principale
+        main_wallet = max(self.wallet_distribution.items(), key=lambda x: x[1])[0]
+        
+        # Pattern type
+        pattern_type = 'Multi-wallet' if len(self.detected_wallets) > 1 else 'Single-wallet'
+        
+        return AddressAnalysis(
+            address=address,
+            total_transactions=total_txs,
+            wallet_distribution=self.wallet_distribution,
+            wallet_percentages=wallet_percentages,
+            timeline=self.timeline,
+            main_wallet=main_wallet,
+            pattern_type=pattern_type,
+            analyzed_transactions=total_analyzed
+        )
+
 # Istanza globale del servizio
 wallet_service = WalletAnalysisService()
@@ -15,7 +15,7 @@ import os
 # Aggiungi path per importare moduli
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from api.services import wallet_service
+from api.services import wallet_service, MAX_ADDRESS_TRANSACTIONS
 from api.middleware import validate_txid, validate_address
 from models.responses import create_error_response
 from utils.logger import setup_logger
@@ -231,7 +231,7 @@ def analyze_address_sse(session_id: str):
             )), 400
         
         limit = data.get('limit', 20)
-        if not isinstance(limit, int) or limit < 1 or limit > 100:
+        if not isinstance(limit, int) or limit < 1 or limit > MAX_ADDRESS_TRANSACTIONS:
             limit = 20
         
         # Avvia analisi in thread separato
@@ -261,7 +261,7 @@ def analyze_address_sse(session_id: str):
                 response_data = {
                     'address': analysis.address,
                     'total_transactions': analysis.total_transactions,
-                    'analyzed_transactions': limit,
+                    'analyzed_transactions': analysis.analyzed_transactions,
                     'wallet_distribution': analysis.wallet_distribution,
                     'wallet_percentages': analysis.wallet_percentages,
                     'timeline': analysis.timeline,
@@ -0,0 +1,176 @@
+import asyncio
+import json
+import os
+import random
+
+import aiohttp
+
+from http_pool import is_transient
+from mempool_space import MempoolSpace
+from raw_tx import parse_tx
+
+# asyncio counterparts of the BitcoinCore and MempoolSpace adapters. Calls
+# fan out concurrently, at most CONCURRENCY in flight, so a set of txs, their
+# prevouts and their confirmation heights cost a few round-trips of latency
+# instead of one per call. Adapters are async context managers owning their
+# aiohttp session, open one per batch of work.
+
+CONCURRENCY = int(os.environ.get("ASYNC_CONCURRENCY", 16))
+
+# errors of the adapters that mean the backend is down, on top of the
+# blocking ones (the Core adapter still makes a few blocking calls)
+UNAVAILABLE = (aiohttp.ClientError, asyncio.TimeoutError)
+
+class AsyncHttp:
+    def __init__(self, concurrency=CONCURRENCY, connect_timeout=None, read_timeout=None, retries=None,
+                 backoff=0.5, max_backoff=10.0):
+        self.concurrency = concurrency
+        self.timeout = aiohttp.ClientTimeout(
+            sock_connect=connect_timeout or float(os.environ.get("HTTP_CONNECT_TIMEOUT", 5)),
+            sock_read=read_timeout or float(os.environ.get("HTTP_READ_TIMEOUT", 30)),
+        )
+        self.retries = int(os.environ.get("HTTP_RETRIES", 3)) if retries is None else retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._session = None
+        self._semaphore = None
+
+    async def __aenter__(self):
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._session = aiohttp.ClientSession(
+            timeout=self.timeout, connector=aiohttp.TCPConnector(limit=self.concurrency)
+        )
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._session.close()
+
+    # Returns (status, body), retrying 429 and 5xx with jittered backoff,
+    # except JSON-RPC errors
+    async def request(self, method, url, **kwargs):
+        attempt = 0
+        while True:
+            async with self._semaphore:
+                async with self._session.request(method, url, **kwargs) as response:
+                    status = response.status
+                    body = await response.read()
+                    retry_after = response.headers.get("Retry-After")
+
+            if attempt >= self.retries or not is_transient(status, body):
+                return status, body
+            if retry_after and retry_after.isdigit():
+                delay = min(float(retry_after), self.max_backoff)
+            else:
+                delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def get_text(self, url):
+        return (await self.request("GET", url))[1].decode()
+
+    async def get_json(self, url):
+        return json.loads((await self.request("GET", url))[1])
+
+class AsyncMempoolSpace:
+    def __init__(self, concurrency=CONCURRENCY):
+        self.http = AsyncHttp(concurrency)
+        # normalization is shared with the blocking adapter
+        self.sync = MempoolSpace()
+
+    async def __aenter__(self):
+        await self.http.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.http.__aexit__(*exc)
+
+    # esplora txs carry their prevouts, one call per tx
+    async def get_tx(self, txid):
+        return self.sync.normalize_tx(await self.http.get_json(f"https://mempool.space/api/tx/{txid}"))
+
+    async def get_txs(self, txids):
+        return list(await asyncio.gather(*(self.get_tx(txid) for txid in txids)))
+
+    async def getconfirmationheight(self, txid):
+        status = await self.http.get_json(f"https://mempool.space/api/tx/{txid}/status")
+        return status["block_height"] if status["confirmed"] else -1
+
+    async def getconfirmationheights(self, txids):
+        heights = await asyncio.gather(*(self.getconfirmationheight(txid) for txid in txids))
+        return dict(zip(txids, heights))
+
+class AsyncBitcoinCore:
+    def __init__(self, core, concurrency=CONCURRENCY):
+        self.http = AsyncHttp(concurrency)
+        # prevout planning and the outpoint index are shared with the
+        # blocking adapter
+        self.core = core
+        self._auth = aiohttp.BasicAuth(core.rpcuser, core.rpcpassword)
+
+    async def __aenter__(self):
+        await self.http.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.http.__aexit__(*exc)
+
+    async def _batch_chunk(self, method, chunk):
+        status, body = await self.http.request(
+            "POST", self.core.url, auth=self._auth,
+            data=json.dumps([
+                {"jsonrpc": "1.0", "id": i, "method": method, "params": params}
+                for i, params in enumerate(chunk)
+            ]),
+            headers={'content-type': "application/json", 'cache-control': "no-cache"},
+        )
+        results = [None] * len(chunk)
+        for reply in json.loads(body):
+            if reply.get("error"):
+                raise Exception(f"RPC error in {method} {chunk[reply['id']]}: {reply['error']['message']}")
+            results[reply["id"]] = reply["result"]
+        return results
+
+    # Same as BitcoinCore.rpc_batch, with the batch_size chunks sent concurrently
+    async def rpc_batch(self, method, params_list):
+        size = self.core.batch_size
+        chunks = [params_list[start:start + size] for start in range(0, len(params_list), size)]
+        results = await asyncio.gather(*(self._batch_chunk(method, chunk) for chunk in chunks))
+        return [result for chunk_results in results for result in chunk_results]
+
+    async def get_txs(self, txids):
+        if self.core.tx_prevouts_inline():
+            verbose_txs = await self.rpc_batch("getrawtransaction", [[txid, 2] for txid in txids])
+            return [self.core.normalize_verbose_tx(tx) for tx in verbose_txs]
+        txs = [parse_tx(bytes.fromhex(tx_hex)) for tx_hex in await self.rpc_batch("getrawtransaction", [[txid] for txid in txids])]
+        known, indexed, missing = self.core.plan_prevouts(txs)
+        fetched = [parse_tx(bytes.fromhex(tx_hex)) for tx_hex in await self.rpc_batch("getrawtransaction", [[txid] for txid in missing])]
+        return self.core.attach_prevouts(txs, known, indexed, fetched)
+
+    async def get_tx(self, txid):
+        return (await self.get_txs([txid]))[0]
+
+    async def getconfirmationheights(self, txids):
+        txs = await self.rpc_batch("getrawtransaction", [[txid, True] for txid in txids])
+        block_hashes = list({tx["blockhash"] for tx in txs if tx.get("blockhash")})
+        headers = await self.rpc_batch("getblockheader", [[block_hash] for block_hash in block_hashes])
+        block_heights = {block_hash: header["height"] for block_hash, header in zip(block_hashes, headers)}
+        return {txid: block_heights[tx["blockhash"]] if tx.get("blockhash") else -1 for txid, tx in zip(txids, txs)}
+
+# Sets every height the heuristics read on txs, resolved through the height
+# index first, the rest in one concurrent lookup. The backend must be open.
+async def resolve_heights(backend, resolver, txs, tx_heights=False):
+    heights, missing = resolver.cached(resolver.needed(txs, tx_heights))
+    if missing:
+        resolver.upstream_calls += 1
+        heights.update(resolver.remember(await backend.getconfirmationheights(missing)))
+    return resolver.apply(txs, heights)
+
+# Fetches txs with their prevouts, then their heights
+async def fetch_txs_with_heights(backend, resolver, txids, tx_heights=False):
+    async with backend:
+        return await resolve_heights(backend, resolver, await backend.get_txs(txids), tx_heights)
+
+# Heights only, for txs downloaded elsewhere
+async def fill_heights_async(backend, resolver, txs, tx_heights=False):
+    async with backend:
+        return await resolve_heights(backend, resolver, txs, tx_heights)
@@ -0,0 +1,139 @@
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+import requests
+
+# Upstream backends in order of preference, created on first use. Every call
+# goes to the first healthy one and fails over to the next when a backend
+# can't be built, is unreachable or answers garbage, marking it down. A
+# background thread re-probes all of them, so a recovered node is picked up
+# again and a dead one is skipped before a request has to wait on it.
+
+# errors that mean the backend is down or degraded, not that the call was bad
+UNAVAILABLE = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    requests.exceptions.InvalidSchema,
+    json.JSONDecodeError,
+)
+
+class BackendRegistry:
+    def __init__(self, factories, probe_interval=30.0):
+        # [(name, factory)] in order of preference
+        self.factories = list(factories)
+        self.probe_interval = probe_interval
+        self._backends = {}
+        self._healthy = {name: True for name, _ in self.factories}
+        self._errors = {}
+        self._lock = threading.Lock()
+        self._prober_pid = None
+
+    def backend(self, name):
+        backend = self._backends.get(name)
+        if backend is None:
+            with self._lock:
+                backend = self._backends.get(name)
+                if backend is None:
+                    backend = self._backends[name] = dict(self.factories)[name]()
+        return backend
+
+    # Healthy backends first, the others as a last resort
+    def _candidates(self):
+        names = [name for name, _ in self.factories]
+        return [name for name in names if self._healthy[name]] + [name for name in names if not self._healthy[name]]
+
+    # (name, backend) of the candidates that can be built, in order. The
+    # errors of the others are appended to errors.
+    def _built(self, errors):
+        self._start_prober()
+        for name in self._candidates():
+            try:
+                backend = self.backend(name)
+            except Exception as e:
+                # a backend that can't even be built is down, not the call
+                self._mark(name, False, e)
+                errors.append(e)
+                continue
+            yield name, backend
+
+    # The backend calls currently go to, the first one that can be built
+    def current(self):
+        errors = []
+        for name, backend in self._built(errors):
+            return backend
+        raise errors[-1]
+
+    def call(self, method, *args, **kwargs):
+        errors = []
+        for name, backend in self._built(errors):
+            func = getattr(backend, method, None)
+            if func is None:
+                continue
+            try:
+                return func(*args, **kwargs)
+            except UNAVAILABLE as e:
+                self._mark(name, False, e)
+                errors.append(e)
+        if not errors:
+            raise AttributeError(f"no backend has {method}")
+        raise errors[-1]
+
+    # func(backend) with the same failover as call(), for work spanning
+    # several calls on one backend (the async adapters). unavailable adds
+    # errors meaning the backend is down to UNAVAILABLE.
+    def run(self, func, unavailable=()):
+        errors = []
+        for name, backend in self._built(errors):
+            try:
+                return func(backend)
+            except UNAVAILABLE + tuple(unavailable) as e:
+                self._mark(name, False, e)
+                errors.append(e)
+        raise errors[-1]
+
+    def _mark(self, name, healthy, error=None):
+        if self._healthy[name] != healthy:
+            state = "up" if healthy else f"down ({error})"
+            print(f"Backend {name} {state}", file=sys.stderr)
+        self._healthy[name] = healthy
+        self._errors[name] = str(error) if error else None
+
+    def probe(self):
+        for name, _ in self.factories:
+            try:
+                self.backend(name).getbestblockhash()
+                self._mark(name, True)
+            except Exception as e:
+                # whatever the reason, the prober thread must keep running
+                self._mark(name, False, e)
+
+    def _start_prober(self):
+        # one prober per process, threads don't survive a fork
+        if self._prober_pid == os.getpid() or not self.probe_interval:
+            return
+        with self._lock:
+            if self._prober_pid == os.getpid():
+                return
+            self._prober_pid = os.getpid()
+        threading.Thread(target=self._probe_forever, daemon=True).start()
+
+    def _probe_forever(self):
+        while True:
+            time.sleep(self.probe_interval)
+            self.probe()
+
+    def status(self):
+        return {
+            name: {"healthy": self._healthy[name], "error": self._errors.get(name)}
+            for name, _ in self.factories
+        }
+
+    # Backend methods, dispatched per call with failover
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return functools.partial(self.call, name)
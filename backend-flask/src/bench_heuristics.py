@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the fingerprinting heuristics.
+
+Runs detect_wallet, the batch classifier and each heuristic over a fixed,
+seeded corpus of small payments, consolidations, batch payouts and coinjoins,
+with every height known so nothing touches the network. Heuristics that work
+on the single-pass scan get it precomputed, so they time only themselves.
+Reports ns/tx (best of --repeat runs) and peak traced memory per benchmark,
+and compares them with a stored baseline:
+
+    bench_heuristics.py                    # compare with bench_baseline.json
+    bench_heuristics.py --save-baseline    # record a new baseline
+
+Times are compared relative to a fixed calibration loop timed in the same
+run, so a baseline recorded on one machine holds on another. Exits with
+status 1 when a benchmark is slower or uses more memory than the baseline by
+more than --tolerance.
+"""
+
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+# the corpus carries every height, keep the run free of index files
+os.environ.setdefault("HEIGHT_INDEX", "")
+
+import fingerprinting as fp
+from tx_model import ScriptType, Tx, TxIn, TxOut
+
+BASELINE = os.path.join(os.path.dirname(__file__), "bench_baseline.json")
+SEED = 2024
+TIP_HEIGHT = 850000
+
+_SCRIPTS = {
+    ScriptType.P2PKH: lambda rng: b"\x76\xa9\x14" + rng.randbytes(20) + b"\x88\xac",
+    ScriptType.P2SH: lambda rng: b"\xa9\x14" + rng.randbytes(20) + b"\x87",
+    ScriptType.P2WPKH: lambda rng: b"\x00\x14" + rng.randbytes(20),
+    ScriptType.P2WSH: lambda rng: b"\x00\x20" + rng.randbytes(32),
+    ScriptType.P2TR: lambda rng: b"\x51\x20" + rng.randbytes(32),
+    ScriptType.OP_RETURN: lambda rng: b"\x6a\x08" + rng.randbytes(8),
+}
+_SPENDABLE = (ScriptType.P2WPKH, ScriptType.P2TR, ScriptType.P2PKH, ScriptType.P2SH, ScriptType.P2WSH)
+
+def _txid(rng):
+    return rng.randbytes(32).hex()
+
+def _output(rng, script_type, value, height):
+    return TxOut(value, script_type, _SCRIPTS[script_type](rng), height)
+
+def _input(rng, prevout, sequence):
+    tx_in = TxIn(_txid(rng), rng.randrange(4), sequence, None,
+                 33 if rng.random() < 0.1 else 32, 0x04 if rng.random() < 0.02 else rng.choice((0x02, 0x03)))
+    tx_in.attach_prevout(prevout)
+    return tx_in
+
+def _prevout_height(rng):
+    # a few parents still unconfirmed
+    return -1 if rng.random() < 0.05 else TIP_HEIGHT - rng.randrange(1, 50000)
+
+def _tx(rng, inputs, outputs):
+    version = rng.choice((1, 2, 2, 2))
+    locktime = TIP_HEIGHT - rng.randrange(3) if rng.random() < 0.4 else 0
+    sequence = rng.choice((0xffffffff, 0xfffffffe, 0xfffffffd))
+    vin = [_input(rng, prevout, sequence) for prevout in inputs]
+    return Tx(_txid(rng), version, locktime, vin, outputs, TIP_HEIGHT)
+
+def small_payment(rng):
+    script_type = rng.choice(_SPENDABLE[:3])
+    inputs = [_output(rng, script_type, rng.randrange(10000, 10**7), _prevout_height(rng)) for _ in range(rng.randint(1, 2))]
+    total = sum(prevout.value for prevout in inputs)
+    payment = rng.randrange(1000, total // 2) // 1000 * 1000 or 1000
+    outputs = [
+        _output(rng, rng.choice(_SPENDABLE), payment, TIP_HEIGHT),
+        _output(rng, script_type, total - payment - rng.randrange(200, 2000), TIP_HEIGHT),
+    ]
+    rng.shuffle(outputs)
+    return _tx(rng, inputs, outputs)
+
+def consolidation(rng):
+    script_type = rng.choice(_SPENDABLE[:3])
+    inputs = [_output(rng, script_type, rng.randrange(5000, 10**6), _prevout_height(rng)) for _ in range(rng.randint(10, 60))]
+    inputs.sort(key=lambda prevout: prevout.value)
+    total = sum(prevout.value for prevout in inputs)
+    return _tx(rng, inputs, [_output(rng, script_type, total - rng.randrange(2000, 20000), TIP_HEIGHT)])
+
+def batch_payout(rng):
+    script_type = rng.choice(_SPENDABLE[:3])
+    inputs = [_output(rng, script_type, rng.randrange(10**7, 10**9), _prevout_height(rng)) for _ in range(rng.randint(1, 3))]
+    outputs = [_output(rng, rng.choice(_SPENDABLE), rng.randrange(10, 10**5) * 100, TIP_HEIGHT) for _ in range(rng.randint(10, 120))]
+    change = sum(prevout.value for prevout in inputs) - sum(txout.value for txout in outputs) - rng.randrange(5000, 50000)
+    outputs.append(_output(rng, script_type, change, TIP_HEIGHT))
+    if rng.random() < 0.1:
+        outputs.append(_output(rng, ScriptType.OP_RETURN, 0, TIP_HEIGHT))
+    return _tx(rng, inputs, outputs)
+
+def coinjoin(rng):
+    participants = rng.randint(5, 50)
+    denomination = rng.choice((100000, 1000000, 5000000, 10000000))
+    script_type = rng.choice((ScriptType.P2WPKH, ScriptType.P2TR))
+    inputs = [_output(rng, script_type, denomination + rng.randrange(10000, 10**6), _prevout_height(rng)) for _ in range(participants)]
+    outputs = [_output(rng, script_type, denomination, TIP_HEIGHT) for _ in range(participants)]
+    outputs += [_output(rng, script_type, rng.randrange(5000, 900000), TIP_HEIGHT) for _ in range(participants // 2)]
+    # BIP69 ordering, as most coordinators do
+    inputs.sort(key=lambda prevout: prevout.value)
+    outputs.sort(key=lambda txout: (txout.value, txout.scriptpubkey))
+    tx = _tx(rng, inputs, outputs)
+    tx.vin = tuple(sorted(tx.vin, key=lambda tx_in: (tx_in.txid, tx_in.vout)))
+    return tx
+
+CATEGORIES = {
+    "small_payment": small_payment,
+    "consolidation": consolidation,
+    "batch_payout": batch_payout,
+    "coinjoin": coinjoin,
+}
+
+# Same seed, same corpus: size txs per category
+def build_corpus(size, seed=SEED):
+    rng = random.Random(seed)
+    return {name: [make(rng) for _ in range(size)] for name, make in CATEGORIES.items()}
+
+def _tx_args(tx):
+    return (tx,)
+
+def _scan_args(tx):
+    return (fp._scan(tx),)
+
+def _scan_change_args(tx):
+    scan = fp._scan(tx)
+    return (scan, fp._change_index(scan))
+
+def _input_args(tx):
+    scan = fp._scan(tx)
+    return (scan.prevouts, scan.input_amounts, scan.input_heights)
+
+# name -> (function, called once with the whole corpus instead of per tx,
+# untimed setup turning a tx into the function's arguments)
+BENCHMARKS = {
+    "detect_wallet": (fp.detect_wallet, False, _tx_args),
+    "detect_wallets_batch": (fp.detect_wallets_batch, True, _tx_args),
+    "extract_features": (fp.extract_features, False, _tx_args),
+    "scan": (fp._scan, False, _tx_args),
+    "get_spending_types": (fp.get_spending_types, False, _tx_args),
+    "get_sending_types": (fp.get_sending_types, False, _tx_args),
+    "compressed_public_keys_only": (fp.compressed_public_keys_only, False, _tx_args),
+    "low_r_only": (fp.low_r_only, False, _tx_args),
+    "get_input_order": (fp._input_order, False, _input_args),
+    "get_change_index": (fp._change_index, False, _scan_args),
+    "get_output_structure": (fp._output_structure, False, _scan_change_args),
+    "has_multi_type_vin": (fp.has_multi_type_vin, False, _tx_args),
+    "is_anti_fee_sniping": (fp.is_anti_fee_sniping, False, _tx_args),
+    "change_type_matched_inputs": (fp._change_type_matched_inputs, False, _scan_change_args),
+    "address_reuse": (fp._address_reuse, False, _scan_args),
+    "signals_rbf": (fp.signals_rbf, False, _tx_args),
+}
+
+def _run(func, batched, args):
+    if batched:
+        func(args)
+    else:
+        for arg in args:
+            func(*arg)
+
+def time_once(func, batched, args):
+    start = time.perf_counter_ns()
+    _run(func, batched, args)
+    return (time.perf_counter_ns() - start) / len(args)
+
+def peak_memory(func, batched, args):
+    tracemalloc.start()
+    try:
+        _run(func, batched, args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def _calibration(values):
+    # the kind of work the heuristics do: loops, comparisons, small sets
+    total = 0
+    for _ in range(10):
+        seen = set()
+        for value in values:
+            if value % 3:
+                total += value
+            seen.add(value & 31)
+        total += len(seen) + (values[-1] > values[0])
+    return total
+
+_CALIBRATION_ARGS = [(list(range(100)),)] * 100
+
+def run(size, repeat, only=None):
+    corpus = build_corpus(size)
+    txs = [tx for category in corpus.values() for tx in category]
+    benchmarks = {
+        name: (func, batched, list(txs) if batched else [setup(tx) for tx in txs])
+        for name, (func, batched, setup) in BENCHMARKS.items()
+        if not only or name in only
+    }
+    # where detect_wallet spends its time, by kind of tx
+    if not only or "detect_wallet" in only:
+        for category, category_txs in corpus.items():
+            benchmarks[f"detect_wallet[{category}]"] = (fp.detect_wallet, False, [(tx,) for tx in category_txs])
+    # one calibration run: benchmarks are reported in units of it, so
+    # machine speed cancels out
+    benchmarks["calibration"] = (_calibration, False, _CALIBRATION_ARGS)
+
+    # one untimed warm-up run each, then the timed runs go round-robin so a
+    # noisy stretch hits one run of every benchmark instead of all runs of
+    # one. The best run counts, no collections inside the timed ones.
+    for func, batched, args in benchmarks.values():
+        _run(func, batched, args)
+    best = {}
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            for name, (func, batched, args) in benchmarks.items():
+                elapsed = time_once(func, batched, args)
+                best[name] = min(best.get(name, elapsed), elapsed)
+    finally:
+        gc.enable()
+
+    calibration = best.pop("calibration")
+    del benchmarks["calibration"]
+    results = {}
+    for name, (func, batched, args) in benchmarks.items():
+        results[name] = {
+            "ns_per_tx": round(best[name], 1),
+            "relative": round(best[name] / calibration, 6),
+            "peak_kib": round(peak_memory(func, batched, args) / 1024, 1),
+        }
+    return calibration, results
+
+# Returns the report lines and whether any benchmark regressed. Times are
+# compared relative to each run's calibration.
+def compare(results, baseline, tolerance):
+    lines = [f"{'benchmark':<36}{'ns/tx':>12}{'relative':>12}{'baseline':>12}{'change':>9}{'peak KiB':>11}{'baseline':>11}"]
+    regressed = False
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            lines.append(
+                f"{name:<36}{result['ns_per_tx']:>12.1f}{result['relative']:>12.4f}{'-':>12}{'':>9}"
+                f"{result['peak_kib']:>11.1f}{'-':>11}"
+            )
+            continue
+        change = result["relative"] / base["relative"] - 1 if base["relative"] else 0.0
+        slower = change > tolerance
+        bigger = result["peak_kib"] > base["peak_kib"] * (1 + tolerance) + 1
+        regressed |= slower or bigger
+        flag = "  REGRESSION" if slower or bigger else ""
+        lines.append(
+            f"{name:<36}{result['ns_per_tx']:>12.1f}{result['relative']:>12.4f}{base['relative']:>12.4f}{change:>+9.0%}"
+            f"{result['peak_kib']:>11.1f}{base['peak_kib']:>11.1f}{flag}"
+        )
+    return lines, regressed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the fingerprinting heuristics offline")
+    parser.add_argument("--size", type=int, default=500, help="txs per category")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per benchmark, the best one counts")
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), help="benchmarks to run")
+    parser.add_argument("--baseline", default=BASELINE, help="baseline file")
+    parser.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown or memory growth")
+    args = parser.parse_args(argv)
+
+    calibration, results = run(args.size, args.repeat, args.only)
+    print(f"Calibration loop: {calibration / 1000:.1f} us", file=sys.stderr)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({"size": args.size, "calibration_ns": round(calibration, 1), "results": results}, f, indent=2)
+            f.write("\n")
+        print(f"Baseline saved to {args.baseline}", file=sys.stderr)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            stored = json.load(f)
+        if "calibration_ns" not in stored:
+            print("Baseline has no calibration, record it again with --save-baseline", file=sys.stderr)
+        elif stored["size"] == args.size:
+            baseline = stored["results"]
+        else:
+            print(f"Baseline was recorded with --size {stored['size']}, not compared", file=sys.stderr)
+
+    lines, regressed = compare(results, baseline, args.tolerance)
+    print("\n".join(lines))
+    return 1 if regressed and not args.save_baseline else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
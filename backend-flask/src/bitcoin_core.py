@@ -1,81 +1,246 @@
 import configparser
 import json
-import requests
 import os
+import sqlite3
+import sys
+import threading
 
-Config = configparser.ConfigParser()
-Config.read(os.path.join(os.path.dirname(__file__), "rpc_config.ini"))
+from http_pool import http
+from outpoint_index import open_outpoint_index
+from raw_tx import classify_script, parse_block, parse_tx
+from tx_model import NULL_TXID, Tx, TxIn, TxOut, btc_to_sats
 
-URL = Config.get("RPC_INFO", "URL")
-RPCUSER = Config.get("RPC_INFO", "RPCUSER")
-RPCPASSWORD = Config.get("RPC_INFO", "RPCPASSWORD")
+CONFIG_PATH = os.environ.get("RPC_CONFIG", os.path.join(os.path.dirname(__file__), "rpc_config.ini"))
 
-class BitcoinCore:
-    def __init__(self):
-        pass
+# height Core reports for prevouts created by mempool txs
+MEMPOOL_HEIGHT = 0x7fffffff
 
-    def get_prev_txout(self, tx_in):
-        prev_txout = self.decoderawtransaction(self.getrawtransaction(tx_in["txid"]))["vout"][tx_in["vout"]]
-        return prev_txout
+class BitcoinCore:
+    # The config is read per backend, so a missing or broken one fails its
+    # construction (the registry moves on) instead of every import
+    def __init__(self, config_path=CONFIG_PATH):
+        config = configparser.ConfigParser()
+        config.read(config_path)
+        self.url = config.get("RPC_INFO", "URL")
+        self.rpcuser = config.get("RPC_INFO", "RPCUSER")
+        self.rpcpassword = config.get("RPC_INFO", "RPCPASSWORD")
+        # fetch raw blocks through the node's REST interface (needs -rest)
+        self.rest = config.getboolean("RPC_INFO", "REST", fallback=False)
+        # max calls per JSON-RPC batch request
+        self.batch_size = config.getint("RPC_INFO", "BATCH_SIZE", fallback=500)
+        # use getblock/getrawtransaction verbosities with inline prevouts when
+        # the node has them
+        self.verbose_prevouts = config.getboolean("RPC_INFO", "VERBOSE_PREVOUTS", fallback=True)
+        # local txid:vout -> prevout index, an empty value disables it
+        self.outpoint_index = config.get(
+            "RPC_INFO", "OUTPOINT_INDEX", fallback=os.path.join(os.path.dirname(__file__), "outpoints.db")
+        )
+
+        self._outpoints = None
+        self._outpoints_opened = False
+        self._lock = threading.Lock()
+        self._version = None
+
+    # Opened on first use. A path that can't be written (read-only deploys)
+    # disables the index instead of the backend.
+    @property
+    def outpoints(self):
+        if not self._outpoints_opened:
+            with self._lock:
+                if not self._outpoints_opened:
+                    try:
+                        self._outpoints = open_outpoint_index(self.outpoint_index)
+                    except (sqlite3.Error, OSError) as e:
+                        print(f"Outpoint index {self.outpoint_index} disabled: {e}", file=sys.stderr)
+                    self._outpoints_opened = True
+        return self._outpoints
+
+    def node_version(self):
+        if self._version is None:
+            info = self.rpc_call("getnetworkinfo")
+            self._version = info["version"] if info else 0
+        return self._version
+
+    # getrawtransaction verbosity 2 (Core 25.0+) includes each input's prevout
+    def tx_prevouts_inline(self):
+        return self.verbose_prevouts and self.node_version() >= 250000
+
+    # getblock verbosity 3 (Core 23.0+) includes each input's prevout
+    def block_prevouts_inline(self):
+        return self.verbose_prevouts and self.node_version() >= 230000
+
+    def normalize_verbose_txout(self, txout, height=None):
+        script = bytes.fromhex(txout["scriptPubKey"]["hex"])
+        return TxOut(btc_to_sats(txout["value"]), classify_script(script), script, height)
+
+    # Projects a decoded tx with inline prevouts into the tx model
+    def normalize_verbose_tx(self, tx, height=None):
+        vin = []
+        for tx_in in tx["vin"]:
+            if "coinbase" in tx_in:
+                vin.append(TxIn(NULL_TXID, 0xffffffff, tx_in["sequence"], None))
+                continue
+            prevout = tx_in["prevout"]
+            prev_height = prevout.get("height")
+            if prev_height == MEMPOOL_HEIGHT:
+                prev_height = -1
+            vin.append(TxIn.from_scripts(
+                tx_in["txid"],
+                tx_in["vout"],
+                tx_in["sequence"],
+                self.normalize_verbose_txout(prevout, prev_height),
+                bytes.fromhex(tx_in["scriptSig"]["hex"]),
+                [bytes.fromhex(item) for item in tx_in.get("txinwitness", [])],
+            ))
+        vout = [self.normalize_verbose_txout(tx_out, height) for tx_out in tx["vout"]]
+        return Tx(tx["txid"], tx["version"], tx["locktime"], vin, vout, height)
 
     def normalize_tx(self, tx):
-        for tx_in in tx["vin"]:
-            tx_in["scriptsig_asm"] = tx_in["scriptSig"]["asm"]
-            tx_in["scriptsig"] = tx_in["scriptSig"]["hex"]
-            del tx_in["scriptSig"]
-            try:
-                tx_in["witness"] = tx_in["txinwitness"]
-                del tx_in["txinwitness"]
-            except KeyError:
-                pass
-            tx_in["prevout"] = self.normalize_txout(self.get_prev_txout(tx_in))
-        tx["vout"] = [self.normalize_txout(tx_out) for tx_out in tx["vout"]]
-        return tx
-
-    def normalize_txout(self, txout):
-        txout["scriptpubkey"] = txout["scriptPubKey"]["hex"]
-        try:
-            txout["scriptpubkey_address"] = txout["scriptPubKey"]["address"]
-        except KeyError:
-            pass
-        txout["scriptpubkey_type"] = txout["scriptPubKey"]["type"]
-        del txout["scriptPubKey"]
-        return txout
+        return self.resolve_prevouts([tx])[0]
 
     def get_tx(self, txid):
-        return self.normalize_tx(self.decoderawtransaction(self.getrawtransaction(txid)))
+        if self.tx_prevouts_inline():
+            return self.normalize_verbose_tx(self.rpc_call("getrawtransaction", [txid, 2]))
+        return self.normalize_tx(parse_tx(bytes.fromhex(self.getrawtransaction(txid))))
+
+    # Batch variant of get_tx: one batch with inline prevouts, or the txs in
+    # one batch and then all their prevouts in another
+    def get_txs(self, txids):
+        if self.tx_prevouts_inline():
+            return [self.normalize_verbose_tx(tx) for tx in self.rpc_batch("getrawtransaction", [[txid, 2] for txid in txids])]
+        txs = [parse_tx(bytes.fromhex(tx_hex)) for tx_hex in self.getrawtransactions(txids)]
+        return self.resolve_prevouts(txs)
+
+    # One getblock call with inline prevouts when the node has it, otherwise
+    # the serialized block and its prevouts resolved in one batched call.
+    # The coinbase is excluded, num_of_txs limits the txs returned.
+    def get_block_txs(self, block_hash, num_of_txs=None):
+        if self.block_prevouts_inline():
+            block = self.rpc_call("getblock", [block_hash, 3])
+            txs = [self.normalize_verbose_tx(tx, block["height"]) for tx in block["tx"]]
+            if self.outpoints:
+                self.outpoints.add_txs(txs)
+            return txs[1:num_of_txs + 1 if num_of_txs else None]
+
+        block = parse_block(self.getblock_raw(block_hash))
+        if block.height is None:
+            # before BIP34 the coinbase doesn't carry the height
+            block.height = self.getblockheader(block_hash)["height"]
+        for tx in block.txs:
+            tx.height = block.height
+            for txout in tx.vout:
+                txout.height = block.height
+        if self.outpoints:
+            self.outpoints.add_txs(block.txs)
+        txs = block.txs[1:num_of_txs + 1 if num_of_txs else None]
+        self.resolve_prevouts(txs, block.txs)
+        return txs
+
+    # Prevouts come from known_txs, then the outpoint index, then one batched
+    # getrawtransaction call for the remaining parents
+    def resolve_prevouts(self, txs, known_txs=()):
+        known, indexed, missing = self.plan_prevouts(txs, known_txs)
+        fetched = [parse_tx(bytes.fromhex(tx_hex)) for tx_hex in self.getrawtransactions(missing)]
+        return self.attach_prevouts(txs, known, indexed, fetched)
+
+    # Splits the prevouts of txs into parents already known, indexed
+    # outpoints and the txids still to fetch
+    def plan_prevouts(self, txs, known_txs=()):
+        known = {tx.txid: tx for tx in known_txs}
+        outpoints = [
+            (tx_in.txid, tx_in.vout) for tx in txs for tx_in in tx.vin
+            if not tx_in.is_coinbase and tx_in.txid not in known
+        ]
+        indexed = self.outpoints.get_many(outpoints) if self.outpoints and outpoints else {}
+        missing = list({txid for txid, vout in outpoints if (txid, vout) not in indexed})
+        return known, indexed, missing
+
+    def attach_prevouts(self, txs, known, indexed, fetched):
+        for prev_tx in fetched:
+            known[prev_tx.txid] = prev_tx
+        if self.outpoints and fetched:
+            self.outpoints.add_txs(fetched)
+
+        for tx in txs:
+            for tx_in in tx.vin:
+                if tx_in.is_coinbase:
+                    continue
+                prev_tx = known.get(tx_in.txid)
+                tx_in.attach_prevout(prev_tx.vout[tx_in.vout] if prev_tx else indexed[(tx_in.txid, tx_in.vout)])
+        return txs
+
+    def _post(self, payload):
+        headers = {'content-type': "application/json", 'cache-control': "no-cache"}
+        response = http.request("POST", self.url, data=json.dumps(payload), headers=headers, auth=(self.rpcuser, self.rpcpassword))
+
+        return json.loads(response.text)
+
+    def rpc_call(self, method, params=()):
+        return self._post({"method": method, "params": list(params)})["result"]
+
+    # Calls method once per params list as JSON-RPC array batches of at most
+    # batch_size calls, results in the same order
+    def rpc_batch(self, method, params_list):
+        results = []
+        for start in range(0, len(params_list), self.batch_size):
+            chunk = params_list[start:start + self.batch_size]
+            replies = self._post([
+                {"jsonrpc": "1.0", "id": i, "method": method, "params": params}
+                for i, params in enumerate(chunk)
+            ])
+
+            chunk_results = [None] * len(chunk)
+            for reply in replies:
+                if reply.get("error"):
+                    raise Exception(f"RPC error in {method} {chunk[reply['id']]}: {reply['error']['message']}")
+                chunk_results[reply["id"]] = reply["result"]
+            results.extend(chunk_results)
+        return results
 
     def getbestblockhash(self):
-        payload = json.dumps({"method": "getbestblockhash", "params": []})
-        headers = {'content-type': "application/json", 'cache-control': "no-cache"}
-        response = requests.request("POST", URL, data=payload, headers=headers, auth=(RPCUSER, RPCPASSWORD))
+        return self.rpc_call("getbestblockhash")
 
-        return json.loads(response.text)["result"]
+    def getblockhash(self, height):
+        return self.rpc_call("getblockhash", [height])
 
-    def getblocktxs(self, block_hash):
-        payload = json.dumps({"method": "getblock", "params": [block_hash]})
-        headers = {'content-type': "application/json", 'cache-control': "no-cache"}
-        response = requests.request("POST", URL, data=payload, headers=headers, auth=(RPCUSER, RPCPASSWORD))
+    def getblockheader(self, block_hash):
+        return self.rpc_call("getblockheader", [block_hash])
 
-        return json.loads(response.text)["result"]["tx"]
+    def getblocktxs(self, block_hash):
+        return self.rpc_call("getblock", [block_hash])["tx"]
 
     def getrawmempool(self):
-        payload = json.dumps({"method": "getrawmempool", "params": []})
-        headers = {'content-type': "application/json", 'cache-control': "no-cache"}
-        response = requests.request("POST", URL, data=payload, headers=headers, auth=(RPCUSER, RPCPASSWORD))
+        return self.rpc_call("getrawmempool")
 
-        return json.loads(response.text)["result"]
+    def getblock_raw(self, block_hash):
+        if self.rest:
+            response = http.request("GET", f"{self.url.rstrip('/')}/rest/block/{block_hash}.bin")
+            return response.content
 
-    def getrawtransaction(self, txid):
-        payload = json.dumps({"method": "getrawtransaction", "params": [txid]})
-        headers = {'content-type': "application/json", 'cache-control': "no-cache"}
-        response = requests.request("POST", URL, data=payload, headers=headers, auth=(RPCUSER, RPCPASSWORD))
+        return bytes.fromhex(self.rpc_call("getblock", [block_hash, 0]))
 
-        return json.loads(response.text)["result"]
+    def getrawtransactions(self, txids):
+        return self.rpc_batch("getrawtransaction", [[txid] for txid in txids])
 
-    def decoderawtransaction(self, tx_hex):
-        payload = json.dumps({"method": "decoderawtransaction", "params": [tx_hex]})
-        headers = {'content-type': "application/json", 'cache-control': "no-cache"}
-        response = requests.request("POST", URL, data=payload, headers=headers, auth=(RPCUSER, RPCPASSWORD))
+    def getblockhashes(self, heights):
+        return self.rpc_batch("getblockhash", [[height] for height in heights])
+
+    def getblockheaders(self, block_hashes):
+        return self.rpc_batch("getblockheader", [[block_hash] for block_hash in block_hashes])
 
-        return json.loads(response.text)["result"]
+    # Returns {txid: height}, -1 for unconfirmed txs. Two batched calls: the
+    # txs' block hashes, then those blocks' heights.
+    def getconfirmationheights(self, txids):
+        txs = self.rpc_batch("getrawtransaction", [[txid, True] for txid in txids])
+        block_hashes = list({tx["blockhash"] for tx in txs if tx.get("blockhash")})
+        block_heights = {
+            block_hash: header["height"]
+            for block_hash, header in zip(block_hashes, self.getblockheaders(block_hashes))
+        }
+        return {txid: block_heights[tx["blockhash"]] if tx.get("blockhash") else -1 for txid, tx in zip(txids, txs)}
+
+    def getrawtransaction(self, txid):
+        return self.rpc_call("getrawtransaction", [txid])
+
+    def decoderawtransaction(self, tx_hex):
+        return self.rpc_call("decoderawtransaction", [tx_hex])
@@ -1,22 +1,72 @@
-import requests
-import json
+import asyncio
+import os
+import sqlite3
+import sys
+from async_backends import UNAVAILABLE, AsyncBitcoinCore, AsyncMempoolSpace, fetch_txs_with_heights, fill_heights_async
+from backend_registry import BackendRegistry
 from bitcoin_core import BitcoinCore
+from height_index import HeightResolver, open_height_index
 from mempool_space import MempoolSpace
+from replay_backend import ReplayBackend
 
 
-module = BitcoinCore()
+if os.environ.get("REPLAY_CORPUS"):
+    # recorded upstream answers only, no network
+    module = BackendRegistry([("replay", lambda: ReplayBackend(os.environ["REPLAY_CORPUS"]))], probe_interval=0)
+else:
+    # Bitcoin Core when reachable, mempool.space otherwise, chosen per call
+    module = BackendRegistry(
+        [("bitcoin_core", BitcoinCore), ("mempool_space", MempoolSpace)],
+        probe_interval=float(os.environ.get("BACKEND_PROBE_INTERVAL", 30)),
+    )
 
 try:
-    module.getbestblockhash()
-    print("Using Bitcoin Core")
-except (requests.exceptions.ConnectionError, requests.exceptions.InvalidSchema):
-    module = MempoolSpace()
-    print("Using mempool.space")
+    height_index = open_height_index(os.environ.get("HEIGHT_INDEX", "heights.db"))
+except (sqlite3.Error, OSError) as e:
+    # read-only deploys: resolve every height upstream
+    print(f"Height index disabled: {e}", file=sys.stderr)
+    height_index = None
+
+heights = HeightResolver(module, height_index)
 
 def get_confirmation_height(txid):
-    mempool_space = f"https://mempool.space/api/tx/{txid}/status"
-    response = requests.request("GET", mempool_space)
-    ret = json.loads(response.text)
-    if not ret["confirmed"]:
-        return -1
-    return ret["block_height"]
+    return heights.resolve([txid])[txid]
+
+def get_confirmation_heights(txids):
+    return heights.resolve(txids)
+
+def fill_heights(txs, tx_heights=False):
+    return heights.fill(txs, tx_heights)
+
+def async_adapter(backend):
+    if isinstance(backend, BitcoinCore):
+        return AsyncBitcoinCore(backend)
+    if isinstance(backend, MempoolSpace):
+        return AsyncMempoolSpace()
+    return None
+
+# Runs work(adapter) on the async adapter of the current backend, failing
+# over like any registry call. Backends without an async adapter (replay)
+# run blocking(backend) instead.
+def run_async(work, blocking):
+    def run(backend):
+        adapter = async_adapter(backend)
+        if adapter is None:
+            return blocking(backend)
+        return asyncio.run(work(adapter))
+    return module.run(run, UNAVAILABLE)
+
+# get_txs plus fill_heights on the async adapters, with concurrent calls
+def get_txs_concurrently(txids, tx_heights=False):
+    txids = list(txids)
+    return run_async(
+        lambda adapter: fetch_txs_with_heights(adapter, heights, txids, tx_heights),
+        lambda backend: fill_heights(backend.get_txs(txids), tx_heights),
+    )
+
+# fill_heights with the missing heights looked up concurrently
+def fill_heights_concurrently(txs, tx_heights=False):
+    return run_async(
+        lambda adapter: fill_heights_async(adapter, heights, txs, tx_heights),
+        lambda backend: fill_heights(txs, tx_heights),
+    )
@@ -0,0 +1,235 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from fingerprinting import RULES_HASH, classify_code, wallet_label
+from tx_model import ScriptType
+
+# Local store of fingerprinting results keyed by txid. A confirmed tx always
+# gets the same verdict, so once stored it is answered with one indexed
+# lookup instead of refetching the tx and its prevouts upstream.
+
+class Fingerprint(NamedTuple):
+    txid: str
+    wallet: str
+    wallet_mask: int
+    reasoning: Tuple[str, ...]
+    feature_code: int
+    # None if not known, -1 if unconfirmed
+    height: Optional[int]
+    version: int
+    locktime: int
+    input_types: Tuple[ScriptType, ...]
+    output_types: Tuple[ScriptType, ...]
+
+    @property
+    def confirmed(self):
+        return self.height is not None and self.height >= 0
+
+def fingerprint(features, height=None):
+    mask, reasoning = classify_code(features.code)
+    return Fingerprint(
+        features.txid, wallet_label(mask), mask, reasoning, features.code, height,
+        features.version, features.locktime, features.input_types, features.output_types,
+    )
+
+# Wallet distribution of one block, kept by the tip follower
+class BlockSummary(NamedTuple):
+    hash: str
+    height: int
+    prev_hash: Optional[str]
+    wallets: Dict[str, int]
+    analyzed_at: float
+
+    @property
+    def total_transactions(self):
+        return sum(self.wallets.values())
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS fingerprints (
+    txid TEXT PRIMARY KEY,
+    wallet TEXT NOT NULL,
+    wallet_mask INTEGER NOT NULL,
+    reasoning TEXT NOT NULL,
+    feature_code INTEGER NOT NULL,
+    height INTEGER,
+    version INTEGER NOT NULL,
+    locktime INTEGER NOT NULL,
+    input_types BLOB NOT NULL,
+    output_types BLOB NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS fingerprints_wallet ON fingerprints (wallet);
+CREATE INDEX IF NOT EXISTS fingerprints_height ON fingerprints (height);
+CREATE TABLE IF NOT EXISTS address_txs (
+    address TEXT NOT NULL,
+    txid TEXT NOT NULL,
+    PRIMARY KEY (address, txid)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS block_summaries (
+    hash TEXT PRIMARY KEY,
+    height INTEGER NOT NULL,
+    prev_hash TEXT,
+    wallets TEXT NOT NULL,
+    analyzed_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS block_summaries_height ON block_summaries (height);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+_COLUMNS = "txid, wallet, wallet_mask, reasoning, feature_code, height, version, locktime, input_types, output_types"
+
+# sqlite limits the number of bound parameters per statement
+_MAX_PARAMS = 500
+
+def _to_row(record):
+    return (
+        record.txid, record.wallet, record.wallet_mask, json.dumps(record.reasoning),
+        record.feature_code, record.height, record.version, record.locktime,
+        bytes(record.input_types), bytes(record.output_types),
+    )
+
+def _from_row(row):
+    txid, wallet, mask, reasoning, code, height, version, locktime, input_types, output_types = row
+    return Fingerprint(
+        txid, wallet, mask, tuple(json.loads(reasoning)), code, height, version, locktime,
+        tuple(ScriptType(t) for t in input_types), tuple(ScriptType(t) for t in output_types),
+    )
+
+class FingerprintStore:
+    def __init__(self, path):
+        self.path = path
+        # sqlite connections can't be shared across the server's threads
+        self._local = threading.local()
+        with self._connection() as db:
+            db.executescript(_SCHEMA)
+        self._reclassify()
+
+    def _connection(self):
+        # one connection per thread, and a new one in forked worker processes
+        db = getattr(self._local, "db", None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    # Verdicts follow from the stored feature code, so when the wallet rules
+    # change every row is classified again instead of being answered stale
+    def _reclassify(self):
+        with self._connection() as db:
+            row = db.execute("SELECT value FROM meta WHERE key = 'rules'").fetchone()
+            if row and row[0] == RULES_HASH:
+                return
+            verdicts = {}
+            updates = []
+            for txid, code in db.execute("SELECT txid, feature_code FROM fingerprints").fetchall():
+                verdict = verdicts.get(code)
+                if verdict is None:
+                    mask, reasoning = classify_code(code)
+                    verdict = verdicts[code] = (wallet_label(mask), mask, json.dumps(reasoning))
+                updates.append(verdict + (txid,))
+            db.executemany("UPDATE fingerprints SET wallet = ?, wallet_mask = ?, reasoning = ? WHERE txid = ?", updates)
+            db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('rules', ?)", (RULES_HASH,))
+
+    def get(self, txid):
+        row = self._connection().execute(
+            f"SELECT {_COLUMNS} FROM fingerprints WHERE txid = ?", (txid,)
+        ).fetchone()
+        return _from_row(row) if row else None
+
+    def get_many(self, txids):
+        db = self._connection()
+        txids = list(txids)
+        found = {}
+        for i in range(0, len(txids), _MAX_PARAMS):
+            chunk = txids[i:i + _MAX_PARAMS]
+            rows = db.execute(
+                f"SELECT {_COLUMNS} FROM fingerprints WHERE txid IN ({','.join('?' * len(chunk))})", chunk
+            )
+            for row in rows:
+                found[row[0]] = _from_row(row)
+        return found
+
+    def put(self, records):
+        with self._connection() as db:
+            db.executemany(
+                f"INSERT OR REPLACE INTO fingerprints ({_COLUMNS}) VALUES ({','.join('?' * 10)})",
+                [_to_row(record) for record in records],
+            )
+
+    def link_address(self, address, txids):
+        with self._connection() as db:
+            db.executemany(
+                "INSERT OR IGNORE INTO address_txs (address, txid) VALUES (?, ?)",
+                [(address, txid) for txid in txids],
+            )
+
+    def by_address(self, address):
+        rows = self._connection().execute(
+            f"SELECT {_COLUMNS} FROM fingerprints WHERE txid IN (SELECT txid FROM address_txs WHERE address = ?)",
+            (address,),
+        )
+        return [_from_row(row) for row in rows]
+
+    def by_wallet(self, wallet, limit=100):
+        rows = self._connection().execute(
+            f"SELECT {_COLUMNS} FROM fingerprints WHERE wallet = ? LIMIT ?", (wallet, limit)
+        )
+        return [_from_row(row) for row in rows]
+
+    def by_height(self, start_height, end_height):
+        rows = self._connection().execute(
+            f"SELECT {_COLUMNS} FROM fingerprints WHERE height BETWEEN ? AND ? ORDER BY height",
+            (start_height, end_height),
+        )
+        return [_from_row(row) for row in rows]
+
+    def put_block_summary(self, block_hash, height, prev_hash, wallets):
+        summary = BlockSummary(block_hash, height, prev_hash, dict(wallets), time.time())
+        with self._connection() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO block_summaries (hash, height, prev_hash, wallets, analyzed_at) VALUES (?, ?, ?, ?, ?)",
+                (summary.hash, summary.height, summary.prev_hash, json.dumps(summary.wallets), summary.analyzed_at),
+            )
+        return summary
+
+    def get_block_summary(self, block_hash):
+        row = self._connection().execute(
+            "SELECT hash, height, prev_hash, wallets, analyzed_at FROM block_summaries WHERE hash = ?", (block_hash,)
+        ).fetchone()
+        return _summary_from_row(row) if row else None
+
+    def recent_block_summaries(self, limit=10):
+        rows = self._connection().execute(
+            "SELECT hash, height, prev_hash, wallets, analyzed_at FROM block_summaries ORDER BY height DESC LIMIT ?",
+            (limit,),
+        )
+        return [_summary_from_row(row) for row in rows]
+
+    def tip_block_summary(self):
+        summaries = self.recent_block_summaries(1)
+        return summaries[0] if summaries else None
+
+    # Drops the summaries of blocks at or above height, used on reorgs
+    def delete_block_summaries_from(self, height):
+        with self._connection() as db:
+            return db.execute("DELETE FROM block_summaries WHERE height >= ?", (height,)).rowcount
+
+def _summary_from_row(row):
+    block_hash, height, prev_hash, wallets, analyzed_at = row
+    return BlockSummary(block_hash, height, prev_hash, json.loads(wallets), analyzed_at)
+
+# FINGERPRINT_DB sets the sqlite file, an empty value disables the store
+def open_store(path=None):
+    path = os.environ.get("FINGERPRINT_DB", "fingerprints.db") if path is None else path
+    if not path:
+        return None
+    return FingerprintStore(path)
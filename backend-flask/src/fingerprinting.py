@@ -1,7 +1,18 @@
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 from enum import Enum
+from functools import cached_property
+import hashlib
+import os
+import time
+from typing import List, NamedTuple, Optional, Tuple
+import numpy as np
 from tqdm.auto import tqdm
 
-from fetch_txs import module, get_confirmation_height
+from fetch_txs import module, get_confirmation_height, get_confirmation_heights, fill_heights, get_txs_concurrently
+from fetch_txs import heights as height_resolver
+from heuristic_profile import HeuristicProfile
+from tx_model import ScriptType, UNCOMPRESSED_PUBKEY_PREFIXES
 
 class InputSortingType(Enum):
     SINGLE = 0
@@ -30,127 +41,181 @@ class Wallets(Enum):
     UNCLEAR = "Unclear"
     OTHER = "Other"
 
+@dataclass(frozen=True)
+class TxFeatures:
+    txid: str
+    version: int
+    locktime: int
+    input_types: Tuple[ScriptType, ...]
+    output_types: Tuple[ScriptType, ...]
+    compressed_public_keys_only: bool
+    low_r_only: bool
+    signals_rbf: bool
+    multi_type_vin: bool
+    address_reuse: bool
+    change_index: int
+    change_type_matched_inputs: int
+    input_order: Tuple[InputSortingType, ...]
+    output_structure: Tuple[OutputStructureType, ...]
+    anti_fee_sniping: int
+
+    # packed feature code, see FEATURE_FIELDS
+    @cached_property
+    def code(self):
+        return encode_features(self)
+
+# Everything the heuristics need from a tx, collected in a single walk over
+# vin and vout. Pure: no upstream calls happen here.
+class _TxScan(NamedTuple):
+    input_types: List[ScriptType]
+    input_script_pub_keys: List[bytes]
+    input_amounts: List[int]
+    input_heights: List[Optional[int]]
+    prevouts: List[Tuple[str, int]]
+    output_types: List[ScriptType]
+    output_script_pub_keys: List[bytes]
+    output_amounts: List[int]
+    compressed_public_keys_only: bool
+    low_r_only: bool
+    signals_rbf: bool
+
+def _scan(tx):
+    input_types = []
+    input_script_pub_keys = []
+    input_amounts = []
+    input_heights = []
+    prevouts = []
+    compressed_only = True
+    low_r = True
+    rbf = False
+
+    for tx_in in tx.vin:
+        prevout = tx_in.prevout
+        input_types.append(prevout.script_type)
+        input_script_pub_keys.append(prevout.scriptpubkey)
+        input_amounts.append(prevout.value)
+        input_heights.append(prevout.height)
+        prevouts.append((tx_in.txid, tx_in.vout))
+        if tx_in.pubkey_prefix in UNCOMPRESSED_PUBKEY_PREFIXES:
+            compressed_only = False
+        if tx_in.r_len > 32:
+            low_r = False
+        if tx_in.sequence < 0xffffffff:
+            rbf = True
+
+    output_types = []
+    output_script_pub_keys = []
+    output_amounts = []
+
+    for tx_out in tx.vout:
+        output_types.append(tx_out.script_type)
+        output_script_pub_keys.append(tx_out.scriptpubkey)
+        output_amounts.append(tx_out.value)
+
+    return _TxScan(
+        input_types, input_script_pub_keys, input_amounts, input_heights, prevouts,
+        output_types, output_script_pub_keys, output_amounts,
+        compressed_only, low_r, rbf,
+    )
+
+def _is_ascending(values):
+    return all(a <= b for a, b in zip(values, values[1:]))
+
+def _is_descending(values):
+    return all(a >= b for a, b in zip(values, values[1:]))
+
 def get_spending_types(tx):
     types = []
-    for tx_in in tx["vin"]:
-        types.append(tx_in["prevout"]["scriptpubkey_type"])
+    for tx_in in tx.vin:
+        types.append(tx_in.prevout.script_type)
     return types
 
 def get_sending_types(tx):
     types = []
-    for tx_out in tx["vout"]:
-        types.append(tx_out["scriptpubkey_type"])
+    for tx_out in tx.vout:
+        types.append(tx_out.script_type)
     return types
 
 def compressed_public_keys_only(tx):
-    input_types = get_spending_types(tx)
-    for i, input_type in enumerate(input_types):
-        if input_type == "witness_v0_keyhash" or input_type == "v0_p2wpkh":
-            if tx["vin"][i]["witness"][1][1] == '4':
-                return False
-        elif input_type == "pubkeyhash" or input_type == "p2pkh":
-            if tx["vin"][i]["scriptsig_asm"][tx["vin"][i]["scriptsig_asm"].find(" ") + 2] == '4':
-                return False
+    for tx_in in tx.vin:
+        if tx_in.pubkey_prefix in UNCOMPRESSED_PUBKEY_PREFIXES:
+            return False
     return True
 
-def get_input_order(tx):
-    if len(tx["vin"]) == 1:
-        return [InputSortingType.SINGLE]
+def _input_order(prevouts, amounts, heights):
+    if len(prevouts) == 1:
+        return (InputSortingType.SINGLE,)
     sorting_types = []
-    amounts = []
-    prevouts = []
 
-    for tx_in in tx["vin"]:
-        prevouts.append(f"{tx_in['txid']}:{tx_in['vout']}")
-        amounts.append(tx_in["prevout"]["value"])
-
-    if sorted(amounts) == amounts:
+    if _is_ascending(amounts):
         sorting_types.append(InputSortingType.ASCENDING)
-    if sorted(amounts)[::-1] == amounts:
+    if _is_descending(amounts):
         sorting_types.append(InputSortingType.DESCENDING)
 
-    if sorted(prevouts) == prevouts:
+    # BIP69: by txid, then by vout as a number. Outpoints compared as
+    # "txid:vout" strings put vout 10 before vout 2.
+    if _is_ascending(prevouts):
         sorting_types.append(InputSortingType.BIP69)
 
-    prevout_conf_heights = {prevout: None for prevout in prevouts}
-
-    for prevout in prevouts:
-        txid = prevout[0:prevout.find(":")]
-        conf_height = get_confirmation_height(txid)
+    # prevout heights are often already known, the rest are resolved at once
+    unknown = [txid for (txid, _), conf_height in zip(prevouts, heights) if conf_height is None]
+    conf_heights = get_confirmation_heights(unknown) if unknown else {}
+    ordered_conf_heights = []
+    for (txid, _), conf_height in zip(prevouts, heights):
+        if conf_height is None:
+            conf_height = conf_heights[txid]
         if conf_height != -1:
-            prevout_conf_heights[prevout] = conf_height
-        else:
-            del prevout_conf_heights[prevout]
-
-    ordered_conf_heights = list(prevout_conf_heights.values())
+            ordered_conf_heights.append(conf_height)
 
-    if ordered_conf_heights == sorted(ordered_conf_heights):
+    if _is_ascending(ordered_conf_heights):
         sorting_types.append(InputSortingType.HISTORICAL)
 
     if len(sorting_types) == 0:
         sorting_types.append(InputSortingType.UNKNOWN)
-    return sorting_types
+    return tuple(sorting_types)
+
+def get_input_order(tx):
+    scan = _scan(tx)
+    return list(_input_order(scan.prevouts, scan.input_amounts, scan.input_heights))
 
 # Returns false if there is an r value of more than 32 bytes
 def low_r_only(tx):
-    input_types = get_spending_types(tx)
-    for i, input_type in enumerate(input_types):
-        if input_type == "witness_v0_keyhash":
-            r_len = tx["vin"][i]["witness"][0][6:8]
-            if int(r_len, 16) > 32:
-                return False
-        elif input_type == "pubkeyhash":
-            r_len = tx["vin"][i]["scriptsig_asm"][6:8]
-            if int(r_len, 16) > 32:
-                return False
-        elif input_type == "p2pkh":
-            signature = tx["vin"][i]["scriptsig_asm"].split(' ')[1]
-            r_len = signature[6:8]
-            if int(r_len, 16) > 32:
-                return False
-        elif input_type == "v0_p2wpkh":
-            r_len = tx["vin"][i]["witness"][0][6:8]
-            if int(r_len, 16) > 32:
-                return False
-            
+    for tx_in in tx.vin:
+        if tx_in.r_len > 32:
+            return False
     return True
 
-def get_change_index(tx):
-    vout = tx["vout"]
+def _change_index(scan):
+    output_types = scan.output_types
 
     # if single, return -1 as index
-    if len(vout) == 1:
+    if len(output_types) == 1:
         return -1
 
-    input_types = get_spending_types(tx)
-    output_types = get_sending_types(tx)
+    input_types = scan.input_types
 
-    # if all inputs are of the same type, and only one output of the outputs is of that type, 
+    # if all inputs are of the same type, and only one output of the outputs is of that type,
     if (len(set(input_types)) == 1):
         if output_types.count(input_types[0]) == 1:
             return output_types.index(input_types[0])
 
-
     # same as one of the input addresses
-    prev_txouts = [tx_in["prevout"] for tx_in in tx["vin"]]
-    input_script_pub_keys = [tx_out["scriptpubkey"] for tx_out in prev_txouts]
-    output_script_pub_keys = [tx_out["scriptpubkey"] for tx_out in vout]
+    output_script_pub_keys = scan.output_script_pub_keys
 
-    shared_address = list(set(output_script_pub_keys).intersection(set(input_script_pub_keys)))
+    shared_address = list(set(output_script_pub_keys).intersection(set(scan.input_script_pub_keys)))
 
     if len(shared_address) == 1 and output_script_pub_keys.count(shared_address[0]) == 1:
         return output_script_pub_keys.index(shared_address[0])
 
     # TODO: Unnecessary Input Heuristic: https://en.bitcoin.it/wiki/Privacy#Change_address_detection
-    # input_amounts = [tx_out["value"] for tx_out in prev_txouts]
-
-    output_amounts = [int(tx_out["value"] * 100000000) for tx_out in vout] # stored as satoshis
 
     possible_index = []
 
-    for i, amount in enumerate(output_amounts):
+    for i, amount in enumerate(scan.output_amounts):
         if amount % 100 != 0:
             possible_index.append(i)
+            if len(possible_index) > 1:
+                break
 
     if len(possible_index) == 1:
         return possible_index[0]
@@ -158,14 +223,17 @@ def get_change_index(tx):
     # else inconclusive, return -2
     return -2
 
-def get_output_structure(tx):
-    vout = tx["vout"]
-    if len(vout) == 1:
-        return [OutputStructureType.SINGLE]
+def get_change_index(tx):
+    return _change_index(_scan(tx))
+
+def _output_structure(scan, change_index):
+    amounts = scan.output_amounts
+    if len(amounts) == 1:
+        return (OutputStructureType.SINGLE,)
 
     output_structure = []
 
-    if len(vout) == 2:
+    if len(amounts) == 2:
         output_structure.append(OutputStructureType.DOUBLE)
     else:
         output_structure.append(OutputStructureType.MULTI)
@@ -174,31 +242,25 @@ def get_output_structure(tx):
 
     # Change Index
 
-    change_index = get_change_index(tx)
-
-    if change_index == len(tx["vout"]) - 1:
+    if change_index == len(amounts) - 1:
         output_structure.append(OutputStructureType.CHANGE_LAST)
 
     # BIP 69
-    amounts = []
-    outputs = []
-
-    for tx_out in vout:
-        amounts.append(tx_out["value"])
-        outputs.append(tx_out["scriptpubkey"])
 
     # There are duplicate amounts, so we also have to compare
     # by scriptPubKey
     if len(set(amounts)) != len(amounts):
-        if sorted(outputs) == outputs and sorted(amounts) == amounts:
+        if _is_ascending(scan.output_script_pub_keys) and _is_ascending(amounts):
             output_structure.append(OutputStructureType.BIP69)
-            return output_structure
     else:
-        if sorted(amounts) == amounts:
+        if _is_ascending(amounts):
             output_structure.append(OutputStructureType.BIP69)
-            return output_structure
 
-    return output_structure
+    return tuple(output_structure)
+
+def get_output_structure(tx):
+    scan = _scan(tx)
+    return list(_output_structure(scan, _change_index(scan)))
 
 def has_multi_type_vin(tx):
     input_types = get_spending_types(tx)
@@ -211,26 +273,21 @@ def has_multi_type_vin(tx):
 # 1 if very likely
 # Note: also add if there isn't OP_CLTV in one of the inputs
 def is_anti_fee_sniping(tx):
-    locktime = tx["locktime"]
+    locktime = tx.locktime
     if locktime == 0:
         return -1
-    tx_height = get_confirmation_height(tx["txid"])
+    tx_height = tx.height if tx.height is not None else get_confirmation_height(tx.txid)
     if tx_height - locktime >= 100:
         return 0
     return 1
 
-# 2 = no change / change inconclusive
-# 1 = it matched inputs
-# 0 = it matched neither/both inputs nor outputs
-# -1 = it matched outputs
-def change_type_matched_inputs(tx):
-    change_index = get_change_index(tx)
+def _change_type_matched_inputs(scan, change_index):
     if change_index < 0:
         return 2
-    change_type = tx["vout"][change_index]["scriptpubkey_type"]
+    change_type = scan.output_types[change_index]
 
-    input_types = get_spending_types(tx)
-    output_types = get_sending_types(tx)
+    input_types = scan.input_types
+    output_types = list(scan.output_types)
     output_types.remove(change_type)
 
     if change_type in output_types:
@@ -242,20 +299,23 @@ def change_type_matched_inputs(tx):
             return 1
         return 0 # neither
 
-def address_reuse(tx):
-    prev_txouts  = [tx_in["prevout"] for tx_in in tx["vin"]]
+# 2 = no change / change inconclusive
+# 1 = it matched inputs
+# 0 = it matched neither/both inputs nor outputs
+# -1 = it matched outputs
+def change_type_matched_inputs(tx):
+    scan = _scan(tx)
+    return _change_type_matched_inputs(scan, _change_index(scan))
 
-    input_script_pub_keys = [tx_out["scriptpubkey"] for tx_out in prev_txouts]
-    output_script_pub_keys = [tx_out["scriptpubkey"] for tx_out in tx["vout"]]
+def _address_reuse(scan):
+    return not set(scan.output_script_pub_keys).isdisjoint(scan.input_script_pub_keys)
 
-    shared_address = list(set(output_script_pub_keys).intersection(set(input_script_pub_keys)))
-    if shared_address:
-        return True
-    return False
+def address_reuse(tx):
+    return _address_reuse(_scan(tx))
 
 def signals_rbf(tx):
-    for tx_in in tx["vin"]:
-        if tx_in["sequence"] < 0xffffffff:
+    for tx_in in tx.vin:
+        if tx_in.sequence < 0xffffffff:
             return True
     return False
 
@@ -263,232 +323,430 @@ def signals_rbf(tx):
 def spends_unconfirmed(tx):
     pass
 
-def detect_wallet(tx):
-    possible_wallets = {
-        Wallets.BITCOIN_CORE,
-        Wallets.ELECTRUM,
-        Wallets.BLUE_WALLET,
-        Wallets.COINBASE,
-        Wallets.EXODUS,
-        Wallets.TRUST,
-        Wallets.TREZOR,
-        Wallets.LEDGER,
-    }
+# Per-heuristic profile of extract_features and detect_wallet, plus the
+# height fills feeding them, None when profiling is off. Set
+# PROFILE_HEURISTICS=1 or call set_profile().
+_profile = HeuristicProfile() if os.environ.get("PROFILE_HEURISTICS", "").lower() in ("1", "true", "yes") else None
+
+def set_profile(profile):
+    global _profile
+    _profile = profile
+
+def get_profile():
+    return _profile
+
+def _profiled(name, func, *args):
+    calls, hits = height_resolver.upstream_calls, height_resolver.cache_hits
+    start = time.perf_counter_ns()
+    result = func(*args)
+    _profile.record(
+        name, time.perf_counter_ns() - start,
+        height_resolver.upstream_calls - calls, height_resolver.cache_hits - hits,
+    )
+    return result
+
+# Runs an upstream step feeding the heuristics (the height fill, a prefetch
+# with heights) as its own profile entry, so the upstream calls and cache
+# hits it makes are counted. Just calls func when profiling is off.
+def profile_step(name, func, *args):
+    if _profile is None:
+        return func(*args)
+    return _profiled(name, func, *args)
+
+# extract_features with every heuristic timed separately
+def _extract_features_profiled(tx):
+    # the scan also collects compressed keys, low r and rbf signalling
+    scan = _profiled("scan", _scan, tx)
+    change_index = _profiled("change_index", _change_index, scan)
+
+    return TxFeatures(
+        txid=tx.txid,
+        version=tx.version,
+        locktime=tx.locktime,
+        input_types=tuple(scan.input_types),
+        output_types=tuple(scan.output_types),
+        compressed_public_keys_only=scan.compressed_public_keys_only,
+        low_r_only=scan.low_r_only,
+        signals_rbf=scan.signals_rbf,
+        multi_type_vin=_profiled("multi_type_vin", lambda: len(set(scan.input_types)) != 1),
+        address_reuse=_profiled("address_reuse", _address_reuse, scan),
+        change_index=change_index,
+        change_type_matched_inputs=_profiled("change_type_matched_inputs", _change_type_matched_inputs, scan, change_index),
+        input_order=_profiled("input_order", _input_order, scan.prevouts, scan.input_amounts, scan.input_heights),
+        output_structure=_profiled("output_structure", _output_structure, scan, change_index),
+        anti_fee_sniping=_profiled("anti_fee_sniping", is_anti_fee_sniping, tx),
+    )
+
+def extract_features(tx):
+    if _profile is not None:
+        return _extract_features_profiled(tx)
+    scan = _scan(tx)
+    change_index = _change_index(scan)
+
+    return TxFeatures(
+        txid=tx.txid,
+        version=tx.version,
+        locktime=tx.locktime,
+        input_types=tuple(scan.input_types),
+        output_types=tuple(scan.output_types),
+        compressed_public_keys_only=scan.compressed_public_keys_only,
+        low_r_only=scan.low_r_only,
+        signals_rbf=scan.signals_rbf,
+        multi_type_vin=len(set(scan.input_types)) != 1,
+        address_reuse=_address_reuse(scan),
+        change_index=change_index,
+        change_type_matched_inputs=_change_type_matched_inputs(scan, change_index),
+        input_order=_input_order(scan.prevouts, scan.input_amounts, scan.input_heights),
+        output_structure=_output_structure(scan, change_index),
+        anti_fee_sniping=is_anti_fee_sniping(tx),
+    )
+
+_CANDIDATE_WALLETS = (
+    Wallets.BITCOIN_CORE,
+    Wallets.ELECTRUM,
+    Wallets.BLUE_WALLET,
+    Wallets.COINBASE,
+    Wallets.EXODUS,
+    Wallets.TRUST,
+    Wallets.TREZOR,
+    Wallets.LEDGER,
+)
+
+WALLET_BITS = {wallet: 1 << i for i, wallet in enumerate(_CANDIDATE_WALLETS)}
+ALL_WALLETS_MASK = (1 << len(_CANDIDATE_WALLETS)) - 1
+
+def _only(*wallets):
+    mask = 0
+    for wallet in wallets:
+        mask |= WALLET_BITS[wallet]
+    return mask
+
+def _without(*wallets):
+    return ALL_WALLETS_MASK & ~_only(*wallets)
+
+# Bit layout of the packed feature code: field -> (shift, width).
+# version: 0 = nVersion 1, 1 = nVersion 2, 2 = non-standard
+# change_type: change_type_matched_inputs(tx) + 1
+# change_position: 0 = no change found, 1 = last output, 2 = any other output
+FEATURE_FIELDS = {
+    "anti_fee_sniping": (0, 1),
+    "uncompressed_public_keys": (1, 1),
+    "version": (2, 2),
+    "high_r": (4, 1),
+    "signals_rbf": (5, 1),
+    "sends_taproot": (6, 1),
+    "creates_op_return": (7, 1),
+    "spends_taproot": (8, 1),
+    "spends_p2wsh": (9, 1),
+    "spends_p2pkh": (10, 1),
+    "multi_type_vin": (11, 1),
+    "change_type": (12, 2),
+    "address_reuse": (14, 1),
+    "multi_output": (15, 1),
+    "bip69_outputs": (16, 1),
+    "single_input": (17, 1),
+    "bip69_inputs": (18, 1),
+    "historical_inputs": (19, 1),
+    "change_position": (20, 2),
+}
+
+# The code is split in two halves with an exhaustive lookup table each.
+# Every rule must only read fields from one half.
+FEATURE_LOW_BITS = 12
+FEATURE_HIGH_BITS = 10
+
+# Wallet profiles: (conditions, reasoning, wallets still possible when the
+# conditions hold). Rules are listed in the order their reasoning is reported.
+WALLET_RULES = (
+    ({"anti_fee_sniping": 1}, "Anti-fee-sniping",
+        _only(Wallets.BITCOIN_CORE, Wallets.ELECTRUM)),
+    ({"anti_fee_sniping": 0}, "No Anti-fee-sniping",
+        _without(Wallets.BITCOIN_CORE, Wallets.ELECTRUM)),
+    ({"uncompressed_public_keys": 1}, "Uncompressed public key(s)", 0),
+    ({"uncompressed_public_keys": 0}, "All compressed public keys", ALL_WALLETS_MASK),
+    ({"version": 0}, "nVersion = 1",
+        _without(Wallets.BITCOIN_CORE, Wallets.ELECTRUM, Wallets.BLUE_WALLET,
+                 Wallets.EXODUS, Wallets.COINBASE)),
+    ({"version": 1}, "nVersion = 2",
+        _without(Wallets.LEDGER, Wallets.TREZOR, Wallets.TRUST)),
+    ({"version": 2}, "non-standard nVersion number", 0),
+    ({"high_r": 1}, "Not low-r-grinding",
+        _without(Wallets.BITCOIN_CORE, Wallets.ELECTRUM)),
+    ({"high_r": 0}, "Low r signatures only", ALL_WALLETS_MASK),
+    ({"signals_rbf": 1}, "signals RBF",
+        _without(Wallets.COINBASE, Wallets.EXODUS)),
+    ({"signals_rbf": 0}, "does not signal RBF",
+        _without(Wallets.BITCOIN_CORE, Wallets.ELECTRUM, Wallets.BLUE_WALLET,
+                 Wallets.LEDGER, Wallets.TREZOR, Wallets.TRUST)),
+    ({"sends_taproot": 1}, "Sends to taproot address",
+        _without(Wallets.COINBASE)),
+    ({"creates_op_return": 1}, "Creates OP_RETURN output",
+        _without(Wallets.COINBASE, Wallets.EXODUS, Wallets.BLUE_WALLET,
+                 Wallets.LEDGER, Wallets.TRUST)),
+    ({"spends_taproot": 1}, "Spends taproot output",
+        _without(Wallets.COINBASE, Wallets.EXODUS, Wallets.ELECTRUM,
+                 Wallets.BLUE_WALLET, Wallets.LEDGER, Wallets.TRUST)),
+    ({"spends_p2wsh": 1}, None,
+        _without(Wallets.COINBASE, Wallets.EXODUS, Wallets.TRUST, Wallets.TREZOR)),
+    ({"spends_p2pkh": 1}, "Spends P2PKH output",
+        _without(Wallets.EXODUS, Wallets.TRUST)),
+    ({"multi_type_vin": 1}, "Has multi-type vin",
+        _without(Wallets.EXODUS, Wallets.ELECTRUM, Wallets.BLUE_WALLET,
+                 Wallets.LEDGER, Wallets.TREZOR, Wallets.TRUST)),
+    # change matched outputs: Bitcoin Core is the only possible wallet
+    ({"change_type": 0}, "Change type matched outputs",
+        _only(Wallets.BITCOIN_CORE)),
+    ({"change_type": 2}, "Change type matched inputs",
+        _without(Wallets.BITCOIN_CORE)),
+    ({"address_reuse": 1}, "Address reuse between vin and vout",
+        _without(Wallets.COINBASE, Wallets.BITCOIN_CORE, Wallets.ELECTRUM,
+                 Wallets.BLUE_WALLET, Wallets.LEDGER, Wallets.TREZOR)),
+    ({"address_reuse": 0}, "No address reuse between vin and vout",
+        _without(Wallets.EXODUS, Wallets.TRUST)),
+    ({"multi_output": 1}, "More than 2 outputs",
+        _without(Wallets.COINBASE, Wallets.EXODUS, Wallets.LEDGER, Wallets.TRUST)),
+    ({"bip69_outputs": 0}, "BIP-69 not followed by outputs",
+        _without(Wallets.ELECTRUM, Wallets.TREZOR)),
+    ({"bip69_outputs": 1}, "BIP-69 followed by outputs", ALL_WALLETS_MASK),
+    ({"single_input": 0, "bip69_inputs": 0}, "BIP-69 not followed by inputs",
+        _without(Wallets.ELECTRUM, Wallets.TREZOR)),
+    ({"single_input": 0, "bip69_inputs": 1}, "BIP-69 followed by inputs", ALL_WALLETS_MASK),
+    ({"single_input": 0, "historical_inputs": 0}, "Inputs not ordered historically",
+        _without(Wallets.LEDGER)),
+    ({"single_input": 0, "historical_inputs": 1}, "Inputs ordered historically", ALL_WALLETS_MASK),
+    ({"change_position": 2}, "Last index is not change",
+        _without(Wallets.LEDGER, Wallets.BLUE_WALLET, Wallets.COINBASE)),
+    ({"change_position": 1}, "Last index is change", ALL_WALLETS_MASK),
+)
+
+def _compile_rules(rules, offset, bits):
+    compiled = []
+    for conditions, reason, mask in rules:
+        condition_mask = condition_value = 0
+        for field, value in conditions.items():
+            shift, width = FEATURE_FIELDS[field]
+            shift -= offset
+            if shift < 0 or shift + width > bits:
+                raise ValueError(f"wallet rule on {field} crosses the feature table split")
+            condition_mask |= ((1 << width) - 1) << shift
+            condition_value |= value << shift
+        compiled.append((condition_mask, condition_value, reason, mask))
+
+    table = []
+    for code in range(1 << bits):
+        possible_wallets = ALL_WALLETS_MASK
+        reasoning = []
+        for condition_mask, condition_value, reason, mask in compiled:
+            if code & condition_mask == condition_value:
+                possible_wallets &= mask
+                if reason:
+                    reasoning.append(reason)
+        table.append((possible_wallets, tuple(reasoning)))
+    return table
+
+def _split_rules(rules):
+    low, high = [], []
+    for rule in rules:
+        shifts = [FEATURE_FIELDS[field][0] for field in rule[0]]
+        if min(shifts) < FEATURE_LOW_BITS:
+            # reasoning is reported as low half + high half, so they must not interleave
+            if high:
+                raise ValueError("wallet rules on low feature bits must come first")
+            low.append(rule)
+        else:
+            high.append(rule)
+    return low, high
 
-    reasoning = []
+# identifies the rule set, stored verdicts are reclassified when it changes
+RULES_HASH = hashlib.sha256(repr((FEATURE_FIELDS, WALLET_RULES)).encode()).hexdigest()[:16]
 
-    # Anti-fee-sniping
-    if is_anti_fee_sniping(tx) != -1:
-        reasoning.append("Anti-fee-sniping")
-        # discard everything but Bitcoin Core and Electrum
-        possible_wallets = {
-            Wallets.BITCOIN_CORE,
-            Wallets.ELECTRUM,
-        }
-    else:
-        reasoning.append("No Anti-fee-sniping")
-        possible_wallets.discard(Wallets.BITCOIN_CORE)
-        possible_wallets.discard(Wallets.ELECTRUM)
-
-    # uncompressed public keys -> unknown
-    if not compressed_public_keys_only(tx):
-        reasoning.append("Uncompressed public key(s)")
-        possible_wallets = set()
-    else:
-        reasoning.append("All compressed public keys")
-
-    if tx["version"] == 1:
-        reasoning.append("nVersion = 1")
-        possible_wallets.discard(Wallets.BITCOIN_CORE)
-        possible_wallets.discard(Wallets.ELECTRUM)
-        possible_wallets.discard(Wallets.BLUE_WALLET)
-        possible_wallets.discard(Wallets.EXODUS)
-        possible_wallets.discard(Wallets.COINBASE)
-    elif tx["version"] == 2:
-        reasoning.append("nVersion = 2")
-        possible_wallets.discard(Wallets.LEDGER)
-        possible_wallets.discard(Wallets.TREZOR)
-        possible_wallets.discard(Wallets.TRUST)
-    else: # non-standard version number
-        reasoning.append("non-standard nVersion number")
-        possible_wallets = set()
-
-    if not low_r_only(tx):
-        reasoning.append("Not low-r-grinding")
-        possible_wallets.discard(Wallets.BITCOIN_CORE)
-        possible_wallets.discard(Wallets.ELECTRUM)
-    else:
-        reasoning.append("Low r signatures only")
+_low_rules, _high_rules = _split_rules(WALLET_RULES)
+LOW_TABLE = _compile_rules(_low_rules, 0, FEATURE_LOW_BITS)
+HIGH_TABLE = _compile_rules(_high_rules, FEATURE_LOW_BITS, FEATURE_HIGH_BITS)
+_FEATURE_LOW_MASK = (1 << FEATURE_LOW_BITS) - 1
 
-    if signals_rbf(tx):
-        reasoning.append("signals RBF")
-        possible_wallets.discard(Wallets.COINBASE)
-        possible_wallets.discard(Wallets.EXODUS)
-    else:
-        reasoning.append("does not signal RBF")
-        possible_wallets.discard(Wallets.BITCOIN_CORE)
-        possible_wallets.discard(Wallets.ELECTRUM)
-        possible_wallets.discard(Wallets.BLUE_WALLET)
-        possible_wallets.discard(Wallets.LEDGER)
-        possible_wallets.discard(Wallets.TREZOR)
-        possible_wallets.discard(Wallets.TRUST)
-        
-    sending_types = get_sending_types(tx)
-    if "witness_v1_taproot" in sending_types or "v1_p2tr" in sending_types:
-        reasoning.append("Sends to taproot address")
-        possible_wallets.discard(Wallets.COINBASE)
-
-    if "nulldata" in sending_types or "op_return" in sending_types:
-        reasoning.append("Creates OP_RETURN output")
-        possible_wallets.discard(Wallets.COINBASE)
-        possible_wallets.discard(Wallets.EXODUS)
-        possible_wallets.discard(Wallets.BLUE_WALLET)
-        possible_wallets.discard(Wallets.LEDGER)
-        possible_wallets.discard(Wallets.TRUST)
-        possible_wallets.discard(Wallets.COINBASE)
-
-    spending_types = get_spending_types(tx)
-
-    if "witness_v1_taproot" in spending_types or "v1_p2tr" in spending_types:
-        reasoning.append("Spends taproot output")
-        possible_wallets.discard(Wallets.COINBASE)
-        possible_wallets.discard(Wallets.EXODUS)
-        possible_wallets.discard(Wallets.ELECTRUM)
-        possible_wallets.discard(Wallets.BLUE_WALLET)
-        possible_wallets.discard(Wallets.LEDGER)
-        possible_wallets.discard(Wallets.TRUST)
-
-    if "witness_v0_scripthash" in spending_types or "v0_p2wsh" in spending_types:
-        possible_wallets.discard(Wallets.COINBASE)
-        possible_wallets.discard(Wallets.EXODUS)
-        possible_wallets.discard(Wallets.TRUST)
-        possible_wallets.discard(Wallets.TREZOR)
-
-    if "pubkeyhash" in spending_types or "p2pkh" in spending_types:
-        reasoning.append("Spends P2PKH output")
-        possible_wallets.discard(Wallets.EXODUS)
-        possible_wallets.discard(Wallets.TRUST)
-
-    if has_multi_type_vin(tx):
-        reasoning.append("Has multi-type vin")
-        possible_wallets.discard(Wallets.EXODUS)
-        possible_wallets.discard(Wallets.ELECTRUM)
-        possible_wallets.discard(Wallets.BLUE_WALLET)
-        possible_wallets.discard(Wallets.LEDGER)
-        possible_wallets.discard(Wallets.TREZOR)
-        possible_wallets.discard(Wallets.TRUST)
-
-    change_matched_inputs = change_type_matched_inputs(tx)
-    if change_matched_inputs == -1:
-        reasoning.append("Change type matched outputs")
-        # change matched outputs
-        if Wallets.BITCOIN_CORE in possible_wallets:
-            # bitcoin core is the only possible wallet
-            possible_wallets = {Wallets.BITCOIN_CORE}
-        else:
-            possible_wallets = set() # no other wallets possible
-    elif change_matched_inputs == 1:
-        reasoning.append("Change type matched inputs")
-        possible_wallets.discard(Wallets.BITCOIN_CORE)
-
-    if address_reuse(tx):
-        reasoning.append("Address reuse between vin and vout")
-        possible_wallets.discard(Wallets.COINBASE)
-        possible_wallets.discard(Wallets.BITCOIN_CORE)
-        possible_wallets.discard(Wallets.ELECTRUM)
-        possible_wallets.discard(Wallets.BLUE_WALLET)
-        possible_wallets.discard(Wallets.LEDGER)
-        possible_wallets.discard(Wallets.TREZOR)
-    else:
-        reasoning.append("No address reuse between vin and vout")
-        possible_wallets.discard(Wallets.EXODUS)
-        possible_wallets.discard(Wallets.TRUST)
-
-    input_order = get_input_order(tx)
-    output_structure = get_output_structure(tx)
-
-    if OutputStructureType.MULTI in output_structure:
-        reasoning.append("More than 2 outputs")
-        possible_wallets.discard(Wallets.COINBASE)
-        possible_wallets.discard(Wallets.EXODUS)
-        possible_wallets.discard(Wallets.LEDGER)
-        possible_wallets.discard(Wallets.TRUST)
-
-    if OutputStructureType.BIP69 not in output_structure:
-        reasoning.append("BIP-69 not followed by outputs")
-        possible_wallets.discard(Wallets.ELECTRUM)
-        possible_wallets.discard(Wallets.TREZOR)
-    else:
-        reasoning.append("BIP-69 followed by outputs")
+_WALLETS_BY_MASK = [
+    frozenset(wallet for wallet in _CANDIDATE_WALLETS if mask & WALLET_BITS[wallet]) or frozenset({Wallets.OTHER})
+    for mask in range(ALL_WALLETS_MASK + 1)
+]
 
-    if InputSortingType.SINGLE not in input_order:
-        if InputSortingType.BIP69 not in input_order:
-            reasoning.append("BIP-69 not followed by inputs")
-            possible_wallets.discard(Wallets.ELECTRUM)
-            possible_wallets.discard(Wallets.TREZOR)
-        else:
-            reasoning.append("BIP-69 followed by inputs")
-        
-        if InputSortingType.HISTORICAL not in input_order:
-            reasoning.append("Inputs not ordered historically")
-            possible_wallets.discard(Wallets.LEDGER)
-        else:
-            reasoning.append("Inputs ordered historically")
+def wallets_from_mask(mask):
+    return set(_WALLETS_BY_MASK[mask])
 
-    change_index = get_change_index(tx)
-    if change_index >= 0:
-        if change_index != len(tx["vout"]) - 1:
-            reasoning.append("Last index is not change")
-            possible_wallets.discard(Wallets.LEDGER)
-            possible_wallets.discard(Wallets.BLUE_WALLET)
-            possible_wallets.discard(Wallets.COINBASE)
+_VERSION_CLASSES = {1: 0, 2: 1}
 
-        else:
-            reasoning.append("Last index is change")
+def encode_features(features):
+    input_types = features.input_types
+    output_types = features.output_types
+    input_order = features.input_order
+    change_index = features.change_index
+    if change_index < 0:
+        change_position = 0
+    elif change_index == len(output_types) - 1:
+        change_position = 1
+    else:
+        change_position = 2
+
+    # shifts follow FEATURE_FIELDS
+    return (
+        (features.anti_fee_sniping != -1)
+        | (not features.compressed_public_keys_only) << 1
+        | _VERSION_CLASSES.get(features.version, 2) << 2
+        | (not features.low_r_only) << 4
+        | features.signals_rbf << 5
+        | (ScriptType.P2TR in output_types) << 6
+        | (ScriptType.OP_RETURN in output_types) << 7
+        | (ScriptType.P2TR in input_types) << 8
+        | (ScriptType.P2WSH in input_types) << 9
+        | (ScriptType.P2PKH in input_types) << 10
+        | features.multi_type_vin << 11
+        | (features.change_type_matched_inputs + 1) << 12
+        | features.address_reuse << 14
+        | (OutputStructureType.MULTI in features.output_structure) << 15
+        | (OutputStructureType.BIP69 in features.output_structure) << 16
+        | (InputSortingType.SINGLE in input_order) << 17
+        | (InputSortingType.BIP69 in input_order) << 18
+        | (InputSortingType.HISTORICAL in input_order) << 19
+        | change_position << 20
+    )
+
+def classify_code(code):
+    low_mask, low_reasoning = LOW_TABLE[code & _FEATURE_LOW_MASK]
+    high_mask, high_reasoning = HIGH_TABLE[code >> FEATURE_LOW_BITS]
+    return low_mask & high_mask, low_reasoning + high_reasoning
 
-    if len(possible_wallets) == 0:
-        # calculate the rest of the fingerprints
-        return {Wallets.OTHER}, reasoning
+def detect_wallet(tx):
+    features = tx if isinstance(tx, TxFeatures) else extract_features(tx)
+    if _profile is not None:
+        mask, reasoning = _profiled("classify", lambda: classify_code(features.code))
+    else:
+        mask, reasoning = classify_code(features.code)
+    return wallets_from_mask(mask), list(reasoning)
+
+def _script_type_bits(types):
+    bits = 0
+    for script_type in types:
+        bits |= 1 << script_type
+    return bits
+
+def feature_columns(features):
+    def column(values, dtype):
+        return np.fromiter(values, dtype=dtype, count=len(features))
+
+    return {
+        "version": column((f.version for f in features), np.int64),
+        "locktime": column((f.locktime for f in features), np.uint32),
+        "anti_fee_sniping": column((f.anti_fee_sniping for f in features), np.int8),
+        "signals_rbf": column((f.signals_rbf for f in features), bool),
+        "compressed_public_keys_only": column((f.compressed_public_keys_only for f in features), bool),
+        "low_r_only": column((f.low_r_only for f in features), bool),
+        "input_type_bits": column((_script_type_bits(f.input_types) for f in features), np.uint16),
+        "output_type_bits": column((_script_type_bits(f.output_types) for f in features), np.uint16),
+        "multi_type_vin": column((f.multi_type_vin for f in features), bool),
+        "address_reuse": column((f.address_reuse for f in features), bool),
+        "change_index": column((f.change_index for f in features), np.int32),
+        "change_type_matched_inputs": column((f.change_type_matched_inputs for f in features), np.int8),
+        "outputs_count": column((len(f.output_types) for f in features), np.int32),
+        "single_input": column((InputSortingType.SINGLE in f.input_order for f in features), bool),
+        "bip69_inputs": column((InputSortingType.BIP69 in f.input_order for f in features), bool),
+        "historical_inputs": column((InputSortingType.HISTORICAL in f.input_order for f in features), bool),
+        "multi_output": column((OutputStructureType.MULTI in f.output_structure for f in features), bool),
+        "bip69_outputs": column((OutputStructureType.BIP69 in f.output_structure for f in features), bool),
+    }
 
-    return possible_wallets, reasoning
+_LOW_MASKS = np.array([mask for mask, _ in LOW_TABLE], dtype=np.uint8)
+_HIGH_MASKS = np.array([mask for mask, _ in HIGH_TABLE], dtype=np.uint8)
+
+def encode_feature_columns(columns):
+    version = columns["version"]
+    change_index = columns["change_index"]
+    input_type_bits = columns["input_type_bits"]
+    output_type_bits = columns["output_type_bits"]
+
+    fields = {
+        "anti_fee_sniping": columns["anti_fee_sniping"] != -1,
+        "uncompressed_public_keys": ~columns["compressed_public_keys_only"],
+        "version": np.where(version == 1, 0, np.where(version == 2, 1, 2)),
+        "high_r": ~columns["low_r_only"],
+        "signals_rbf": columns["signals_rbf"],
+        "sends_taproot": output_type_bits & (1 << ScriptType.P2TR) != 0,
+        "creates_op_return": output_type_bits & (1 << ScriptType.OP_RETURN) != 0,
+        "spends_taproot": input_type_bits & (1 << ScriptType.P2TR) != 0,
+        "spends_p2wsh": input_type_bits & (1 << ScriptType.P2WSH) != 0,
+        "spends_p2pkh": input_type_bits & (1 << ScriptType.P2PKH) != 0,
+        "multi_type_vin": columns["multi_type_vin"],
+        "change_type": columns["change_type_matched_inputs"] + 1,
+        "address_reuse": columns["address_reuse"],
+        "multi_output": columns["multi_output"],
+        "bip69_outputs": columns["bip69_outputs"],
+        "single_input": columns["single_input"],
+        "bip69_inputs": columns["bip69_inputs"],
+        "historical_inputs": columns["historical_inputs"],
+        "change_position": np.where(
+            change_index < 0, 0, np.where(change_index == columns["outputs_count"] - 1, 1, 2)
+        ),
+    }
 
-def analyze_txs(transactions):
+    codes = np.zeros(len(version), dtype=np.int64)
+    for field, (shift, _) in FEATURE_FIELDS.items():
+        codes |= fields[field].astype(np.int64) << shift
+    return codes
+
+def classify_codes(codes):
+    codes = np.asarray(codes, dtype=np.int64)
+    return _LOW_MASKS[codes & _FEATURE_LOW_MASK] & _HIGH_MASKS[codes >> FEATURE_LOW_BITS]
+
+def detect_wallets_batch(txs):
+    features = [tx if isinstance(tx, TxFeatures) else extract_features(tx) for tx in txs]
+    codes = encode_feature_columns(feature_columns(features))
+    masks = classify_codes(codes)
+    return [
+        (wallets_from_mask(mask), list(classify_code(code)[1]))
+        for mask, code in zip(masks.tolist(), codes.tolist())
+    ]
+
+def _wallet_label(mask):
+    wallets = _WALLETS_BY_MASK[mask]
+    if len(wallets) == 1:
+        return next(iter(wallets)).value
+    # This means that there are multiple possible wallets, and it is
+    # unclear which of them it is
+    return Wallets.UNCLEAR.value
+
+_LABELS_BY_MASK = [_wallet_label(mask) for mask in range(ALL_WALLETS_MASK + 1)]
+
+def wallet_label(mask):
+    return _LABELS_BY_MASK[mask]
+
+# fill=False when the txs already carry every height, nothing is resolved upstream
+def tally_wallets(txs, fill=True):
     wallets = {}
     for wallet_type in Wallets:
         wallets[wallet_type.value] =  {'total': 0, 'txs': []}
 
-    for txid in tqdm(transactions):
-        wallet, reasoning = detect_wallet(module.get_tx(txid))
-        if len(wallet) == 0:
-            wallets[Wallets.OTHER.value]['total'] +=1
-            wallets[Wallets.OTHER.value]['txs'].append(txid)
-        elif len(wallet) == 1:
-            wallets[list(wallet)[0].value]['total'] +=1
-            wallets[list(wallet)[0].value]['txs'].append(txid)
-        else:
-            # This means that there are multiple possible wallets, and it is
-            # unclear which of them it is
-            wallets[Wallets.UNCLEAR.value]['total'] +=1
-            wallets[Wallets.UNCLEAR.value]['txs'].append(txid)
+    if fill:
+        profile_step("fill_heights", fill_heights, txs)
+    features = [extract_features(tx) for tx in txs]
+    masks = classify_codes(encode_feature_columns(feature_columns(features)))
+
+    for tx, mask in zip(txs, masks.tolist()):
+        label = _LABELS_BY_MASK[mask]
+        wallets[label]['total'] +=1
+        wallets[label]['txs'].append(tx.txid)
 
     return wallets
 
+def analyze_txs(transactions, concurrent=False):
+    if concurrent:
+        return tally_wallets(profile_step("fetch_txs_with_heights", get_txs_concurrently, transactions))
+    return tally_wallets(module.get_txs(list(transactions)))
+
 def analyze_block(block_hash=None, num_of_txs=None, verbose=False):
     if not block_hash:
         block_hash = module.getbestblockhash()
 
-    transactions = module.getblocktxs(block_hash)
-
-    if num_of_txs:
-        if len(transactions) <= num_of_txs:
-            num_of_txs = None
-
-        num_of_txs += 1
-
-    # exclude the coinbase transaction
-    transactions = transactions[1:num_of_txs]
-
-    wallets = analyze_txs(transactions)
+    # the coinbase transaction is excluded
+    wallets = tally_wallets(module.get_block_txs(block_hash, num_of_txs))
     if (verbose):
         return wallets
 
@@ -496,6 +754,41 @@ def analyze_block(block_hash=None, num_of_txs=None, verbose=False):
         wallets[wallet_type.value] = wallets[wallet_type.value]['total']
     return wallets
 
+def analyze_block_range(start_height, end_height, workers=None, verbose=False):
+    """Analyzes every block from start_height to end_height (inclusive) and
+    merges them into one distribution. The blocks are sharded across a pool
+    of worker processes, each fetching and classifying its own blocks."""
+    # all block hashes in one batched lookup
+    block_hashes = module.getblockhashes(list(range(start_height, end_height + 1)))
+    workers = min(workers or os.cpu_count() or 1, len(block_hashes)) or 1
+
+    wallets = {}
+    for wallet_type in Wallets:
+        wallets[wallet_type.value] = {'total': 0, 'txs': []} if verbose else 0
+
+    def merge(block_wallets):
+        for label, result in block_wallets.items():
+            if verbose:
+                wallets[label]['total'] += result['total']
+                wallets[label]['txs'].extend(result['txs'])
+            else:
+                wallets[label] += result
+
+    if workers == 1:
+        for block_hash in tqdm(block_hashes):
+            merge(analyze_block(block_hash, verbose=verbose))
+        return wallets
+
+    # contiguous chunks keep the per-task overhead low on long ranges
+    chunksize = max(1, len(block_hashes) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(
+            analyze_block, block_hashes, [None] * len(block_hashes), [verbose] * len(block_hashes), chunksize=chunksize
+        )
+        for block_wallets in tqdm(results, total=len(block_hashes)):
+            merge(block_wallets)
+    return wallets
+
 if __name__ == '__main__':
     block_hash = "00000000000000000004bcc50688d02a74d778201a47cc704a877d1442a58431"
     print(analyze_block(block_hash=block_hash, num_of_txs=100))
@@ -0,0 +1,134 @@
+import os
+import sqlite3
+import threading
+
+# Confirmation heights of txs, resolved from what is already known before
+# asking upstream: heights carried by the txs themselves, then a persistent
+# txid -> height index, then one batched backend lookup for the rest.
+# Only confirmed heights are persisted, unconfirmed txs are -1 until they
+# confirm.
+
+# sqlite limits the number of bound parameters per statement
+_MAX_PARAMS = 500
+
+class HeightIndex:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS heights (txid BLOB PRIMARY KEY, height INTEGER NOT NULL) WITHOUT ROWID")
+
+    def _connection(self):
+        # one connection per thread, and a new one in forked worker processes
+        db = getattr(self._local, "db", None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    def get_many(self, txids):
+        db = self._connection()
+        txids = list(txids)
+        found = {}
+        for i in range(0, len(txids), _MAX_PARAMS):
+            chunk = [bytes.fromhex(txid) for txid in txids[i:i + _MAX_PARAMS]]
+            rows = db.execute(
+                f"SELECT txid, height FROM heights WHERE txid IN ({','.join('?' * len(chunk))})", chunk
+            )
+            for txid, height in rows:
+                found[txid.hex()] = height
+        return found
+
+    def add(self, heights):
+        rows = [(bytes.fromhex(txid), height) for txid, height in heights.items() if height is not None and height >= 0]
+        if rows:
+            with self._connection() as db:
+                db.executemany("INSERT OR REPLACE INTO heights (txid, height) VALUES (?, ?)", rows)
+
+class HeightResolver:
+    def __init__(self, backend, index=None):
+        self.backend = backend
+        self.index = index
+        # running totals per thread, read by the heuristic profile as the
+        # difference around a step, which other threads must not move
+        self._counts = threading.local()
+
+    @property
+    def upstream_calls(self):
+        return getattr(self._counts, "upstream_calls", 0)
+
+    @upstream_calls.setter
+    def upstream_calls(self, value):
+        self._counts.upstream_calls = value
+
+    @property
+    def cache_hits(self):
+        return getattr(self._counts, "cache_hits", 0)
+
+    @cache_hits.setter
+    def cache_hits(self, value):
+        self._counts.cache_hits = value
+
+    # Returns {txid: height} with -1 for unconfirmed txs
+    def resolve(self, txids):
+        heights, missing = self.cached(txids)
+        if missing:
+            self.upstream_calls += 1
+            heights.update(self.remember(self.backend.getconfirmationheights(missing)))
+        return heights
+
+    # Splits txids into ({txid: height} found in the index, txids missing)
+    def cached(self, txids):
+        txids = list(dict.fromkeys(txids))
+        heights = self.index.get_many(txids) if self.index else {}
+        self.cache_hits += len(heights)
+        return heights, [txid for txid in txids if txid not in heights]
+
+    def remember(self, heights):
+        if self.index:
+            self.index.add(heights)
+        return heights
+
+    # Sets the heights the heuristics will read on txs and their prevouts,
+    # resolving all unknown ones at once. Known tx heights are indexed.
+    def fill(self, txs, tx_heights=False):
+        unknown = self.needed(txs, tx_heights)
+        if unknown:
+            self.apply(txs, self.resolve(unknown))
+        return txs
+
+    # Txids whose heights the heuristics need but txs don't carry, all tx
+    # heights with tx_heights
+    def needed(self, txs, tx_heights=False):
+        self.remember({tx.txid: tx.height for tx in txs})
+
+        unknown = set()
+        for tx in txs:
+            # a tx's own height is only read by the anti-fee-sniping check
+            if tx.height is None and (tx_heights or tx.locktime != 0):
+                unknown.add(tx.txid)
+            # only read when ordering several inputs
+            if len(tx.vin) > 1:
+                unknown.update(
+                    tx_in.txid for tx_in in tx.vin
+                    if tx_in.prevout is not None and tx_in.prevout.height is None
+                )
+        return unknown
+
+    def apply(self, txs, heights):
+        for tx in txs:
+            if tx.height is None and tx.txid in heights:
+                tx.height = heights[tx.txid]
+            for tx_in in tx.vin:
+                if tx_in.prevout is not None and tx_in.prevout.height is None and tx_in.txid in heights:
+                    tx_in.prevout.height = heights[tx_in.txid]
+        return txs
+
+# an empty path disables the index
+def open_height_index(path):
+    if not path:
+        return None
+    return HeightIndex(path)
@@ -0,0 +1,76 @@
+import threading
+
+# Per-heuristic profile of detect_wallet and the height fills feeding it:
+# wall time, upstream calls and height cache hits of every run, aggregated
+# in process. Times go into power-of-two nanosecond buckets, so the profile
+# stays a fixed size however many txs it sees and percentiles are read off
+# the buckets.
+
+_BUCKETS = 48
+
+class HeuristicStats:
+    __slots__ = ("runs", "total_ns", "max_ns", "upstream_calls", "cache_hits", "buckets")
+
+    def __init__(self):
+        self.runs = 0
+        self.total_ns = 0
+        self.max_ns = 0
+        self.upstream_calls = 0
+        self.cache_hits = 0
+        # bucket i counts runs that took [2**(i-1), 2**i) ns
+        self.buckets = [0] * _BUCKETS
+
+    def add(self, ns, upstream_calls, cache_hits):
+        self.runs += 1
+        self.total_ns += ns
+        self.max_ns = max(self.max_ns, ns)
+        self.upstream_calls += upstream_calls
+        self.cache_hits += cache_hits
+        self.buckets[min(ns.bit_length(), _BUCKETS - 1)] += 1
+
+    # upper bound of the bucket holding the q-th quantile
+    def percentile(self, q):
+        if not self.runs:
+            return 0
+        rank = q * self.runs
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(1 << i, self.max_ns)
+        return self.max_ns
+
+    def summary(self):
+        return {
+            "runs": self.runs,
+            "mean_ns": self.total_ns // self.runs if self.runs else 0,
+            "p50_ns": self.percentile(0.5),
+            "p90_ns": self.percentile(0.9),
+            "p99_ns": self.percentile(0.99),
+            "max_ns": self.max_ns,
+            "total_ms": self.total_ns / 1e6,
+            "upstream_calls": self.upstream_calls,
+            "cache_hits": self.cache_hits,
+        }
+
+class HeuristicProfile:
+    def __init__(self):
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def record(self, heuristic, ns, upstream_calls=0, cache_hits=0):
+        with self._lock:
+            stats = self._stats.get(heuristic)
+            if stats is None:
+                stats = self._stats[heuristic] = HeuristicStats()
+            stats.add(ns, upstream_calls, cache_hits)
+
+    # heuristics by total time spent, slowest first
+    def summary(self):
+        with self._lock:
+            summaries = {name: stats.summary() for name, stats in self._stats.items()}
+        return dict(sorted(summaries.items(), key=lambda item: -item[1]["total_ms"]))
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
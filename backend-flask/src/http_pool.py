@@ -0,0 +1,138 @@
+import json
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Shared HTTP layer for every upstream call. Each host gets its own
+# keep-alive session and connection pool, so repeated calls reuse an open
+# TCP/TLS connection instead of a new handshake each time. Calls get
+# connect/read timeouts and are retried with jittered backoff on 429 and 5xx,
+# except JSON-RPC errors.
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# Bitcoin Core answers every JSON-RPC error (unknown txid, bad block hash)
+# with a 500 and the error object as body. Those fail the same way again,
+# only the other 429/5xx are worth retrying.
+def is_transient(status, body):
+    if status not in RETRY_STATUSES:
+        return False
+    if status == 500:
+        try:
+            reply = json.loads(body)
+        except ValueError:
+            return True
+        if isinstance(reply, dict) and reply.get("error") is not None:
+            return False
+    return True
+
+def _pool_sizes(value):
+    # "mempool.space=20,127.0.0.1:8332=4", hosts as they appear in the URL
+    sizes = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        host, size = item.split("=")
+        sizes[host.strip()] = int(size)
+    return sizes
+
+class HttpPool:
+    def __init__(self, pool_size=10, pool_sizes=None, connect_timeout=5.0, read_timeout=30.0,
+                 retries=3, backoff=0.5, max_backoff=10.0):
+        self.pool_size = pool_size
+        self.pool_sizes = pool_sizes or {}
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._sessions = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _session(self, host):
+        if self._pid != os.getpid():
+            # forked worker process: open connections belong to the parent
+            with self._lock:
+                self._sessions = {}
+                self._stats = {}
+                self._pid = os.getpid()
+        session = self._sessions.get(host)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(host)
+                if session is None:
+                    size = self.pool_sizes.get(host, self.pool_size)
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=size)
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    self._sessions[host] = session
+                    self._stats[host] = {"requests": 0, "retries": 0, "errors": 0, "seconds": 0.0}
+        return session
+
+    def _count(self, host, key, amount=1):
+        with self._lock:
+            self._stats[host][key] += amount
+
+    def _delay(self, attempt, response):
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.max_backoff)
+        # full jitter, so clients that failed together don't retry together
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def request(self, method, url, **kwargs):
+        host = urlsplit(url).netloc
+        session = self._session(host)
+        kwargs.setdefault("timeout", self.timeout)
+
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                response = session.request(method, url, **kwargs)
+            except requests.exceptions.RequestException:
+                self._count(host, "errors")
+                raise
+            finally:
+                self._count(host, "requests")
+                self._count(host, "seconds", time.perf_counter() - start)
+
+            if attempt >= self.retries or not is_transient(response.status_code, response.content):
+                return response
+            self._count(host, "retries")
+            time.sleep(self._delay(attempt, response))
+            attempt += 1
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    # Per host call counts and, from the underlying connection pools, how
+    # many connections were opened: every other request reused one
+    def stats(self):
+        stats = {}
+        with self._lock:
+            for host, session in self._sessions.items():
+                pools = session.get_adapter(f"http://{host}").poolmanager.pools
+                connections = sum(pools[key].num_connections for key in pools.keys())
+                host_stats = dict(self._stats[host])
+                host_stats["connections"] = connections
+                host_stats["reused"] = max(0, host_stats["requests"] - connections)
+                host_stats["pool_size"] = self.pool_sizes.get(host, self.pool_size)
+                stats[host] = host_stats
+        return stats
+
+http = HttpPool(
+    pool_size=int(os.environ.get("HTTP_POOL_SIZE", 10)),
+    pool_sizes=_pool_sizes(os.environ.get("HTTP_POOL_SIZES", "")),
+    connect_timeout=float(os.environ.get("HTTP_CONNECT_TIMEOUT", 5)),
+    read_timeout=float(os.environ.get("HTTP_READ_TIMEOUT", 30)),
+    retries=int(os.environ.get("HTTP_RETRIES", 3)),
+)
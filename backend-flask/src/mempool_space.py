@@ -1,51 +1,154 @@
 import json
-import requests
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from http_pool import http
+from tx_model import Tx, TxIn, TxOut, script_type
+
+# esplora serves a block's txs, with their prevouts, in pages of this size
+PAGE_SIZE = 25
+# pages of a block fetched at once
+PAGE_WORKERS = int(os.environ.get("MEMPOOL_PAGE_WORKERS", 8))
 
 class MempoolSpace:
     def __init__(self):
         pass
 
     def normalize_tx(self, tx):
-        for tx_out in tx["vout"]:
-            tx_out["value"] = tx_out["value"] / 100000000
-        return tx
+        vin = []
+        for tx_in in tx["vin"]:
+            prevout = self.normalize_txout(tx_in["prevout"]) if tx_in["prevout"] else None
+            vin.append(TxIn.from_scripts(
+                tx_in["txid"],
+                tx_in["vout"],
+                tx_in["sequence"],
+                prevout,
+                bytes.fromhex(tx_in["scriptsig"]),
+                [bytes.fromhex(item) for item in tx_in.get("witness", [])],
+            ))
+        vout = [self.normalize_txout(tx_out) for tx_out in tx["vout"]]
+        status = tx.get("status", {})
+        height = status["block_height"] if status.get("confirmed") else -1 if status else None
+        return Tx(tx["txid"], tx["version"], tx["locktime"], vin, vout, height)
+
+    def normalize_txout(self, txout):
+        return TxOut(txout["value"], script_type(txout["scriptpubkey_type"]), bytes.fromhex(txout["scriptpubkey"]))
 
     def get_tx(self, txid):
         return self.normalize_tx(self.getdecodedtransaction(txid))
 
+    def get_txs(self, txids):
+        return [self.get_tx(txid) for txid in txids]
+
+    # Full txs come in pages of PAGE_SIZE, fetched concurrently, instead of
+    # one call per txid
+    def get_block_txs(self, block_hash, num_of_txs=None):
+        tx_count = self.getblockheader(block_hash)["tx_count"]
+        if num_of_txs:
+            tx_count = min(tx_count, num_of_txs + 1)
+        starts = range(0, tx_count, PAGE_SIZE)
+        with ThreadPoolExecutor(max_workers=min(PAGE_WORKERS, len(starts)) or 1) as executor:
+            pages = executor.map(lambda start: self.getblocktxspage(block_hash, start), starts)
+            txs = [self.normalize_tx(tx) for page in pages for tx in page]
+        # exclude the coinbase transaction
+        return txs[1:tx_count]
+
     def getbestblockhash(self):
         URL = "https://mempool.space/api/blocks/tip/hash"
-        response = requests.request("GET", URL)
+        response = http.request("GET", URL)
 
         return response.text
 
+    def getblockhash(self, height):
+        URL = f"https://mempool.space/api/block-height/{height}"
+        response = http.request("GET", URL)
+
+        return response.text
+
+    # same height and previousblockhash keys as Core's getblockheader
+    def getblockheader(self, block_hash):
+        URL = f"https://mempool.space/api/block/{block_hash}"
+        response = http.request("GET", URL)
+
+        return json.loads(response.text)
+
+    def getblockhashes(self, heights):
+        return [self.getblockhash(height) for height in heights]
+
     def getblocktxs(self, block_hash):
         URL = f"https://mempool.space/api/block/{block_hash}/txids"
-        response = requests.request("GET", URL)
+        response = http.request("GET", URL)
 
         return json.loads(response.text)
 
+    def getblocktxspage(self, block_hash, start_index):
+        URL = f"https://mempool.space/api/block/{block_hash}/txs/{start_index}"
+        response = http.request("GET", URL)
+
+        return json.loads(response.text)
+
+    # chain_stats and mempool_stats tx counts of an address
+    def getaddress(self, address):
+        URL = f"https://mempool.space/api/address/{address}"
+        response = http.request("GET", URL)
+        if response.status_code != 200:
+            raise Exception(f"API error: {response.status_code}")
+
+        return json.loads(response.text)
+
+    # Newest first: without last_txid the mempool txs and the first
+    # PAGE_SIZE confirmed ones, then the PAGE_SIZE confirmed txs after last_txid
+    def getaddresstxs(self, address, last_txid=None):
+        URL = f"https://mempool.space/api/address/{address}/txs"
+        if last_txid:
+            URL += f"/chain/{last_txid}"
+        response = http.request("GET", URL)
+        if response.status_code != 200:
+            raise Exception(f"API error: {response.status_code}")
+
+        return json.loads(response.text)
+
+    # Yields the address history one page at a time, fetching each page only
+    # when the previous one has been consumed
+    def iter_address_txs(self, address):
+        page = self.getaddresstxs(address)
+        while page:
+            yield page
+            confirmed = [tx for tx in page if tx["status"]["confirmed"]]
+            if len(confirmed) < PAGE_SIZE:
+                break
+            page = self.getaddresstxs(address, confirmed[-1]["txid"])
+
     def getrawmempool(self):
         URL = "https://mempool.space/api/mempool/txids"
-        response = requests.request("GET", URL)
+        response = http.request("GET", URL)
 
-        return response.text
+        return json.loads(response.text)
+
+    # mempool.space has no batch endpoint, one status call per tx
+    def getconfirmationheights(self, txids):
+        heights = {}
+        for txid in txids:
+            URL = f"https://mempool.space/api/tx/{txid}/status"
+            status = json.loads(http.request("GET", URL).text)
+            heights[txid] = status["block_height"] if status["confirmed"] else -1
+        return heights
 
     def getrawtransaction(self, txid):
         URL = f"https://mempool.space/api/tx/{txid}/hex"
-        response = requests.request("GET", URL)
+        response = http.request("GET", URL)
 
         return response.text
 
     def getdecodedtransaction(self, txid):
         URL = f"https://mempool.space/api/tx/{txid}"
-        response = requests.request("GET", URL)
+        response = http.request("GET", URL)
 
         return json.loads(response.text)
 
     def getblocks(self, start_height):
         URL = f"https://mempool.space/api/v1/blocks/{start_height}"
-        response = requests.request("GET", URL)
+        response = http.request("GET", URL)
         blocks = json.loads(response.text)
         
         return [block["id"] for block in blocks]
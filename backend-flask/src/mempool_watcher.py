@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Incremental mempool classifier.
+
+Keeps a live wallet distribution of the mempool. Each refresh diffs
+getrawmempool against the previous snapshot, classifies only the txs that
+arrived and evicts the ones that left (mined, replaced or expired), so a
+refresh costs the churn since the last one rather than the whole mempool.
+"""
+
+import argparse
+import sys
+import time
+
+from fetch_txs import height_index, heights as height_resolver, module
+from fingerprinting import (
+    Wallets, classify_codes, encode_feature_columns, extract_features, feature_columns, profile_step, wallet_label
+)
+from height_index import HeightResolver
+
+# txs fetched and classified per upstream batch
+BATCH_SIZE = 500
+
+class MempoolWatcher:
+    def __init__(self, backend=module, batch_size=BATCH_SIZE, heights=None):
+        self.backend = backend
+        # heights come from the same backend as the txs, through the shared
+        # height index
+        if heights is None:
+            heights = height_resolver if backend is module else HeightResolver(backend, height_index)
+        self.heights = heights
+        self.batch_size = batch_size
+        # snapshot: 32-byte txid digest -> wallet label
+        self.labels = {}
+        self.distribution = {wallet_type.value: 0 for wallet_type in Wallets}
+
+    # Applies the churn since the last refresh, returns (arrived, departed)
+    # counts. Txs that leave the mempool before they are fetched are picked
+    # up, or not, by the next refresh.
+    def refresh(self):
+        current = {bytes.fromhex(txid) for txid in self.backend.getrawmempool()}
+        departed = self.labels.keys() - current
+        arrived = [digest.hex() for digest in current - self.labels.keys()]
+
+        for digest in departed:
+            self.distribution[self.labels.pop(digest)] -= 1
+
+        classified = 0
+        for start in range(0, len(arrived), self.batch_size):
+            for txid, label in self.classify(arrived[start:start + self.batch_size]):
+                self.labels[bytes.fromhex(txid)] = label
+                self.distribution[label] += 1
+                classified += 1
+        return classified, len(departed)
+
+    # Returns (txid, label) for the txids still in the mempool
+    def classify(self, txids):
+        try:
+            txs = self.backend.get_txs(txids)
+        except Exception:
+            # a tx of the batch left the mempool, fetch the others one by one
+            txs = []
+            for txid in txids:
+                try:
+                    txs.append(self.backend.get_tx(txid))
+                except Exception:
+                    pass
+        if not txs:
+            return []
+
+        for tx in txs:
+            tx.height = -1
+        profile_step("fill_heights", self.heights.fill, txs)
+        masks = classify_codes(encode_feature_columns(feature_columns([extract_features(tx) for tx in txs])))
+        return [(tx.txid, wallet_label(mask)) for tx, mask in zip(txs, masks.tolist())]
+
+    @property
+    def size(self):
+        return len(self.labels)
+
+    def watch(self, interval=10):
+        while True:
+            start = time.time()
+            try:
+                arrived, departed = self.refresh()
+                print(
+                    f"Mempool {self.size} txs (+{arrived} -{departed}, {time.time() - start:.1f}s): {self.distribution}",
+                    file=sys.stderr,
+                )
+            except Exception as e:
+                print(f"Error refreshing the mempool: {e}", file=sys.stderr)
+            time.sleep(interval)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Keep a live wallet distribution of the mempool")
+    parser.add_argument("--interval", type=float, default=10, help="seconds between getrawmempool snapshots")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="txs fetched per upstream batch")
+    args = parser.parse_args(argv)
+
+    MempoolWatcher(batch_size=args.batch_size).watch(args.interval)
+
+if __name__ == "__main__":
+    main()
@@ -57,6 +57,7 @@ class AddressAnalysis:
     timeline: List[Dict[str, Any]]
     main_wallet: str
     pattern_type: str
+    analyzed_transactions: int = 0
 
 @dataclass
 class BlockAnalysis:
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Offline historical scanner over Bitcoin Core's blocks directory.
+
+Reads blocks from memory-mapped blk*.dat files and their prevouts from the
+matching rev*.dat undo files, so fingerprinting years of history needs no RPC
+at all. Writes one JSON line per block with its wallet distribution.
+"""
+
+import argparse
+import json
+import mmap
+import os
+import sys
+from collections import OrderedDict
+
+import numpy as np
+
+from fingerprinting import Wallets, tally_wallets
+from raw_tx import RawReader, classify_script, read_block, sha256d
+from tx_model import TxOut
+
+NETWORK_MAGIC = {
+    "mainnet": bytes.fromhex("f9beb4d9"),
+    "testnet3": bytes.fromhex("0b110907"),
+    "testnet4": bytes.fromhex("1c163f28"),
+    "signet": bytes.fromhex("0a03cf40"),
+    "regtest": bytes.fromhex("fabfb5da"),
+}
+
+_SECP256K1_P = 2**256 - 2**32 - 977
+
+# heights of recently scanned blocks kept for linking children to parents
+_HEIGHT_WINDOW = 10000
+
+def read_varint(reader):
+    # Bitcoin Core's VARINT (MSB base-128, used in undo data), not CompactSize
+    n = 0
+    while True:
+        ch = reader.u8()
+        n = (n << 7) | (ch & 0x7f)
+        if ch & 0x80:
+            n += 1
+        else:
+            return n
+
+def decompress_amount(x):
+    if x == 0:
+        return 0
+    x -= 1
+    e = x % 10
+    x //= 10
+    if e < 9:
+        d = x % 9 + 1
+        x //= 9
+        n = x * 10 + d
+    else:
+        n = x + 1
+    return n * 10 ** e
+
+def _decompress_pubkey(prefix, x):
+    x_int = int.from_bytes(x, "big")
+    y = pow((pow(x_int, 3, _SECP256K1_P) + 7) % _SECP256K1_P, (_SECP256K1_P + 1) // 4, _SECP256K1_P)
+    if y & 1 != prefix & 1:
+        y = _SECP256K1_P - y
+    return b"\x04" + bytes(x) + y.to_bytes(32, "big")
+
+def decompress_script(reader):
+    size = read_varint(reader)
+    if size == 0:
+        return b"\x76\xa9\x14" + bytes(reader.read(20)) + b"\x88\xac"
+    if size == 1:
+        return b"\xa9\x14" + bytes(reader.read(20)) + b"\x87"
+    if size in (2, 3):
+        return b"\x21" + bytes([size]) + bytes(reader.read(32)) + b"\xac"
+    if size in (4, 5):
+        return b"\x41" + _decompress_pubkey(size - 2, reader.read(32)) + b"\xac"
+    return bytes(reader.read(size - 6))
+
+def read_coin(reader):
+    code = read_varint(reader)
+    height = code >> 1
+    if height > 0:
+        # unused nVersion kept for compatibility with older undo data
+        read_varint(reader)
+    value = decompress_amount(read_varint(reader))
+    script = decompress_script(reader)
+    return TxOut(value, classify_script(script), script, height)
+
+# Prevouts of every non-coinbase tx in a block, in input order
+def read_block_undo(reader):
+    return [
+        [read_coin(reader) for _ in range(reader.compact_size())]
+        for _ in range(reader.compact_size())
+    ]
+
+def read_xor_key(blocks_dir):
+    path = os.path.join(blocks_dir, "xor.dat")
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        key = f.read()
+    return key if any(key) else None
+
+class _MappedFile:
+    """blk/rev file mapped read-only, de-obfuscated when Core uses xor.dat"""
+
+    def __init__(self, path, xor_key=None):
+        self._file = open(path, "rb")
+        if xor_key:
+            # a private copy-on-write mapping, de-obfuscated in place: the
+            # file is never written and the pages are copied once
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_COPY)
+            data = np.frombuffer(self._map, dtype=np.uint8)
+            key = np.frombuffer(xor_key, dtype=np.uint8)
+            whole = len(data) - len(data) % len(key)
+            np.bitwise_xor(data[:whole].reshape(-1, len(key)), key, out=data[:whole].reshape(-1, len(key)))
+            np.bitwise_xor(data[whole:], key[:len(data) - whole], out=data[whole:])
+            # the map can't be closed while numpy still holds a view of it
+            del data
+        else:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self._map)
+
+    def records(self, magic, trailer=0):
+        # trailer: bytes following each record, the undo checksum in rev files
+        view = self.view
+        pos = 0
+        while pos + 8 <= len(view):
+            # files are preallocated, zeros mark the unused tail
+            if view[pos:pos + 4] != magic:
+                break
+            size = int.from_bytes(view[pos + 4:pos + 8], "little")
+            yield pos + 8, size
+            pos += 8 + size + trailer
+
+    def close(self):
+        self.view.release()
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def scan_file_pair(blocks_dir, file_number, magic, xor_key=None, heights=None):
+    """Yields each block of blk<N>.dat that has undo data in rev<N>.dat, with
+    every prevout and height filled in. Undo records are written in the order
+    blocks were connected, so parents come before their children."""
+    blk_path = os.path.join(blocks_dir, f"blk{file_number:05d}.dat")
+    rev_path = os.path.join(blocks_dir, f"rev{file_number:05d}.dat")
+    heights = {} if heights is None else heights
+
+    with _MappedFile(blk_path, xor_key) as blk, _MappedFile(rev_path, xor_key) as rev:
+        # index blocks by tx count, undo records are matched to them by checksum
+        pending = []
+        for offset, size in blk.records(magic):
+            if not any(blk.view[offset + 4:offset + 36]):
+                # genesis has no undo data but anchors the heights
+                heights[sha256d(blk.view[offset:offset + 80])[::-1].hex()] = 0
+                continue
+            reader = RawReader(blk.view, offset + 80)
+            pending.append((offset, reader.compact_size()))
+
+        for offset, size in rev.records(magic, trailer=32):
+            undo = bytes(rev.view[offset:offset + size])
+            checksum = bytes(rev.view[offset + size:offset + size + 32])
+            undo_txs = RawReader(undo).compact_size()
+
+            match = None
+            for i, (block_offset, tx_count) in enumerate(pending):
+                if tx_count == undo_txs + 1 and \
+                        sha256d(blk.view[block_offset + 4:block_offset + 36], undo) == checksum:
+                    match = i
+                    break
+            if match is None:
+                continue
+            block_offset, _ = pending.pop(match)
+
+            block = read_block(RawReader(blk.view, block_offset))
+            # the parent link gives the height, otherwise the coinbase one
+            # read_block only keeps where BIP34 is enforced. Early blocks of
+            # unknown parent stay None, a garbage height would be passed on
+            # to their descendants.
+            if heights.get(block.prev_hash) is not None:
+                block.height = heights[block.prev_hash] + 1
+            if block.height is not None:
+                heights[block.hash] = block.height
+                if isinstance(heights, OrderedDict) and len(heights) > _HEIGHT_WINDOW:
+                    heights.popitem(last=False)
+
+            prevouts = read_block_undo(RawReader(undo))
+            for tx in block.txs:
+                tx.height = block.height
+            for tx, coins in zip(block.txs[1:], prevouts):
+                for tx_in, coin in zip(tx.vin, coins):
+                    tx_in.attach_prevout(coin)
+            yield block
+
+def scan_blocks_dir(blocks_dir, output, start_file=0, end_file=None, network="mainnet"):
+    magic = NETWORK_MAGIC[network]
+    xor_key = read_xor_key(blocks_dir)
+    heights = OrderedDict()
+    file_number = start_file
+    blocks = 0
+    unknown_heights = 0
+
+    while end_file is None or file_number <= end_file:
+        if not os.path.exists(os.path.join(blocks_dir, f"rev{file_number:05d}.dat")):
+            break
+        for block in scan_file_pair(blocks_dir, file_number, magic, xor_key, heights):
+            if block.height is None:
+                # no BIP34 height and the parent wasn't scanned: the heuristics
+                # would have to ask upstream for it
+                unknown_heights += 1
+                continue
+            # prevouts come with their heights from the undo data
+            wallets = tally_wallets(block.txs[1:], fill=False)
+            output.write(json.dumps({
+                "hash": block.hash,
+                "height": block.height,
+                "file": f"blk{file_number:05d}.dat",
+                "transactions": len(block.txs) - 1,
+                "wallets": {wallet.value: wallets[wallet.value]["total"] for wallet in Wallets},
+            }) + "\n")
+            blocks += 1
+        file_number += 1
+
+    if unknown_heights:
+        print(f"Skipped {unknown_heights} blocks of unknown height, start from an earlier file", file=sys.stderr)
+    return blocks
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fingerprint blocks straight from blk*.dat/rev*.dat files")
+    parser.add_argument("blocks_dir", help="Bitcoin Core blocks directory, e.g. ~/.bitcoin/blocks")
+    parser.add_argument("-o", "--output", help="JSON lines output file (default: stdout)")
+    parser.add_argument("--start-file", type=int, default=0)
+    parser.add_argument("--end-file", type=int)
+    parser.add_argument("--network", choices=sorted(NETWORK_MAGIC), default="mainnet")
+    args = parser.parse_args(argv)
+
+    blocks_dir = os.path.expanduser(args.blocks_dir)
+    output = open(args.output, "w") if args.output else sys.stdout
+    try:
+        blocks = scan_blocks_dir(blocks_dir, output, args.start_file, args.end_file, args.network)
+    finally:
+        if args.output:
+            output.close()
+    print(f"Scanned {blocks} blocks", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import os
+import sqlite3
+import struct
+import threading
+
+from tx_model import ScriptType, TxOut
+
+# On-disk outpoint index: txid:vout -> the output's value, script type,
+# scriptpubkey and confirmation height. Outputs never change once a tx
+# exists, so an entry stays valid forever and prevouts found here need no
+# upstream call. Keys are the raw txid followed by the vout; values pack the
+# value, height and type, then the script with its standard template stripped.
+
+_COIN = struct.Struct("<QIB")
+_VOUT = struct.Struct("<I")
+
+# (prefix, suffix) around the hash of each standard script
+_TEMPLATES = {
+    ScriptType.P2PKH: (b"\x76\xa9\x14", b"\x88\xac"),
+    ScriptType.P2SH: (b"\xa9\x14", b"\x87"),
+    ScriptType.P2WPKH: (b"\x00\x14", b""),
+    ScriptType.P2WSH: (b"\x00\x20", b""),
+    ScriptType.P2TR: (b"\x51\x20", b""),
+}
+
+# sqlite limits the number of bound parameters per statement
+_MAX_PARAMS = 500
+
+def outpoint_key(txid, vout):
+    return bytes.fromhex(txid) + _VOUT.pack(vout)
+
+def encode_coin(txout):
+    # heights are stored off by one so that 0 means unknown, unconfirmed
+    # outputs are stored as unknown since they may still confirm
+    height = txout.height + 1 if txout.height is not None and txout.height >= 0 else 0
+    script = txout.scriptpubkey
+    template = _TEMPLATES.get(txout.script_type)
+    if template:
+        script = script[len(template[0]):len(script) - len(template[1])]
+    return _COIN.pack(txout.value, height, txout.script_type) + script
+
+def decode_coin(data):
+    value, height, script_type = _COIN.unpack_from(data)
+    script_type = ScriptType(script_type)
+    script = bytes(data[_COIN.size:])
+    template = _TEMPLATES.get(script_type)
+    if template:
+        script = template[0] + script + template[1]
+    return TxOut(value, script_type, script, height - 1 if height else None)
+
+class OutpointIndex:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS outpoints (key BLOB PRIMARY KEY, coin BLOB NOT NULL) WITHOUT ROWID")
+
+    def _connection(self):
+        # one connection per thread, and a new one in forked worker processes
+        db = getattr(self._local, "db", None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    def get(self, txid, vout):
+        row = self._connection().execute(
+            "SELECT coin FROM outpoints WHERE key = ?", (outpoint_key(txid, vout),)
+        ).fetchone()
+        return decode_coin(row[0]) if row else None
+
+    # Returns {(txid, vout): TxOut} for the outpoints found
+    def get_many(self, outpoints):
+        db = self._connection()
+        keys = {outpoint_key(txid, vout): (txid, vout) for txid, vout in outpoints}
+        key_list = list(keys)
+        found = {}
+        for i in range(0, len(key_list), _MAX_PARAMS):
+            chunk = key_list[i:i + _MAX_PARAMS]
+            rows = db.execute(
+                f"SELECT key, coin FROM outpoints WHERE key IN ({','.join('?' * len(chunk))})", chunk
+            )
+            for key, coin in rows:
+                found[keys[key]] = decode_coin(coin)
+        return found
+
+    # Indexes every output of the given txs, at height if given. Entries
+    # with a known height replace existing ones, the others never do.
+    def add_txs(self, txs, height=None):
+        confirmed = []
+        unknown = []
+        for tx in txs:
+            tx_height = tx.height if height is None else height
+            rows = confirmed if tx_height is not None and tx_height >= 0 else unknown
+            txid = bytes.fromhex(tx.txid)
+            for vout, txout in enumerate(tx.vout):
+                if txout.script_type == ScriptType.OP_RETURN:
+                    # unspendable, never looked up as a prevout
+                    continue
+                coin = encode_coin(TxOut(txout.value, txout.script_type, txout.scriptpubkey, tx_height))
+                rows.append((txid + _VOUT.pack(vout), coin))
+
+        with self._connection() as db:
+            db.executemany("INSERT OR REPLACE INTO outpoints (key, coin) VALUES (?, ?)", confirmed)
+            db.executemany("INSERT OR IGNORE INTO outpoints (key, coin) VALUES (?, ?)", unknown)
+
+# an empty path disables the index
+def open_outpoint_index(path):
+    if not path:
+        return None
+    return OutpointIndex(path)
@@ -0,0 +1,196 @@
+import hashlib
+import struct
+
+from tx_model import Block, ScriptType, Tx, TxIn, TxOut
+
+# Parser for serialized (segwit-aware) transactions and blocks. It reads
+# straight from a memoryview over the raw bytes, so decoding never needs
+# decoderawtransaction.
+
+_U32 = struct.Struct("<I")
+_I32 = struct.Struct("<i")
+_U64 = struct.Struct("<Q")
+
+def classify_script(script):
+    size = len(script)
+    if size == 25 and script[0] == 0x76 and script[1] == 0xa9 and script[2] == 0x14 \
+            and script[23] == 0x88 and script[24] == 0xac:
+        return ScriptType.P2PKH
+    if size == 23 and script[0] == 0xa9 and script[1] == 0x14 and script[22] == 0x87:
+        return ScriptType.P2SH
+    if size == 22 and script[0] == 0x00 and script[1] == 0x14:
+        return ScriptType.P2WPKH
+    if size == 34 and script[0] == 0x00 and script[1] == 0x20:
+        return ScriptType.P2WSH
+    if size == 34 and script[0] == 0x51 and script[1] == 0x20:
+        return ScriptType.P2TR
+    if size > 0 and script[0] == 0x6a:
+        return ScriptType.OP_RETURN
+    if (size == 35 and script[0] == 0x21 or size == 67 and script[0] == 0x41) and script[-1] == 0xac:
+        return ScriptType.P2PK
+    if size >= 37 and 0x51 <= script[0] <= 0x60 and 0x51 <= script[-2] <= 0x60 and script[-1] == 0xae:
+        return ScriptType.MULTISIG
+    if 4 <= size <= 42 and 0x51 <= script[0] <= 0x60 and script[1] == size - 2:
+        return ScriptType.WITNESS_UNKNOWN
+    return ScriptType.UNKNOWN
+
+class RawReader:
+    __slots__ = ("view", "pos")
+
+    def __init__(self, data, pos=0):
+        self.view = data if isinstance(data, memoryview) else memoryview(data)
+        self.pos = pos
+
+    def read(self, size):
+        start = self.pos
+        end = start + size
+        if end > len(self.view):
+            raise ValueError("unexpected end of serialized data")
+        self.pos = end
+        return self.view[start:end]
+
+    def u8(self):
+        value = self.view[self.pos]
+        self.pos += 1
+        return value
+
+    def u32(self):
+        value = _U32.unpack_from(self.view, self.pos)[0]
+        self.pos += 4
+        return value
+
+    def i32(self):
+        value = _I32.unpack_from(self.view, self.pos)[0]
+        self.pos += 4
+        return value
+
+    def u64(self):
+        value = _U64.unpack_from(self.view, self.pos)[0]
+        self.pos += 8
+        return value
+
+    def compact_size(self):
+        size = self.u8()
+        if size < 0xfd:
+            return size
+        if size == 0xfd:
+            return int.from_bytes(self.read(2), "little")
+        if size == 0xfe:
+            return self.u32()
+        return self.u64()
+
+    def hash_hex(self):
+        # hashes are displayed byte-reversed
+        return bytes(self.read(32))[::-1].hex()
+
+def sha256d(*chunks):
+    inner = hashlib.sha256()
+    for chunk in chunks:
+        inner.update(chunk)
+    return hashlib.sha256(inner.digest()).digest()
+
+def read_txout(reader):
+    value = reader.u64()
+    script = bytes(reader.read(reader.compact_size()))
+    return TxOut(value, classify_script(script), script)
+
+def read_tx(reader):
+    view = reader.view
+    start = reader.pos
+    version = reader.i32()
+
+    segwit = view[reader.pos] == 0x00 and view[reader.pos + 1] != 0x00
+    if segwit:
+        reader.pos += 2
+    body_start = reader.pos
+
+    inputs = []
+    for _ in range(reader.compact_size()):
+        txid = reader.hash_hex()
+        vout = reader.u32()
+        scriptsig = reader.read(reader.compact_size())
+        sequence = reader.u32()
+        inputs.append((txid, vout, scriptsig, sequence))
+
+    vout = [read_txout(reader) for _ in range(reader.compact_size())]
+    body_end = reader.pos
+
+    witnesses = []
+    if segwit:
+        for _ in inputs:
+            witnesses.append([reader.read(reader.compact_size()) for _ in range(reader.compact_size())])
+    else:
+        witnesses = [()] * len(inputs)
+
+    locktime_pos = reader.pos
+    locktime = reader.u32()
+
+    txid = sha256d(
+        view[start:start + 4], view[body_start:body_end], view[locktime_pos:locktime_pos + 4]
+    )[::-1].hex()
+
+    vin = [
+        TxIn.from_scripts(prev_txid, prev_vout, sequence, None, scriptsig, witness)
+        for (prev_txid, prev_vout, scriptsig, sequence), witness in zip(inputs, witnesses)
+    ]
+    return Tx(txid, version, locktime, vin, vout)
+
+def parse_tx(data):
+    reader = RawReader(data)
+    tx = read_tx(reader)
+    if reader.pos != len(reader.view):
+        raise ValueError("trailing data after transaction")
+    return tx
+
+def parse_txout(data, index):
+    reader = RawReader(data)
+    reader.pos += 4
+    if reader.view[reader.pos] == 0x00 and reader.view[reader.pos + 1] != 0x00:
+        reader.pos += 2
+    for _ in range(reader.compact_size()):
+        reader.pos += 36
+        script_size = reader.compact_size()
+        reader.pos += script_size + 4
+    count = reader.compact_size()
+    if index >= count:
+        raise IndexError(f"output {index} out of range")
+    for _ in range(index):
+        reader.pos += 8
+        script_size = reader.compact_size()
+        reader.pos += script_size
+    return read_txout(reader)
+
+# BIP34 is enforced from this mainnet height on, in version 2+ blocks.
+# Earlier coinbases start with arbitrary data (block 100000's would read as
+# height 453281356).
+BIP34_HEIGHT = 227931
+
+# BIP34: the coinbase scriptSig starts with a push of the block height
+def coinbase_height(view, pos):
+    reader = RawReader(view, pos + 4)
+    if view[reader.pos] == 0x00 and view[reader.pos + 1] != 0x00:
+        reader.pos += 2
+    if reader.compact_size() != 1:
+        return None
+    reader.pos += 36
+    script = reader.read(reader.compact_size())
+    if not script or not 1 <= script[0] <= 8 or len(script) < 1 + script[0]:
+        return None
+    return int.from_bytes(script[1:1 + script[0]], "little")
+
+def read_block(reader):
+    view = reader.view
+    header = reader.read(80)
+    block_hash = sha256d(header)[::-1].hex()
+    prev_hash = bytes(header[4:36])[::-1].hex()
+
+    # None unless the coinbase height can be trusted, callers look it up
+    count = reader.compact_size()
+    height = coinbase_height(view, reader.pos) if count and _I32.unpack_from(header)[0] >= 2 else None
+    if height is not None and height < BIP34_HEIGHT:
+        height = None
+    txs = [read_tx(reader) for _ in range(count)]
+    return Block(block_hash, prev_hash, height, txs)
+
+def parse_block(data):
+    return read_block(RawReader(data))
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Record/replay backend.
+
+ReplayBackend serves the BitcoinCore/MempoolSpace interface from a
+gzip-compressed JSON corpus, with no network, so the fingerprinting path can
+be benchmarked and load-tested offline and deterministically. The corpus is
+captured from a live backend by RecordingBackend, which passes every call
+through and keeps what it returned:
+
+    replay_backend.py corpus.json.gz --tip --mempool 200 --block <hash> --tx <txid>
+
+Serve it with REPLAY_CORPUS=corpus.json.gz.
+"""
+
+import argparse
+import gzip
+import json
+import sys
+
+from height_index import HeightResolver
+from tx_model import ScriptType, Tx, TxIn, TxOut
+
+def encode_txout(txout):
+    return [txout.value, int(txout.script_type), txout.scriptpubkey.hex(), txout.height]
+
+def decode_txout(data):
+    value, script_type, scriptpubkey, height = data
+    return TxOut(value, ScriptType(script_type), bytes.fromhex(scriptpubkey), height)
+
+# Txs are stored as they are modelled, prevouts and signature info included
+def encode_tx(tx):
+    return [
+        tx.version, tx.locktime, tx.height,
+        [
+            [tx_in.txid, tx_in.vout, tx_in.sequence, tx_in.r_len, tx_in.pubkey_prefix,
+             encode_txout(tx_in.prevout) if tx_in.prevout is not None else None]
+            for tx_in in tx.vin
+        ],
+        [encode_txout(txout) for txout in tx.vout],
+    ]
+
+def decode_tx(txid, data):
+    version, locktime, height, vin, vout = data
+    return Tx(
+        txid, version, locktime,
+        [
+            TxIn(prev_txid, prev_vout, sequence, decode_txout(prevout) if prevout else None, r_len, pubkey_prefix)
+            for prev_txid, prev_vout, sequence, r_len, pubkey_prefix, prevout in vin
+        ],
+        [decode_txout(txout) for txout in vout],
+        height,
+    )
+
+def empty_corpus():
+    # blocks: hash -> {"header": getblockheader, "txids": getblocktxs,
+    # "block_txids": the txids get_block_txs returned}
+    return {"tip": None, "mempool": [], "heights": {}, "blocks": {}, "txs": {}, "confirmations": {}}
+
+def load_corpus(path):
+    with gzip.open(path, "rt") as f:
+        return json.load(f)
+
+def save_corpus(corpus, path):
+    with gzip.open(path, "wt") as f:
+        json.dump(corpus, f, separators=(",", ":"))
+
+class ReplayBackend:
+    def __init__(self, corpus):
+        self.corpus = load_corpus(corpus) if isinstance(corpus, str) else corpus
+
+    def _lookup(self, section, key):
+        try:
+            return self.corpus[section][key]
+        except KeyError:
+            raise LookupError(f"{key} is not in the replay corpus ({section})") from None
+
+    def _block(self, block_hash, key):
+        block = self._lookup("blocks", block_hash)
+        if key not in block:
+            raise LookupError(f"{key} of block {block_hash} is not in the replay corpus")
+        return block[key]
+
+    # every call decodes fresh objects, callers fill in heights on them
+    def get_tx(self, txid):
+        return decode_tx(txid, self._lookup("txs", txid))
+
+    def get_txs(self, txids):
+        return [self.get_tx(txid) for txid in txids]
+
+    # Attaches prevouts from known_txs, then from the parents in the corpus
+    def resolve_prevouts(self, txs, known_txs=()):
+        known = {tx.txid: tx for tx in known_txs}
+        for tx in txs:
+            for tx_in in tx.vin:
+                if tx_in.is_coinbase:
+                    continue
+                parent = known.get(tx_in.txid)
+                if parent is None:
+                    parent = known[tx_in.txid] = self.get_tx(tx_in.txid)
+                tx_in.attach_prevout(parent.vout[tx_in.vout])
+        return txs
+
+    def get_block_txs(self, block_hash, num_of_txs=None):
+        block = self._lookup("blocks", block_hash)
+        # exclude the coinbase transaction
+        txids = block["block_txids"] if "block_txids" in block else self._block(block_hash, "txids")[1:]
+        return self.get_txs(txids[:num_of_txs])
+
+    def getbestblockhash(self):
+        if self.corpus["tip"] is None:
+            raise LookupError("the replay corpus has no tip")
+        return self.corpus["tip"]
+
+    def getblockhash(self, height):
+        return self._lookup("heights", str(height))
+
+    def getblockhashes(self, heights):
+        return [self.getblockhash(height) for height in heights]
+
+    def getblockheader(self, block_hash):
+        return self._block(block_hash, "header")
+
+    def getblocktxs(self, block_hash):
+        return self._block(block_hash, "txids")
+
+    def getrawmempool(self):
+        return list(self.corpus["mempool"])
+
+    def getconfirmationheights(self, txids):
+        return {txid: self._lookup("confirmations", txid) for txid in txids}
+
+class RecordingBackend:
+    def __init__(self, backend, corpus=None):
+        self.backend = backend
+        self.corpus = corpus or empty_corpus()
+
+    def _block(self, block_hash):
+        return self.corpus["blocks"].setdefault(block_hash, {})
+
+    def _keep(self, txs):
+        for tx in txs:
+            self.corpus["txs"][tx.txid] = encode_tx(tx)
+        return txs
+
+    def get_tx(self, txid):
+        return self._keep([self.backend.get_tx(txid)])[0]
+
+    def get_txs(self, txids):
+        return self._keep(self.backend.get_txs(txids))
+
+    def get_block_txs(self, block_hash, num_of_txs=None):
+        txs = self._keep(self.backend.get_block_txs(block_hash, num_of_txs))
+        block = self._block(block_hash)
+        # a later call with more txs replaces a shorter recording
+        if len(txs) >= len(block.get("block_txids", ())):
+            block["block_txids"] = [tx.txid for tx in txs]
+        return txs
+
+    def getbestblockhash(self):
+        self.corpus["tip"] = self.backend.getbestblockhash()
+        return self.corpus["tip"]
+
+    def getblockhash(self, height):
+        block_hash = self.backend.getblockhash(height)
+        self.corpus["heights"][str(height)] = block_hash
+        return block_hash
+
+    def getblockhashes(self, heights):
+        block_hashes = self.backend.getblockhashes(heights)
+        self.corpus["heights"].update(zip(map(str, heights), block_hashes))
+        return block_hashes
+
+    def getblockheader(self, block_hash):
+        header = self.backend.getblockheader(block_hash)
+        self._block(block_hash)["header"] = header
+        return header
+
+    def getblocktxs(self, block_hash):
+        txids = self.backend.getblocktxs(block_hash)
+        self._block(block_hash)["txids"] = txids
+        return txids
+
+    def getrawmempool(self):
+        self.corpus["mempool"] = list(self.backend.getrawmempool())
+        return self.corpus["mempool"]
+
+    def getconfirmationheights(self, txids):
+        heights = self.backend.getconfirmationheights(txids)
+        self.corpus["confirmations"].update(heights)
+        return heights
+
+    def save(self, path):
+        save_corpus(self.corpus, path)
+
+# Records what analyzing the given blocks, txs and mempool sample reads,
+# including the confirmation heights the heuristics ask for
+def record(backend, path, tip=False, blocks=(), txids=(), mempool=0, append=False):
+    recorder = RecordingBackend(backend, load_corpus(path) if append else None)
+    resolver = HeightResolver(recorder)
+
+    block_hashes = list(blocks)
+    if tip:
+        block_hashes.append(recorder.getbestblockhash())
+    for block_hash in block_hashes:
+        recorder.getblockheader(block_hash)
+        resolver.fill(recorder.get_block_txs(block_hash))
+    if txids:
+        resolver.fill(recorder.get_txs(list(txids)), tx_heights=True)
+    if mempool:
+        sample = recorder.getrawmempool()[:mempool]
+        resolver.fill(recorder.get_txs(sample), tx_heights=True)
+
+    recorder.save(path)
+    return recorder.corpus
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Record a replay corpus from the live backend")
+    parser.add_argument("corpus", help="corpus file to write (gzip-compressed JSON)")
+    parser.add_argument("--tip", action="store_true", help="record the current tip block")
+    parser.add_argument("--block", action="append", default=[], help="record a block, repeatable")
+    parser.add_argument("--tx", action="append", default=[], help="record a tx, repeatable")
+    parser.add_argument("--mempool", type=int, default=0, help="record the mempool and this many of its txs")
+    parser.add_argument("--append", action="store_true", help="add to an existing corpus")
+    args = parser.parse_args(argv)
+
+    from fetch_txs import module
+
+    corpus = record(module, args.corpus, args.tip, args.block, args.tx, args.mempool, args.append)
+    print(f"Recorded {len(corpus['txs'])} txs and {len(corpus['blocks'])} blocks to {args.corpus}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
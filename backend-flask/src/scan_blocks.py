@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Block range scanner.
+
+Fingerprints every block between two heights through the configured backend,
+spreading the blocks over a pool of worker processes, and prints the merged
+wallet distribution as JSON.
+"""
+
+import argparse
+import json
+import sys
+
+from fingerprinting import analyze_block_range
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fingerprint every block in a height range")
+    parser.add_argument("start_height", type=int)
+    parser.add_argument("end_height", type=int, help="last height to scan (inclusive)")
+    parser.add_argument("-w", "--workers", type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="include the txids of each wallet")
+    parser.add_argument("-o", "--output", help="JSON output file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    if args.end_height < args.start_height:
+        parser.error("end_height must not be lower than start_height")
+
+    wallets = analyze_block_range(args.start_height, args.end_height, args.workers, args.verbose)
+    output = open(args.output, "w") if args.output else sys.stdout
+    try:
+        json.dump(wallets, output, indent=2)
+        output.write("\n")
+    finally:
+        if args.output:
+            output.close()
+
+if __name__ == "__main__":
+    main()
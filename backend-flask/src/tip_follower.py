@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Chain-tip follower.
+
+Analyzes every new block once as it arrives and stores its wallet
+distribution in the fingerprint store, so the API can answer tip queries
+from the stored summary. New blocks are picked up by polling
+getbestblockhash, from Core's -blocknotify hook or from a ZMQ hashblock
+subscription.
+"""
+
+import argparse
+import sys
+import time
+
+from fetch_txs import module
+from fingerprinting import analyze_block
+from fingerprint_store import open_store
+
+# how far back the follower walks to find a block it already knows, which
+# bounds both reorg rollback and catch-up after downtime
+REORG_DEPTH = 6
+
+class TipFollower:
+    def __init__(self, store, backend=module, depth=REORG_DEPTH):
+        self.store = store
+        self.backend = backend
+        self.depth = depth
+
+    # Brings the stored summaries up to the current tip and returns the
+    # summaries written
+    def sync(self, tip=None):
+        tip = tip or self.backend.getbestblockhash()
+        known = {summary.hash: summary.height for summary in self.store.recent_block_summaries(self.depth)}
+        if tip in known:
+            return []
+
+        # walk back from the tip until a known block, the fork point on reorgs
+        new_blocks = []
+        block_hash = tip
+        while block_hash not in known and len(new_blocks) < (self.depth if known else 1):
+            header = self.backend.getblockheader(block_hash)
+            new_blocks.append((block_hash, header["height"], header.get("previousblockhash")))
+            block_hash = header.get("previousblockhash")
+            if block_hash is None:
+                break
+
+        # summaries at these heights belong to a stale branch
+        self.store.delete_block_summaries_from(new_blocks[-1][1])
+
+        summaries = []
+        for block_hash, height, prev_hash in reversed(new_blocks):
+            wallets = analyze_block(block_hash)
+            summaries.append(self.store.put_block_summary(block_hash, height, prev_hash, wallets))
+        return summaries
+
+    def poll(self, interval=10):
+        while True:
+            self.sync_and_log()
+            time.sleep(interval)
+
+    # Core publishes hashblock with -zmqpubhashblock=<endpoint>
+    def subscribe(self, endpoint):
+        import zmq
+
+        socket = zmq.Context.instance().socket(zmq.SUB)
+        socket.setsockopt(zmq.SUBSCRIBE, b"hashblock")
+        socket.connect(endpoint)
+        # blocks found while the follower was down
+        self.sync_and_log()
+        while True:
+            topic, body, _ = socket.recv_multipart()
+            self.sync_and_log(body.hex())
+
+    def sync_and_log(self, tip=None):
+        try:
+            for summary in self.sync(tip):
+                print(f"Analyzed block {summary.height} {summary.hash}: {summary.total_transactions} txs", file=sys.stderr)
+        except Exception as e:
+            print(f"Error following the tip: {e}", file=sys.stderr)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze new blocks as they arrive and store their summaries")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--interval", type=float, default=10, help="seconds between getbestblockhash polls")
+    mode.add_argument("--notify", metavar="BLOCK_HASH", help="sync once, for -blocknotify='tip_follower.py --notify %%s'")
+    mode.add_argument("--zmq", metavar="ENDPOINT", help="follow a ZMQ hashblock publisher, e.g. tcp://127.0.0.1:28332")
+    parser.add_argument("--db", help="fingerprint store file (default: FINGERPRINT_DB)")
+    parser.add_argument("--depth", type=int, default=REORG_DEPTH, help="blocks walked back on reorgs and catch-up")
+    args = parser.parse_args(argv)
+
+    store = open_store(args.db)
+    if store is None:
+        parser.error("the fingerprint store is disabled")
+    follower = TipFollower(store, depth=args.depth)
+
+    if args.notify:
+        follower.sync_and_log(args.notify)
+    elif args.zmq:
+        follower.subscribe(args.zmq)
+    else:
+        follower.poll(args.interval)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+from enum import IntEnum
+
+# Compact transaction model the fingerprinting engine works on. Backends
+# project their upstream JSON into these objects, keeping only the fields the
+# heuristics read. Values are integer satoshis.
+
+class ScriptType(IntEnum):
+    P2PK = 0
+    P2PKH = 1
+    P2SH = 2
+    P2WPKH = 3
+    P2WSH = 4
+    P2TR = 5
+    MULTISIG = 6
+    OP_RETURN = 7
+    WITNESS_UNKNOWN = 8
+    UNKNOWN = 9
+
+    @property
+    def label(self):
+        return _LABELS[self]
+
+# mempool.space/esplora names, used when reporting types
+_LABELS = {
+    ScriptType.P2PK: "p2pk",
+    ScriptType.P2PKH: "p2pkh",
+    ScriptType.P2SH: "p2sh",
+    ScriptType.P2WPKH: "v0_p2wpkh",
+    ScriptType.P2WSH: "v0_p2wsh",
+    ScriptType.P2TR: "v1_p2tr",
+    ScriptType.MULTISIG: "multisig",
+    ScriptType.OP_RETURN: "op_return",
+    ScriptType.WITNESS_UNKNOWN: "unknown_witness",
+    ScriptType.UNKNOWN: "unknown",
+}
+
+_SCRIPT_TYPES = {
+    # Bitcoin Core
+    "pubkey": ScriptType.P2PK,
+    "pubkeyhash": ScriptType.P2PKH,
+    "scripthash": ScriptType.P2SH,
+    "witness_v0_keyhash": ScriptType.P2WPKH,
+    "witness_v0_scripthash": ScriptType.P2WSH,
+    "witness_v1_taproot": ScriptType.P2TR,
+    "multisig": ScriptType.MULTISIG,
+    "nulldata": ScriptType.OP_RETURN,
+    "witness_unknown": ScriptType.WITNESS_UNKNOWN,
+    # mempool.space
+    "p2pk": ScriptType.P2PK,
+    "p2pkh": ScriptType.P2PKH,
+    "p2sh": ScriptType.P2SH,
+    "v0_p2wpkh": ScriptType.P2WPKH,
+    "v0_p2wsh": ScriptType.P2WSH,
+    "v1_p2tr": ScriptType.P2TR,
+    "op_return": ScriptType.OP_RETURN,
+    "unknown_witness": ScriptType.WITNESS_UNKNOWN,
+}
+
+def script_type(name):
+    return _SCRIPT_TYPES.get(name, ScriptType.UNKNOWN)
+
+NULL_TXID = "00" * 32
+
+UNCOMPRESSED_PUBKEY_PREFIXES = frozenset({0x04, 0x06, 0x07})
+
+def _der_r_len(signature):
+    # 0x30 <len> 0x02 <r len> <r> ...
+    if len(signature) < 4 or signature[0] != 0x30 or signature[2] != 0x02:
+        return 0
+    return signature[3]
+
+def _script_pushes(script):
+    pushes = []
+    i = 0
+    while i < len(script):
+        opcode = script[i]
+        i += 1
+        if 0 < opcode < 0x4c:
+            size = opcode
+        elif opcode == 0x4c and i < len(script):
+            size = script[i]
+            i += 1
+        elif opcode == 0x4d and i + 1 < len(script):
+            size = int.from_bytes(script[i:i + 2], "little")
+            i += 2
+        else:
+            continue
+        pushes.append(script[i:i + size])
+        i += size
+    return pushes
+
+# Only signatures spending these are fingerprinted
+SIGNATURE_SCRIPT_TYPES = frozenset({ScriptType.P2PKH, ScriptType.P2WPKH})
+
+# Returns (r length, public key prefix) of a single-key spend: the two witness
+# items of a P2WPKH input or the two scriptSig pushes of a P2PKH input. Which
+# of those the input actually is only becomes known with its prevout.
+def signature_info(scriptsig, witness):
+    if witness:
+        if len(witness) != 2 or not witness[1]:
+            return 0, 0
+        return _der_r_len(witness[0]), witness[1][0]
+    pushes = _script_pushes(scriptsig)
+    if len(pushes) < 2 or not pushes[1]:
+        return 0, 0
+    return _der_r_len(pushes[0]), pushes[1][0]
+
+class TxOut:
+    __slots__ = ("value", "script_type", "scriptpubkey", "height")
+
+    def __init__(self, value, script_type, scriptpubkey, height=None):
+        self.value = value
+        self.script_type = script_type
+        self.scriptpubkey = scriptpubkey
+        # confirmation height of the tx creating this output: None if not
+        # known, -1 if unconfirmed
+        self.height = height
+
+class TxIn:
+    __slots__ = ("txid", "vout", "sequence", "prevout", "r_len", "pubkey_prefix")
+
+    def __init__(self, txid, vout, sequence, prevout, r_len=0, pubkey_prefix=0):
+        self.txid = txid
+        self.vout = vout
+        self.sequence = sequence
+        # None for coinbase inputs and until the prevout is resolved
+        self.prevout = prevout
+        self.r_len = r_len
+        self.pubkey_prefix = pubkey_prefix
+
+    @classmethod
+    def from_scripts(cls, txid, vout, sequence, prevout, scriptsig, witness):
+        r_len, pubkey_prefix = signature_info(scriptsig, witness)
+        tx_in = cls(txid, vout, sequence, None, r_len, pubkey_prefix)
+        if prevout is not None:
+            tx_in.attach_prevout(prevout)
+        return tx_in
+
+    def attach_prevout(self, prevout):
+        self.prevout = prevout
+        if prevout.script_type not in SIGNATURE_SCRIPT_TYPES:
+            self.r_len = 0
+            self.pubkey_prefix = 0
+
+    @property
+    def is_coinbase(self):
+        return self.txid == NULL_TXID and self.vout == 0xffffffff
+
+class Tx:
+    __slots__ = ("txid", "version", "locktime", "vin", "vout", "height")
+
+    def __init__(self, txid, version, locktime, vin, vout, height=None):
+        self.txid = txid
+        self.version = version
+        self.locktime = locktime
+        self.vin = tuple(vin)
+        self.vout = tuple(vout)
+        # confirmation height: None if not known, -1 if unconfirmed
+        self.height = height
+
+    @property
+    def is_coinbase(self):
+        return len(self.vin) == 1 and self.vin[0].is_coinbase
+
+def btc_to_sats(value):
+    return int(round(value * 100000000))
+
+class Block:
+    __slots__ = ("hash", "prev_hash", "height", "txs")
+
+    def __init__(self, hash, prev_hash, height, txs):
+        self.hash = hash
+        self.prev_hash = prev_hash
+        # from the BIP34 coinbase push, None if it can't be read
+        self.height = height
+        self.txs = txs
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Push-based live fingerprinting.
+
+Subscribes to Bitcoin Core's rawtx and hashblock ZMQ topics
+(-zmqpubrawtx=<endpoint> -zmqpubhashblock=<endpoint>), parses the pushed
+txs locally and classifies them in small batches as they arrive. Results are
+handed to in-process consumers. Prevouts come from recently pushed txs first,
+then from the backend's outpoint index and a batched lookup.
+
+ReplayPublisher stands in for the node: it replays recorded raw txs on a
+local endpoint at a fixed rate, so sustained tx/s can be measured without a
+node. Record the parents of the txs into a replay corpus as well and run
+with REPLAY_CORPUS set, and nothing needs the node:
+
+    zmq_live.py record tcp://127.0.0.1:28332 txs.hex --corpus parents.json.gz
+    zmq_live.py replay txs.hex &
+    REPLAY_CORPUS=parents.json.gz zmq_live.py follow tcp://127.0.0.1:28332
+
+Needs pyzmq.
+"""
+
+import argparse
+import os
+import sys
+import time
+from collections import OrderedDict
+
+from fetch_txs import height_index, heights as height_resolver, module
+from fingerprinting import extract_features, profile_step
+from fingerprint_store import fingerprint
+from height_index import HeightResolver
+from raw_tx import parse_tx
+
+# max txs classified together, and how long a partial batch may wait
+BATCH_SIZE = 200
+MAX_DELAY = 0.05
+# recently pushed txs kept to resolve the prevouts of their children
+RECENT_TXS = 50000
+
+class LiveClassifier:
+    def __init__(self, backend=module, batch_size=BATCH_SIZE, max_delay=MAX_DELAY, recent=RECENT_TXS,
+                 heights=None):
+        # backend resolves prevouts, heights the confirmation heights (on
+        # the same backend by default, through the shared height index)
+        self.backend = backend
+        if heights is None:
+            heights = height_resolver if backend is module else HeightResolver(backend, height_index)
+        self.heights = heights
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.recent = OrderedDict()
+        self.recent_max = recent
+        self.tx_consumers = []
+        self.block_consumers = []
+        self.stats = {"received": 0, "classified": 0, "repeated": 0, "errors": 0, "dropped": 0, "blocks": 0}
+        self.started = None
+        self._sequences = {}
+
+    # consumer(Fingerprint) for every classified tx
+    def on_tx(self, consumer):
+        self.tx_consumers.append(consumer)
+        return consumer
+
+    # consumer(block_hash) for every new block
+    def on_block(self, consumer):
+        self.block_consumers.append(consumer)
+        return consumer
+
+    # Classifies a batch of serialized txs and publishes the fingerprints.
+    # Txs seen before are skipped: Core pushes every tx of a block again when
+    # the block connects, and those were classified on first sight.
+    def process(self, raw_txs):
+        try:
+            txs = []
+            for raw in raw_txs:
+                tx = parse_tx(raw)
+                if tx.txid in self.recent:
+                    self.stats["repeated"] += 1
+                    continue
+                txs.append(tx)
+                # pushed txs are unconfirmed, and so are the outputs their
+                # children spend
+                tx.height = -1
+                for txout in tx.vout:
+                    txout.height = -1
+                self.recent[tx.txid] = tx
+            while len(self.recent) > self.recent_max:
+                self.recent.popitem(last=False)
+
+            parents = {tx_in.txid for tx in txs for tx_in in tx.vin if tx_in.txid in self.recent}
+            self.backend.resolve_prevouts(txs, [self.recent[txid] for txid in parents])
+            profile_step("fill_heights", self.heights.fill, txs)
+        except Exception as e:
+            self.stats["errors"] += len(raw_txs)
+            print(f"Error classifying {len(raw_txs)} pushed txs: {e}", file=sys.stderr)
+            return []
+
+        records = [fingerprint(extract_features(tx), -1) for tx in txs]
+        self.stats["classified"] += len(records)
+        for record in records:
+            for consumer in self.tx_consumers:
+                consumer(record)
+        return records
+
+    def block(self, block_hash):
+        self.stats["blocks"] += 1
+        for consumer in self.block_consumers:
+            consumer(block_hash)
+
+    # ZMQ messages carry a per-topic sequence number, gaps are dropped messages
+    def _check_sequence(self, topic, sequence):
+        sequence = int.from_bytes(sequence, "little")
+        last = self._sequences.get(topic)
+        if last is not None and sequence > last + 1:
+            self.stats["dropped"] += sequence - last - 1
+        self._sequences[topic] = sequence
+
+    def rate(self):
+        elapsed = time.perf_counter() - self.started if self.started else 0
+        return self.stats["classified"] / elapsed if elapsed else 0.0
+
+    # Receives and classifies pushed txs until max_txs are received or
+    # idle_timeout seconds pass without messages
+    def subscribe(self, endpoint, max_txs=None, idle_timeout=None, report_interval=None):
+        import zmq
+
+        socket = zmq.Context.instance().socket(zmq.SUB)
+        socket.setsockopt(zmq.SUBSCRIBE, b"rawtx")
+        socket.setsockopt(zmq.SUBSCRIBE, b"hashblock")
+        socket.setsockopt(zmq.RCVHWM, 0)
+        socket.connect(endpoint)
+
+        batch = []
+        batch_start = last_message = last_report = time.perf_counter()
+        try:
+            while max_txs is None or self.stats["received"] < max_txs:
+                now = time.perf_counter()
+                if socket.poll(int(self.max_delay * 1000)):
+                    topic, body, sequence = socket.recv_multipart()
+                    self._check_sequence(topic, sequence)
+                    last_message = now
+                    if topic == b"rawtx":
+                        if self.started is None:
+                            self.started = now
+                        if not batch:
+                            batch_start = now
+                        batch.append(body)
+                        self.stats["received"] += 1
+                    elif topic == b"hashblock":
+                        if batch:
+                            self.process(batch)
+                            batch = []
+                        self.block(body.hex())
+                elif idle_timeout is not None and now - last_message >= idle_timeout:
+                    break
+
+                if batch and (len(batch) >= self.batch_size or now - batch_start >= self.max_delay):
+                    self.process(batch)
+                    batch = []
+                if report_interval and now - last_report >= report_interval:
+                    self.report()
+                    last_report = now
+        finally:
+            if batch:
+                self.process(batch)
+            socket.close()
+
+    def report(self):
+        print(f"{self.rate():.0f} tx/s {self.stats}", file=sys.stderr)
+
+class ReplayPublisher:
+    def __init__(self, endpoint, raw_txs, rate=0):
+        self.endpoint = endpoint
+        self.raw_txs = raw_txs
+        # txs per second, 0 publishes as fast as possible
+        self.rate = rate
+
+    # Publishes the recorded txs loops times, as Core would on rawtx, and
+    # returns the achieved tx/s
+    def run(self, loops=1, warmup=0.5):
+        import zmq
+
+        socket = zmq.Context.instance().socket(zmq.PUB)
+        socket.setsockopt(zmq.SNDHWM, 0)
+        socket.bind(self.endpoint)
+        # subscribers that connect late miss the first messages
+        time.sleep(warmup)
+
+        sequence = 0
+        start = time.perf_counter()
+        try:
+            for _ in range(loops):
+                for raw in self.raw_txs:
+                    if self.rate:
+                        delay = start + sequence / self.rate - time.perf_counter()
+                        if delay > 0:
+                            time.sleep(delay)
+                    socket.send_multipart([b"rawtx", raw, sequence.to_bytes(4, "little")])
+                    sequence += 1
+            elapsed = time.perf_counter() - start
+        finally:
+            socket.close(linger=-1)
+        return sequence / elapsed if elapsed else 0.0
+
+# Recordings hold one raw tx hex per line, parents before their children
+def load_raw_txs(path):
+    with open(path) as f:
+        return [bytes.fromhex(line.strip()) for line in f if line.strip()]
+
+# Appends count pushed txs to path. With corpus, the parents they spend are
+# recorded there from the backend, for replaying without a node.
+def record(endpoint, path, count, corpus=None):
+    import zmq
+
+    socket = zmq.Context.instance().socket(zmq.SUB)
+    socket.setsockopt(zmq.SUBSCRIBE, b"rawtx")
+    socket.connect(endpoint)
+    raw_txs = []
+    with open(path, "a") as f:
+        for _ in range(count):
+            topic, body, _ = socket.recv_multipart()
+            f.write(body.hex() + "\n")
+            raw_txs.append(body)
+    socket.close()
+
+    if corpus:
+        from replay_backend import record as record_corpus
+
+        txs = [parse_tx(raw) for raw in raw_txs]
+        pushed = {tx.txid for tx in txs}
+        parents = {tx_in.txid for tx in txs for tx_in in tx.vin if not tx_in.is_coinbase and tx_in.txid not in pushed}
+        record_corpus(module, corpus, txids=sorted(parents), append=os.path.exists(corpus))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Classify txs pushed over ZMQ as they arrive")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    follow = commands.add_parser("follow", help="classify rawtx pushes and report tx/s")
+    follow.add_argument("endpoint", help="ZMQ publisher, e.g. tcp://127.0.0.1:28332")
+    follow.add_argument("--count", type=int, help="stop after this many txs")
+    follow.add_argument("--idle-timeout", type=float, help="stop after this many seconds without messages")
+    follow.add_argument("--report", type=float, default=5, help="seconds between tx/s reports")
+    follow.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="max txs classified together")
+
+    rec = commands.add_parser("record", help="append rawtx pushes to a recording")
+    rec.add_argument("endpoint", help="ZMQ publisher, e.g. tcp://127.0.0.1:28332")
+    rec.add_argument("file", help="recording, one raw tx hex per line")
+    rec.add_argument("--count", type=int, default=10000, help="txs to record")
+    rec.add_argument("--corpus", help="also record the parents of the txs to this replay corpus")
+
+    replay = commands.add_parser("replay", help="publish a recording as a node stand-in")
+    replay.add_argument("file", help="recording, one raw tx hex per line")
+    replay.add_argument("--bind", default="tcp://127.0.0.1:28332", help="endpoint to publish on")
+    replay.add_argument("--rate", type=float, default=0, help="txs per second, 0 for unthrottled")
+    replay.add_argument("--loops", type=int, default=1, help="times the recording is replayed")
+    args = parser.parse_args(argv)
+
+    if args.command == "follow":
+        classifier = LiveClassifier(batch_size=args.batch_size)
+        classifier.subscribe(args.endpoint, args.count, args.idle_timeout, args.report)
+        classifier.report()
+    elif args.command == "record":
+        record(args.endpoint, args.file, args.count, args.corpus)
+    else:
+        rate = ReplayPublisher(args.bind, load_raw_txs(args.file), args.rate).run(args.loops)
+        print(f"Published at {rate:.0f} tx/s", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
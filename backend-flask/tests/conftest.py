@@ -0,0 +1,12 @@
+import os
+import sys
+
+# the modules import each other as top-level modules from src/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+# tests never write index or store files, nor probe the backends
+os.environ.setdefault("HEIGHT_INDEX", "")
+os.environ.setdefault("FINGERPRINT_DB", "")
+os.environ.setdefault("BACKEND_PROBE_INTERVAL", "0")
+# nor read a local rpc_config.ini, tests that need Core pass their own
+os.environ["RPC_CONFIG"] = os.devnull
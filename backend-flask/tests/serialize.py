@@ -0,0 +1,42 @@
+import hashlib
+import struct
+
+# Minimal serializers for building raw txs in tests
+
+def sha256d(data):
+    return hashlib.sha256(hashlib.sha256(data).digest()).digest()
+
+def compact_size(n):
+    if n < 0xfd:
+        return bytes([n])
+    return b"\xfd" + struct.pack("<H", n)
+
+def p2pkh(n):
+    return b"\x76\xa9\x14" + bytes([n]) * 20 + b"\x88\xac"
+
+def p2sh(n):
+    return b"\xa9\x14" + bytes([n]) * 20 + b"\x87"
+
+def p2wpkh(n):
+    return b"\x00\x14" + bytes([n]) * 20
+
+def p2tr(n):
+    return b"\x51\x20" + bytes([n]) * 32
+
+def serialize_tx(vin, vout, version=2, locktime=0):
+    # vin: (txid hex, vout, scriptsig, sequence), vout: (value, script)
+    data = struct.pack("<i", version) + compact_size(len(vin))
+    for txid, n, scriptsig, sequence in vin:
+        data += bytes.fromhex(txid)[::-1] + struct.pack("<I", n) + compact_size(len(scriptsig)) + scriptsig
+        data += struct.pack("<I", sequence)
+    data += compact_size(len(vout))
+    for value, script in vout:
+        data += struct.pack("<Q", value) + compact_size(len(script)) + script
+    data += struct.pack("<I", locktime)
+    return data, sha256d(data)[::-1].hex()
+
+def serialize_block(prev_hash, txs, nonce, version=0x20000000):
+    # prev_hash in internal byte order, returns (raw, hash in the same order)
+    header = struct.pack("<i", version) + prev_hash + bytes(32) + struct.pack("<III", 1700000000, 0x207fffff, nonce)
+    return header + compact_size(len(txs)) + b"".join(txs), sha256d(header)
+
@@ -0,0 +1,31 @@
+import sqlite3
+
+import pytest
+
+from backend_registry import BackendRegistry
+
+class Fallback:
+    def getbestblockhash(self):
+        return "00" * 32
+
+def broken():
+    raise sqlite3.OperationalError("unable to open database file")
+
+def test_backend_that_cant_be_built_fails_over():
+    registry = BackendRegistry([("bitcoin_core", broken), ("mempool_space", Fallback)], probe_interval=0)
+    assert registry.getbestblockhash() == "00" * 32
+    assert isinstance(registry.current(), Fallback)
+    status = registry.status()
+    assert status["bitcoin_core"] == {"healthy": False, "error": "unable to open database file"}
+    assert status["mempool_space"]["healthy"]
+
+def test_probe_survives_construction_errors():
+    registry = BackendRegistry([("bitcoin_core", broken), ("mempool_space", Fallback)], probe_interval=0)
+    registry.probe()
+    assert not registry.status()["bitcoin_core"]["healthy"]
+    assert registry.status()["mempool_space"]["healthy"]
+
+def test_no_backend_can_be_built():
+    registry = BackendRegistry([("bitcoin_core", broken)], probe_interval=0)
+    with pytest.raises(sqlite3.OperationalError):
+        registry.getbestblockhash()
@@ -0,0 +1,36 @@
+import configparser
+
+import pytest
+
+import bitcoin_core
+from serialize import p2wpkh, serialize_block, serialize_tx, sha256d
+
+def _config(tmp_path, **options):
+    config = configparser.ConfigParser()
+    config["RPC_INFO"] = dict({"URL": "http://127.0.0.1:1/", "RPCUSER": "user", "RPCPASSWORD": "password"}, **options)
+    path = tmp_path / "rpc_config.ini"
+    with open(path, "w") as f:
+        config.write(f)
+    return str(path)
+
+def test_unwritable_outpoint_index_is_disabled(tmp_path):
+    core = bitcoin_core.BitcoinCore(_config(tmp_path, OUTPOINT_INDEX=str(tmp_path / "missing" / "outpoints.db")))
+    assert core.outpoints is None
+    # the backend still plans prevouts, all of them fetched upstream
+    assert core.plan_prevouts([]) == ({}, {}, [])
+
+def test_missing_config_fails_construction_not_import(tmp_path):
+    with pytest.raises(configparser.Error):
+        bitcoin_core.BitcoinCore(str(tmp_path / "rpc_config.ini"))
+
+def test_raw_block_without_bip34_height_asks_the_header(tmp_path, monkeypatch):
+    coinbase, _ = serialize_tx([("00" * 32, 0xffffffff, bytes.fromhex("044c86041b020602"), 0xffffffff)], [(5000000000, p2wpkh(1))])
+    tx, txid = serialize_tx([(sha256d(coinbase)[::-1].hex(), 0, b"", 0xffffffff)], [(4000000000, p2wpkh(2))], version=1)
+    raw_block, block_hash = serialize_block(bytes(32), [coinbase, tx], 0, version=1)
+
+    core = bitcoin_core.BitcoinCore(_config(tmp_path, VERBOSE_PREVOUTS="false", OUTPOINT_INDEX=""))
+    monkeypatch.setattr(core, "getblock_raw", lambda block_hash: raw_block)
+    monkeypatch.setattr(core, "getblockheader", lambda block_hash: {"height": 100000})
+
+    txs = core.get_block_txs(block_hash[::-1].hex())
+    assert [(tx.txid, tx.height, tx.vout[0].height, tx.vin[0].prevout.height) for tx in txs] == [(txid, 100000, 100000, 100000)]
@@ -0,0 +1,54 @@
+import aiohttp
+import pytest
+import requests
+
+import fetch_txs
+from backend_registry import BackendRegistry
+from tx_model import ScriptType, Tx, TxOut
+
+class Adapter:
+    def __init__(self, error=None):
+        self.error = error
+        self.calls = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    async def get_txs(self, txids):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        return [Tx(txid, 2, 0, [], [TxOut(1000, ScriptType.P2WPKH, b"\x00\x14" + bytes(20))], 800000) for txid in txids]
+
+class Backend:
+    def __init__(self, adapter):
+        self.adapter = adapter
+
+@pytest.mark.parametrize("error", [
+    aiohttp.ClientConnectionError("connection refused"),
+    # the Core adapter's blocking node version check
+    requests.exceptions.ConnectionError("connection refused"),
+])
+def test_async_calls_fail_over_when_the_backend_goes_down(monkeypatch, error):
+    down, up = Adapter(error), Adapter()
+    registry = BackendRegistry([("bitcoin_core", lambda: Backend(down)), ("mempool_space", lambda: Backend(up))], probe_interval=0)
+    monkeypatch.setattr(fetch_txs, "module", registry)
+    monkeypatch.setattr(fetch_txs, "async_adapter", lambda backend: backend.adapter)
+
+    txs = fetch_txs.get_txs_concurrently(["aa" * 32])
+    assert [tx.txid for tx in txs] == ["aa" * 32]
+    assert not registry.status()["bitcoin_core"]["healthy"]
+
+    # the next call goes to the healthy backend first
+    fetch_txs.get_txs_concurrently(["bb" * 32])
+    assert (down.calls, up.calls) == (1, 2)
+
+def test_async_calls_raise_when_every_backend_is_down(monkeypatch):
+    registry = BackendRegistry([("bitcoin_core", lambda: Backend(Adapter(aiohttp.ClientConnectionError("down"))))], probe_interval=0)
+    monkeypatch.setattr(fetch_txs, "module", registry)
+    monkeypatch.setattr(fetch_txs, "async_adapter", lambda backend: backend.adapter)
+    with pytest.raises(aiohttp.ClientConnectionError):
+        fetch_txs.get_txs_concurrently(["aa" * 32])
@@ -0,0 +1,29 @@
+from fingerprint_store import FingerprintStore, fingerprint
+from fingerprinting import Wallets, classify_code, extract_features, wallet_label
+from tx_model import ScriptType, Tx, TxIn, TxOut
+
+def _tx():
+    prevout = TxOut(100000, ScriptType.P2WPKH, b"\x00\x14" + bytes(20), 799000)
+    outputs = [TxOut(40000, ScriptType.P2TR, b"\x51\x20" + bytes(32)), TxOut(59123, ScriptType.P2WPKH, b"\x00\x14" + b"\x01" * 20)]
+    return Tx("ab" * 32, 2, 799990, [TxIn("cd" * 32, 0, 0xfffffffd, prevout)], outputs, 800000)
+
+def test_stale_verdicts_are_reclassified_when_rules_change(tmp_path):
+    path = str(tmp_path / "fingerprints.db")
+    record = fingerprint(extract_features(_tx()), 800000)
+    store = FingerprintStore(path)
+    # as if stored under an older rule set
+    store.put([record._replace(wallet=Wallets.LEDGER.value, wallet_mask=0, reasoning=("stale",))])
+    with store._connection() as db:
+        db.execute("UPDATE meta SET value = 'old' WHERE key = 'rules'")
+
+    stored = FingerprintStore(path).get(record.txid)
+    mask, reasoning = classify_code(record.feature_code)
+    assert (stored.wallet, stored.wallet_mask, stored.reasoning) == (wallet_label(mask), mask, reasoning)
+    assert stored == record
+
+def test_forked_process_opens_its_own_connection(tmp_path):
+    store = FingerprintStore(str(tmp_path / "fingerprints.db"))
+    inherited = store._connection()
+    # what a forked worker sees: the connection was opened by another pid
+    store._local.pid = -1
+    assert store._connection() is not inherited
@@ -0,0 +1,21 @@
+from fingerprinting import InputSortingType, get_input_order
+from tx_model import ScriptType, Tx, TxIn, TxOut
+
+PARENT = "ab" * 32
+
+def _tx(vouts):
+    vin = [
+        TxIn(PARENT, vout, 0xfffffffd, TxOut(10000 * (i + 1), ScriptType.P2WPKH, b"\x00\x14" + bytes(20), 800000))
+        for i, vout in enumerate(vouts)
+    ]
+    return Tx("cd" * 32, 2, 0, vin, [TxOut(5000, ScriptType.P2WPKH, b"\x00\x14" + bytes(20), 800001)], 800001)
+
+# BIP69 sorts inputs by txid, then by vout as a number: vout 2 comes before 10
+def test_bip69_inputs_compare_vout_numerically():
+    assert InputSortingType.BIP69 in get_input_order(_tx([2, 10]))
+    assert InputSortingType.BIP69 not in get_input_order(_tx([10, 2]))
+
+def test_bip69_inputs_sort_by_txid_first():
+    tx = _tx([0, 1])
+    tx.vin[0].txid = "ff" * 32
+    assert InputSortingType.BIP69 not in get_input_order(tx)
@@ -0,0 +1,44 @@
+import asyncio
+import threading
+
+import pytest
+
+import fetch_txs
+import fingerprinting
+from async_backends import resolve_heights
+from height_index import HeightResolver
+from heuristic_profile import HeuristicProfile
+from upstream import AsyncHeights, Heights, spending_tx
+
+@pytest.fixture
+def profile(monkeypatch):
+    profile = HeuristicProfile()
+    monkeypatch.setattr(fingerprinting, "_profile", profile)
+    return profile
+
+def test_height_fill_is_profiled_with_its_upstream_calls(monkeypatch, profile):
+    monkeypatch.setattr(fetch_txs.heights, "backend", Heights())
+    txs = [spending_tx("aa" * 32, ["01" * 32, "02" * 32]), spending_tx("bb" * 32, ["03" * 32, "04" * 32])]
+    fingerprinting.tally_wallets(txs)
+
+    summary = profile.summary()
+    assert summary["fill_heights"]["runs"] == 1
+    assert summary["fill_heights"]["upstream_calls"] == 1
+    assert summary["input_order"]["upstream_calls"] == 0
+
+def test_resolver_counters_are_per_thread():
+    resolver = HeightResolver(Heights())
+    resolver.resolve(["01" * 32])
+    other = []
+    thread = threading.Thread(target=lambda: other.append((resolver.resolve(["02" * 32]), resolver.upstream_calls)))
+    thread.start()
+    thread.join()
+    assert other[0][1] == 1
+    assert resolver.upstream_calls == 1
+
+def test_async_height_lookups_are_counted():
+    resolver = HeightResolver(None)
+    txs = [spending_tx("aa" * 32, ["01" * 32, "02" * 32])]
+    asyncio.run(resolve_heights(AsyncHeights(), resolver, txs))
+    assert resolver.upstream_calls == 1
+    assert [tx_in.prevout.height for tx_in in txs[0].vin] == [700000, 700000]
@@ -0,0 +1,53 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from http_pool import HttpPool, is_transient
+
+RPC_ERROR = json.dumps({"result": None, "error": {"code": -5, "message": "No such mempool or blockchain transaction"}, "id": None})
+
+def test_is_transient():
+    assert not is_transient(500, RPC_ERROR.encode())
+    assert is_transient(500, b"<html>Internal Server Error</html>")
+    assert is_transient(500, json.dumps({"result": "ok", "error": None}).encode())
+    assert is_transient(503, RPC_ERROR.encode())
+    assert is_transient(429, b"")
+    assert not is_transient(404, b"")
+
+@pytest.fixture
+def server():
+    bodies = []
+    calls = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            calls.append(self.path)
+            body = bodies[min(len(calls), len(bodies)) - 1].encode()
+            self.send_response(500)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = HTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_port}/", bodies, calls
+    httpd.shutdown()
+
+def test_rpc_errors_are_not_retried(server):
+    url, bodies, calls = server
+    bodies.append(RPC_ERROR)
+    response = HttpPool(retries=3, backoff=0.001).post(url, data="{}")
+    assert response.status_code == 500
+    assert len(calls) == 1
+
+def test_other_server_errors_are_retried(server):
+    url, bodies, calls = server
+    bodies.append("Internal Server Error")
+    HttpPool(retries=2, backoff=0.001).post(url, data="{}")
+    assert len(calls) == 3
@@ -0,0 +1,27 @@
+import fetch_txs
+from mempool_watcher import MempoolWatcher
+from upstream import Heights, spending_tx
+
+class Mempool(Heights):
+    def __init__(self, txs):
+        super().__init__()
+        self.txs = {tx.txid: tx for tx in txs}
+
+    def getrawmempool(self):
+        return list(self.txs)
+
+    def get_txs(self, txids):
+        return [self.txs[txid] for txid in txids]
+
+class Unused:
+    def getconfirmationheights(self, txids):
+        raise AssertionError("heights asked to the global backend")
+
+def test_heights_come_from_the_watched_backend(monkeypatch):
+    monkeypatch.setattr(fetch_txs.heights, "backend", Unused())
+    backend = Mempool([spending_tx("aa" * 32, ["01" * 32, "02" * 32]), spending_tx("bb" * 32, ["03" * 32])])
+    watcher = MempoolWatcher(backend)
+
+    assert watcher.refresh() == (2, 0)
+    assert backend.lookups == [["01" * 32, "02" * 32]]
+    assert watcher.size == 2
@@ -0,0 +1,184 @@
+import io
+import json
+import struct
+
+import pytest
+
+import fetch_txs
+import offline_scan
+from fingerprinting import Wallets
+from serialize import compact_size, p2pkh, p2sh, p2tr, p2wpkh, serialize_block, serialize_tx, sha256d
+from tx_model import ScriptType
+
+MAGIC = offline_scan.NETWORK_MAGIC["regtest"]
+XOR_KEY = bytes.fromhex("5a1e0c9d33a7f046")
+
+def varint(n):
+    # Bitcoin Core's VARINT, as written to undo data
+    out = bytearray()
+    while True:
+        out.insert(0, (n & 0x7f) | (0x80 if out else 0))
+        if n <= 0x7f:
+            return bytes(out)
+        n = (n >> 7) - 1
+
+def compress_amount(n):
+    if n == 0:
+        return 0
+    e = 0
+    while n % 10 == 0 and e < 9:
+        n //= 10
+        e += 1
+    if e < 9:
+        d = n % 10
+        n //= 10
+        return 1 + (n * 9 + d - 1) * 10 + e
+    return 1 + (n - 1) * 10 + 9
+
+def compress_script(script):
+    if len(script) == 25 and script[:3] == b"\x76\xa9\x14":
+        return varint(0) + script[3:23]
+    if len(script) == 23 and script[:2] == b"\xa9\x14":
+        return varint(1) + script[2:22]
+    return varint(len(script) + 6) + script
+
+def coinbase(tag, vout):
+    # OP_TRUE first: no BIP34 height, heights come from the parent links
+    return serialize_tx([("00" * 32, 0xffffffff, b"\x51" + tag, 0xffffffff)], vout)
+
+def serialize_coin(value, script, height, is_coinbase=False):
+    data = varint(height * 2 + is_coinbase)
+    if height > 0:
+        data += varint(0)
+    return data + varint(compress_amount(value)) + compress_script(script)
+
+def serialize_undo(txs_coins):
+    data = compact_size(len(txs_coins))
+    for coins in txs_coins:
+        data += compact_size(len(coins)) + b"".join(serialize_coin(*coin) for coin in coins)
+    return data
+
+def record(payload):
+    return MAGIC + struct.pack("<I", len(payload)) + payload
+
+def xor(data, key):
+    return bytes(byte ^ key[i % len(key)] for i, byte in enumerate(data))
+
+@pytest.fixture
+def chain():
+    # genesis: coinbase paying a P2PKH and a P2WPKH output
+    genesis_cb, genesis_cb_txid = coinbase(b"genesis", [(150000, p2pkh(1)), (2500000, p2wpkh(2))])
+    genesis, genesis_hash = serialize_block(bytes(32), [genesis_cb], 0)
+
+    # block 1: one tx spending both genesis outputs, change last
+    cb1, _ = coinbase(b"one", [(5000000000, p2wpkh(3))])
+    tx1, tx1_txid = serialize_tx(
+        [(genesis_cb_txid, 0, b"", 0xfffffffd), (genesis_cb_txid, 1, b"", 0xfffffffd)],
+        [(1000000, p2sh(4)), (1645123, p2pkh(5))],
+    )
+    block1, block1_hash = serialize_block(genesis_hash, [cb1, tx1], 1)
+    undo1 = serialize_undo([[(150000, p2pkh(1), 0, True), (2500000, p2wpkh(2), 0, True)]])
+
+    # block 2: spends the P2SH output of block 1 with anti-fee-sniping, RBF
+    # and BIP69 outputs, change last and of the input's type
+    cb2, _ = coinbase(b"two", [(5000000000, p2wpkh(6))])
+    tx2, tx2_txid = serialize_tx(
+        [(tx1_txid, 0, b"", 0xfffffffd)],
+        [(300000, p2tr(7)), (699000, p2sh(8))],
+        locktime=1,
+    )
+    block2, block2_hash = serialize_block(block1_hash, [cb2, tx2], 2)
+    undo2 = serialize_undo([[(1000000, p2sh(4), 1)]])
+
+    # stale sibling of block 2, never connected so it has no undo data
+    stale, _ = serialize_block(block1_hash, [coinbase(b"stale", [(5000000000, p2wpkh(9))])[0]], 3)
+
+    return {
+        # blocks are stored out of order, undo data in the order blocks connected
+        "blk": [genesis, stale, block2, block1],
+        "rev": [
+            undo1 + sha256d(genesis_hash + undo1),
+            undo2 + sha256d(block1_hash + undo2),
+        ],
+        "hashes": [block1_hash[::-1].hex(), block2_hash[::-1].hex()],
+        "txids": [tx1_txid, tx2_txid],
+    }
+
+def write_blocks_dir(path, blk, rev, key=XOR_KEY):
+    (path / "xor.dat").write_bytes(key)
+    (path / "blk00000.dat").write_bytes(xor(b"".join(record(block) for block in blk) + bytes(64), key))
+    (path / "rev00000.dat").write_bytes(xor(b"".join(
+        MAGIC + struct.pack("<I", len(undo) - 32) + undo for undo in rev
+    ) + bytes(64), key))
+
+@pytest.fixture(autouse=True)
+def no_upstream(monkeypatch):
+    class Offline:
+        def getconfirmationheights(self, txids):
+            raise AssertionError(f"offline scan asked upstream for {txids}")
+    monkeypatch.setattr(fetch_txs.heights, "backend", Offline())
+
+def test_scan_file_pair_heights_and_prevouts(tmp_path, chain):
+    write_blocks_dir(tmp_path, chain["blk"], chain["rev"])
+    blocks = list(offline_scan.scan_file_pair(tmp_path, 0, MAGIC, offline_scan.read_xor_key(tmp_path)))
+
+    assert [block.hash for block in blocks] == chain["hashes"]
+    assert [block.height for block in blocks] == [1, 2]
+
+    tx1 = blocks[0].txs[1]
+    assert tx1.txid == chain["txids"][0]
+    assert tx1.height == 1
+    assert [(p.value, p.scriptpubkey, p.script_type, p.height) for p in (tx_in.prevout for tx_in in tx1.vin)] == [
+        (150000, p2pkh(1), ScriptType.P2PKH, 0),
+        (2500000, p2wpkh(2), ScriptType.P2WPKH, 0),
+    ]
+
+    tx2 = blocks[1].txs[1]
+    assert tx2.height == 2
+    assert [(p.value, p.scriptpubkey, p.script_type, p.height) for p in (tx_in.prevout for tx_in in tx2.vin)] == [
+        (1000000, p2sh(4), ScriptType.P2SH, 1),
+    ]
+
+def test_scan_blocks_dir_wallet_distribution(tmp_path, chain):
+    write_blocks_dir(tmp_path, chain["blk"], chain["rev"])
+    output = io.StringIO()
+    assert offline_scan.scan_blocks_dir(str(tmp_path), output, network="regtest") == 2
+
+    lines = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [(line["hash"], line["height"], line["transactions"]) for line in lines] == [
+        (chain["hashes"][0], 1, 1),
+        (chain["hashes"][1], 2, 1),
+    ]
+
+    expected = {wallet.value: 0 for wallet in Wallets}
+    # multi-type vin without anti-fee-sniping fits no wallet profile
+    assert lines[0]["wallets"] == dict(expected, **{Wallets.OTHER.value: 1})
+    # anti-fee-sniping with change matching the input type
+    assert lines[1]["wallets"] == dict(expected, **{Wallets.ELECTRUM.value: 1})
+
+def test_blocks_of_unknown_height_are_skipped(tmp_path, chain):
+    # without genesis nothing anchors the chain and there's no BIP34 height
+    write_blocks_dir(tmp_path, chain["blk"][1:], chain["rev"])
+    output = io.StringIO()
+    assert offline_scan.scan_blocks_dir(str(tmp_path), output, network="regtest") == 0
+    assert output.getvalue() == ""
+
+def test_pre_bip34_coinbase_data_is_not_a_height(tmp_path):
+    # like block 100000: a version 1 coinbase pushing the difficulty bits
+    cb, _ = serialize_tx([("00" * 32, 0xffffffff, bytes.fromhex("044c86041b020602"), 0xffffffff)], [(5000000000, p2wpkh(1))])
+    block, _ = serialize_block(b"\x11" * 32, [cb], 0, version=1)
+    undo = serialize_undo([])
+    write_blocks_dir(tmp_path, [block], [undo + sha256d(b"\x11" * 32 + undo)])
+
+    blocks = list(offline_scan.scan_file_pair(tmp_path, 0, MAGIC, offline_scan.read_xor_key(tmp_path)))
+    assert [block.height for block in blocks] == [None]
+    assert offline_scan.scan_blocks_dir(str(tmp_path), io.StringIO(), network="regtest") == 0
+
+def test_obfuscated_file_is_mapped_without_touching_it(tmp_path):
+    # a length that isn't a multiple of the key
+    data = bytes(range(256)) * 3 + b"tail"
+    path = tmp_path / "blk00000.dat"
+    path.write_bytes(xor(data, XOR_KEY))
+    with offline_scan._MappedFile(str(path), XOR_KEY) as mapped:
+        assert bytes(mapped.view) == data
+    assert path.read_bytes() == xor(data, XOR_KEY)
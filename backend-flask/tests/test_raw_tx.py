@@ -0,0 +1,19 @@
+import pytest
+
+from raw_tx import parse_block
+from serialize import p2wpkh, serialize_block, serialize_tx
+
+def _block(version, scriptsig):
+    coinbase, _ = serialize_tx([("00" * 32, 0xffffffff, scriptsig, 0xffffffff)], [(5000000000, p2wpkh(1))])
+    return serialize_block(bytes(32), [coinbase], 0, version)[0]
+
+@pytest.mark.parametrize("version, scriptsig, height", [
+    # BIP34 block
+    (0x20000000, b"\x03" + (800000).to_bytes(3, "little"), 800000),
+    # block 100000: a version 1 coinbase starting with the difficulty bits
+    (1, bytes.fromhex("044c86041b020602"), None),
+    # version 2 but below the BIP34 height
+    (2, b"\x03" + (200000).to_bytes(3, "little"), None),
+])
+def test_coinbase_height_is_only_trusted_under_bip34(version, scriptsig, height):
+    assert parse_block(_block(version, scriptsig)).height == height
@@ -0,0 +1,22 @@
+import fetch_txs
+from api import services
+from upstream import AsyncHeights, spending_tx
+
+class NoSyncHeights:
+    def getconfirmationheights(self, txids):
+        raise AssertionError("prevout heights resolved with blocking calls")
+
+def test_downloaded_address_txs_resolve_heights_concurrently(monkeypatch):
+    backend = AsyncHeights()
+    monkeypatch.setattr(services, "ASYNC_UPSTREAM", True)
+    monkeypatch.setattr(services, "fingerprint_store", None)
+    monkeypatch.setattr(fetch_txs, "async_adapter", lambda core: backend)
+    monkeypatch.setattr(fetch_txs.heights, "backend", NoSyncHeights())
+
+    txs = [spending_tx("aa" * 32, ["01" * 32, "02" * 32]), spending_tx("bb" * 32, ["02" * 32, "03" * 32])]
+    results = services.WalletAnalysisService.fingerprint_downloaded_txs(txs, "bc1qtest")
+
+    assert set(results) == {"aa" * 32, "bb" * 32}
+    # every missing prevout height in one lookup
+    assert backend.lookups == [["01" * 32, "02" * 32, "03" * 32]]
+    assert all(tx_in.prevout.height is not None for tx in txs for tx_in in tx.vin)
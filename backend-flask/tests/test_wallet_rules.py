@@ -0,0 +1,120 @@
+import json
+import os
+import random
+
+from fingerprinting import (
+    InputSortingType, OutputStructureType, TxFeatures, Wallets, detect_wallet, detect_wallets_batch
+)
+from tx_model import ScriptType, Tx, TxIn, TxOut
+
+# Verdicts and reasoning of the per-rule detect_wallet the rule tables
+# replaced, recorded over sweep(). Update them only for intended rule changes.
+EXPECTED = os.path.join(os.path.dirname(__file__), "data", "wallet_rules.json")
+
+TYPES = (ScriptType.P2PKH, ScriptType.P2SH, ScriptType.P2WPKH, ScriptType.P2WSH, ScriptType.P2TR, ScriptType.OP_RETURN)
+# non-standard versions included, they eliminate every wallet
+VERSIONS = (1, 2, 1, 2, 0, 3, -1, 0x7fffffff)
+
+def _subset(rng, values):
+    return tuple(value for value in values if rng.random() < 0.4)
+
+def _random_fields(rng):
+    # empty vin and vout included
+    input_types = tuple(rng.choice(TYPES[:5]) for _ in range(rng.choice((0, 1, 1, 2, 3))))
+    output_types = tuple(rng.choice(TYPES) for _ in range(rng.choice((0, 1, 2, 2, 3, 4))))
+    return {
+        "version": rng.choice(VERSIONS),
+        "locktime": rng.choice((0, 800000)),
+        "input_types": input_types,
+        "output_types": output_types,
+        # mostly compressed keys, uncompressed ones eliminate every wallet
+        "compressed_public_keys_only": rng.random() < 0.9,
+        "low_r_only": rng.random() < 0.7,
+        "signals_rbf": rng.random() < 0.5,
+        "address_reuse": rng.random() < 0.3,
+        "change_index": rng.randrange(-1, len(output_types)) if output_types else -1,
+        "change_type_matched_inputs": rng.choice((-1, 0, 1)),
+        "input_order": _subset(rng, tuple(InputSortingType)[1:]),
+        "output_structure": _subset(rng, tuple(OutputStructureType)),
+        "anti_fee_sniping": rng.choice((-1, -1, 0, 1)),
+    }
+
+_SINGLE_IN = {"input_types": (ScriptType.P2WPKH,), "input_order": (InputSortingType.SINGLE,)}
+_TWO_OUT = {"output_types": (ScriptType.P2WPKH, ScriptType.P2WPKH), "change_index": 1}
+_BASE = dict(
+    _SINGLE_IN, **_TWO_OUT, version=2, locktime=0, compressed_public_keys_only=True, low_r_only=True,
+    signals_rbf=True, address_reuse=False, change_type_matched_inputs=0,
+    output_structure=(OutputStructureType.DOUBLE,), anti_fee_sniping=-1,
+)
+# one tx profile each wallet is the only verdict for
+PROFILES = (
+    dict(_BASE, anti_fee_sniping=1, locktime=800000, change_type_matched_inputs=-1),
+    dict(_BASE, anti_fee_sniping=1, locktime=800000, change_type_matched_inputs=1,
+         output_structure=(OutputStructureType.DOUBLE, OutputStructureType.BIP69)),
+    _BASE,
+    dict(_BASE, signals_rbf=False),
+    dict(_BASE, signals_rbf=False, address_reuse=True),
+    dict(_BASE, version=1, address_reuse=True),
+    dict(_BASE, version=1, input_types=(ScriptType.P2WPKH, ScriptType.P2WPKH), input_order=(InputSortingType.BIP69,),
+         output_structure=(OutputStructureType.DOUBLE, OutputStructureType.BIP69)),
+    dict(_BASE, version=1),
+)
+
+def _features(i, fields):
+    input_types, output_types = fields["input_types"], fields["output_types"]
+    if len(input_types) == 1:
+        fields["input_order"] = (InputSortingType.SINGLE,)
+    elif InputSortingType.SINGLE in fields["input_order"]:
+        fields["input_order"] = ()
+    if fields["change_index"] >= len(output_types):
+        fields["change_index"] = len(output_types) - 1
+    return TxFeatures(txid=f"{i:064x}", multi_type_vin=len(set(input_types)) != 1, **fields)
+
+# Random features, then the wallet profiles with up to three fields changed
+# so every rule is seen deciding between wallets, not only eliminating
+def sweep(count=1000, seed=69):
+    rng = random.Random(seed)
+    for i in range(count):
+        yield _features(i, _random_fields(rng))
+    for i in range(count):
+        fields = dict(PROFILES[i % len(PROFILES)])
+        mutation = _random_fields(rng)
+        for field in rng.sample(sorted(mutation), rng.randrange(4)):
+            fields[field] = mutation[field]
+            if field in ("input_types", "output_types"):
+                # keep the order and change fields consistent with the types
+                fields.update({key: mutation[key] for key in ("input_order", "change_index")})
+        yield _features(count + i, fields)
+
+def test_rule_tables_match_the_per_rule_detect_wallet():
+    with open(EXPECTED) as f:
+        expected = json.load(f)
+    features = list(sweep())
+    assert len(features) == len(expected["verdicts"])
+    for tx_features, (wallets, reasons) in zip(features, expected["verdicts"]):
+        assert detect_wallet(tx_features) == (
+            {Wallets(expected["wallets"][i]) for i in wallets},
+            [expected["reasons"][i] for i in reasons],
+        ), tx_features
+
+def test_batch_matches_detect_wallet_on_the_sweep():
+    features = list(sweep())
+    assert detect_wallets_batch(features) == [detect_wallet(tx_features) for tx_features in features]
+
+def _txout(value, script_type=ScriptType.P2WPKH):
+    return TxOut(value, script_type, b"\x00\x14" + bytes([value % 256]) * 20, 800000)
+
+def test_batch_matches_detect_wallet_on_txs():
+    parent = "ab" * 32
+    txs = [
+        Tx("01" * 32, 2, 800000, [TxIn(parent, 0, 0xfffffffd, _txout(50000))], [_txout(30000), _txout(19000)], 800001),
+        Tx("02" * 32, 1, 0, [TxIn(parent, 1, 0xffffffff, _txout(50000, ScriptType.P2PKH))], [_txout(49000)], 800001),
+        # non-standard versions
+        Tx("03" * 32, 3, 0, [TxIn(parent, 2, 0xfffffffd, _txout(50000))], [_txout(49000)], 800001),
+        Tx("04" * 32, 0, 0, [TxIn(parent, 3, 0xfffffffd, _txout(50000))], [_txout(49000)], 800001),
+        # empty vin, empty vout
+        Tx("05" * 32, 2, 0, [], [_txout(49000)], 800001),
+        Tx("06" * 32, 2, 0, [TxIn(parent, 4, 0xfffffffd, _txout(50000))], [], 800001),
+        Tx("07" * 32, 2, 0, [], [], 800001),
+    ]
+    assert detect_wallets_batch(txs) == [detect_wallet(tx) for tx in txs]
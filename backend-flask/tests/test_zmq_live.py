@@ -0,0 +1,80 @@
+import socket
+import threading
+
+import pytest
+
+from fingerprint_store import fingerprint
+from fingerprinting import extract_features
+from raw_tx import parse_tx
+from replay_backend import ReplayBackend, empty_corpus, encode_tx
+from serialize import p2pkh, p2tr, p2wpkh, serialize_tx
+from tx_model import ScriptType, Tx, TxOut
+
+zmq = pytest.importorskip("zmq")
+
+SCRIPTS = (p2wpkh, p2tr, p2pkh)
+
+def _free_endpoint():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return f"tcp://127.0.0.1:{s.getsockname()[1]}"
+
+@pytest.fixture
+def recording():
+    # confirmed parents in the corpus, pushed txs spending them and each other
+    corpus = empty_corpus()
+    raw_txs = []
+    pushed = []
+    for i in range(300):
+        vin = []
+        for j in range(1 + i % 3):
+            if pushed and j == 1:
+                # an earlier pushed tx, resolved from the recent window
+                parent_txid, parent_vout = pushed[-1], 0
+            else:
+                parent = Tx(f"{i:04x}{j:02x}".ljust(64, "0"), 2, 0, [], [
+                    TxOut(20000 + i * 100 + j, ScriptType.P2WPKH, p2wpkh(j), 800000 - i),
+                    TxOut(50000 + i, ScriptType.P2TR, p2tr(j), 800000 - i),
+                ], 800000 - i)
+                corpus["txs"][parent.txid] = encode_tx(parent)
+                parent_txid, parent_vout = parent.txid, j % 2
+            vin.append((parent_txid, parent_vout, b"", 0xfffffffd if i % 2 else 0xffffffff))
+        vout = [(10000 + i * 7, SCRIPTS[(i + k) % 3](k + 1)) for k in range(1 + i % 2)]
+        raw, txid = serialize_tx(vin, vout, version=1 + i % 2, locktime=i % 5 and 800000)
+        raw_txs.append(raw)
+        pushed.append(txid)
+    return corpus, raw_txs
+
+def test_replayed_rawtx_pushes_are_classified_without_a_node(recording):
+    from zmq_live import LiveClassifier, ReplayPublisher
+
+    corpus, raw_txs = recording
+    backend = ReplayBackend(corpus)
+    classifier = LiveClassifier(backend, batch_size=50)
+    records = []
+    classifier.on_tx(records.append)
+
+    endpoint = _free_endpoint()
+    publisher = ReplayPublisher(endpoint, raw_txs)
+    published = []
+    thread = threading.Thread(target=lambda: published.append(publisher.run(loops=2)))
+    thread.start()
+    classifier.subscribe(endpoint, max_txs=2 * len(raw_txs), idle_timeout=5)
+    thread.join()
+
+    assert classifier.stats["errors"] == 0
+    assert classifier.stats["dropped"] == 0
+    # the second loop repeats every tx, like Core does when a block connects
+    assert classifier.stats["classified"] == len(raw_txs)
+    assert classifier.stats["repeated"] == len(raw_txs)
+    assert published[0] > 0 and classifier.rate() > 0
+
+    # same verdicts as classifying the recording directly
+    txs = [parse_tx(raw) for raw in raw_txs]
+    for tx in txs:
+        tx.height = -1
+        for txout in tx.vout:
+            txout.height = -1
+    backend.resolve_prevouts(txs, txs)
+    expected = [fingerprint(extract_features(tx), -1) for tx in txs]
+    assert records == expected
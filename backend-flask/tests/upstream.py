@@ -0,0 +1,27 @@
+from tx_model import ScriptType, Tx, TxIn, TxOut
+
+# Txs and upstream height stubs shared by the tests
+
+def spending_tx(txid, parents):
+    # spends output 0 of each parent, prevout heights left to resolve
+    vin = [TxIn(parent, 0, 0xfffffffd, TxOut(50000, ScriptType.P2WPKH, b"\x00\x14" + bytes(20))) for parent in parents]
+    return Tx(txid, 2, 0, vin, [TxOut(90000, ScriptType.P2WPKH, b"\x00\x14" + b"\x01" * 20)], 800000)
+
+class Heights:
+    def __init__(self):
+        # txids of every lookup, sorted
+        self.lookups = []
+
+    def getconfirmationheights(self, txids):
+        self.lookups.append(sorted(txids))
+        return {txid: 700000 for txid in txids}
+
+class AsyncHeights(Heights):
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    async def getconfirmationheights(self, txids):
+        return super().getconfirmationheights(txids)